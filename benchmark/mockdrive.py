@@ -0,0 +1,951 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, Generator, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import time
+import zlib
+
+
+_FolderMime = 'application/vnd.google-apps.folder'
+_BinaryMimes = [
+    ('application/pdf', '.pdf'), ('image/jpeg', '.jpg'), ('image/png', '.png'),
+    ('text/plain', '.txt'), ('application/zip', '.zip'), ('video/mp4', '.mp4'),
+]
+_DocumentMimes = {
+    'application/vnd.google-apps.document': [
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'application/pdf', 'text/plain', 'application/rtf',
+        'application/vnd.oasis.opendocument.text', 'text/html', 'application/epub+zip'],
+    'application/vnd.google-apps.spreadsheet': [
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'application/pdf',
+        'text/csv', 'text/tab-separated-values', 'application/x-vnd.oasis.opendocument.spreadsheet',
+        'application/zip'],
+    'application/vnd.google-apps.presentation': [
+        'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+        'application/pdf', 'text/plain', 'application/vnd.oasis.opendocument.presentation'],
+}
+_PatternSize = 1024 * 1024
+_HeaderSize = 32
+_ChunkSize = 64 * 1024
+
+
+def parseSize(v: str) -> int:
+    """Parse size with optional K, M or G suffix (base 1024), e.g. `64K`."""
+    v = v.strip().upper()
+    scale = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}.get(v[-1:], 1)
+    return int(float(v[:-1] if scale > 1 else v) * scale)
+
+
+class SizeDistribution:
+    """Random file size distribution parsed from spec string:
+      - `fixed:SIZE`: all files are of the same size.
+      - `uniform:MIN:MAX`: uniform in [MIN, MAX].
+      - `lognormal:MEDIAN:SIGMA`: log-normal with given median, e.g. `lognormal:256K:1.5`.
+      - `bimodal:SMALL:LARGE:RATIO`: `RATIO` of files are `LARGE`, others are `SMALL`.
+
+    Sizes accept K, M and G suffix.
+    """
+
+    def __init__(self, spec: str) -> None:
+        self.__spec = spec
+        kind, *params = spec.split(':')
+        if (kind == 'fixed') and (len(params) == 1):
+            size = parseSize(params[0])
+            self.__draw = lambda rng: size
+        elif (kind == 'uniform') and (len(params) == 2):
+            low, high = parseSize(params[0]), parseSize(params[1])
+            self.__draw = lambda rng: rng.randint(low, high)
+        elif (kind == 'lognormal') and (len(params) == 2):
+            mu, sigma = math.log(max(parseSize(params[0]), 1)), float(params[1])
+            self.__draw = lambda rng: int(rng.lognormvariate(mu, sigma))
+        elif (kind == 'bimodal') and (len(params) == 3):
+            small, large, ratio = parseSize(params[0]), parseSize(params[1]), float(params[2])
+            self.__draw = lambda rng: large if rng.random() < ratio else small
+        else:
+            raise ValueError(f'Unknown size distribution: {spec}')
+
+    @property
+    def spec(self) -> str:
+        """Get spec string of this distribution."""
+        return self.__spec
+
+    def draw(self, rng: random.Random) -> int:
+        """Draw a file size."""
+        return max(self.__draw(rng), 0)
+
+
+class Faults:
+    """Latency and errors injected into responses of one kind of requests.
+    Error rates are probabilities of each request, checked in order of 401, 429 and 5xx.
+    Truncated response sends full `Content-Length` header but only half of the body, then closes
+    the connection.
+    """
+
+    Keys = ['latency', 'jitter', 'error401', 'error429', 'error5xx', 'truncate', 'bandwidth']
+    """Keys of fault settings, see `fromDict`."""
+
+    def __init__(
+        self, latency: float = 0.0, jitter: float = 0.0, error401: float = 0.0,
+        error429: float = 0.0, error5xx: float = 0.0, truncate: float = 0.0, bandwidth: int = 0,
+    ) -> None:
+        """Create faults.
+         :param latency: seconds before response header is sent.
+         :param jitter: max random seconds added to latency.
+         :param error401: rate of unauthorized responses.
+         :param error429: rate of rate limited responses.
+         :param error5xx: rate of backend error responses.
+         :param truncate: rate of truncated bodies, only applied to file content.
+         :param bandwidth: max bytes per second of each response body, 0 for unlimited.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error401 = error401
+        self.error429 = error429
+        self.error5xx = error5xx
+        self.truncate = truncate
+        self.bandwidth = bandwidth
+
+    @staticmethod
+    def fromDict(d: Dict[str, Any] | None) -> 'Faults':
+        """Create faults from dict of `Keys`, missing keys are set to zero."""
+        return Faults(**{k: v for k, v in (d or {}).items() if k in Faults.Keys})
+
+    def toDict(self) -> Dict[str, Any]:
+        """Convert to dict, inverse of `fromDict`."""
+        return {k: getattr(self, k) for k in Faults.Keys}
+
+    def delay(self, rng: random.Random) -> float:
+        """Draw seconds to wait before responding."""
+        return self.latency + (rng.random() * self.jitter if self.jitter > 0 else 0.0)
+
+    def error(self, rng: random.Random) -> int:
+        """Draw injected error status code, 0 if no error."""
+        x = rng.random()
+        for status, rate in ((401, self.error401), (429, self.error429), (503, self.error5xx)):
+            if x < rate:
+                return status
+            x -= rate
+        return 0
+
+
+class MockDrive:
+    """In-memory Google Drive content: My Drive, shared drives, files, folders and changes.
+
+    The tree is generated randomly but deterministically by seed. Content of each binary file is a
+    unique 32-byte header followed by a shared random pattern, so content is generated on the fly
+    while MD5 is known in advance. Duplicated files share content of an earlier file.
+
+    `files.list` supports the query subset used by `GoogleDriveClient`: `and`, `or`, `not`,
+    parentheses, `=`, `!=`, `<`, `>`, `<=`, `>=` and `in` on `mimeType`, `name`, `modifiedTime`,
+    `trashed`, `parents` and `owners`. Results of a query are cached for paging.
+    """
+
+    def __init__(
+        self, files: int = 1000, folders: int = 100, sharedDrives: int = 0,
+        sizes: str = 'lognormal:256K:1.5', exportSizes: str = 'fixed:16K', docRatio: float = 0.1,
+        trashedRatio: float = 0.0, sharedRatio: float = 0.0, dupRatio: float = 0.0,
+        user: str = 'bench@example.com', seed: int = 0, baseUrl: str = '',
+    ) -> None:
+        """Generate drives.
+         :param files: # of non-folder files of all drives.
+         :param folders: # of folders of all drives, not including drive roots.
+         :param sharedDrives: # of shared drives, files are distributed evenly with My Drive.
+         :param sizes: size distribution of binary files, see `SizeDistribution`.
+         :param exportSizes: size distribution of exported documents.
+         :param docRatio: ratio of Google documents to files.
+         :param trashedRatio: ratio of trashed files.
+         :param sharedRatio: ratio of files in My Drive shared with user, i.e. not owned.
+         :param dupRatio: ratio of binary files duplicating content of another file.
+         :param user: account email address.
+         :param seed: random seed.
+         :param baseUrl: root URL of server, used by export links.
+        """
+        self.__lock = Lock()
+        self.__rng = random.Random(seed)
+        self.__user = user
+        self.__baseUrl = baseUrl.rstrip('/')
+        self.__pattern = self.__rng.randbytes(_PatternSize)
+        self.__sizes = SizeDistribution(sizes)
+        self.__exportSizes = SizeDistribution(exportSizes)
+        self.__drives = [('', 'root0000')] + [
+            (f'drive{k:04d}', f'drive{k:04d}') for k in range(1, sharedDrives + 1)]
+        self.__driveNames = {f'drive{k:04d}': f'Shared{k}' for k in range(1, sharedDrives + 1)}
+        # Map from file id to resource, and from id to (content key, version, size)
+        self.__files: Dict[str, Dict[str, Any]] = {}
+        self.__content: Dict[str, Tuple[str, int, int]] = {}
+        self.__exportSize: Dict[str, int] = {}
+        self.__children: Dict[str, List[str]] = {}
+        self.__order: List[str] = []
+        self.__md5: Dict[Tuple[str, int, int], str] = {}
+        self.__queries: OrderedDict[str, List[str]] = OrderedDict()
+        self.__changes: List[Tuple[str, str]] = []
+        self.__now = datetime.now(timezone.utc)
+        self.__generate(files, folders, docRatio, trashedRatio, sharedRatio, dupRatio)
+
+    @property
+    def user(self) -> str:
+        """Get account email address."""
+        return self.__user
+
+    @property
+    def fileCount(self) -> int:
+        """Get # of files and folders of all drives, not including drive roots."""
+        return len(self.__order)
+
+    @property
+    def totalSize(self) -> int:
+        """Get total size of binary files of all drives."""
+        return sum(size for _, _, size in self.__content.values())
+
+    def about(self) -> Dict[str, Any]:
+        """Get response of `about.get`."""
+        used = self.totalSize
+        return {
+            'user': {'emailAddress': self.__user, 'displayName': 'Benchmark'},
+            'storageQuota': {
+                'limit': str(1024 ** 5), 'usage': str(used), 'usageInDrive': str(used),
+                'usageInDriveTrash': '0'},
+            'exportFormats': _DocumentMimes,
+        }
+
+    def drives(self, pageSize: int, pageToken: str) -> Dict[str, Any]:
+        """Get response of `drives.list`."""
+        drives = [{'kind': 'drive#drive', 'id': d, 'name': n} for d, n in self.__driveNames.items()]
+        start = int(pageToken) if pageToken else 0
+        result: Dict[str, Any] = {'drives': drives[start:start + pageSize]}
+        if start + pageSize < len(drives):
+            result['nextPageToken'] = str(start + pageSize)
+        return result
+
+    def get(self, fileId: str) -> Dict[str, Any] | None:
+        """Get resource of given file, `root` for root folder of My Drive."""
+        if fileId == 'root':
+            fileId = self.__drives[0][1]
+        with self.__lock:
+            return self.__files.get(fileId)
+
+    def list(
+        self, q: str, driveId: str, pageSize: int, pageToken: str
+    ) -> Dict[str, Any]:
+        """Get response of `files.list` in corpus of given drive, empty for My Drive."""
+        if pageToken:
+            key, offset = pageToken.rsplit(':', 1)
+            start = int(offset)
+        else:
+            key, start = f'{driveId}\n{q}', 0
+        with self.__lock:
+            ids = self.__queries.get(key)
+            if ids is None:
+                ids = self.__query(q, driveId)
+                self.__queries[key] = ids
+                if len(self.__queries) > 1024:
+                    self.__queries.popitem(last=False)
+            else:
+                self.__queries.move_to_end(key)
+            files = [self.__files[i] for i in ids[start:start + pageSize]]
+        result: Dict[str, Any] = {'kind': 'drive#fileList', 'files': files}
+        if start + pageSize < len(ids):
+            result['nextPageToken'] = f'{key}:{start + pageSize}'
+        return result
+
+    def startPageToken(self) -> str:
+        """Get page token for changes made from now on."""
+        with self.__lock:
+            return str(len(self.__changes) + 1)
+
+    def changes(self, driveId: str, pageSize: int, pageToken: str) -> Dict[str, Any]:
+        """Get response of `changes.list` of given drive, empty for My Drive."""
+        with self.__lock:
+            start = int(pageToken) - 1
+            selected = []
+            seq = start
+            while (seq < len(self.__changes)) and (len(selected) < pageSize):
+                fileId, changeTime = self.__changes[seq]
+                seq += 1
+                file = self.__files[fileId]
+                if file.get('driveId', '') == driveId:
+                    selected.append({
+                        'kind': 'drive#change', 'changeType': 'file', 'time': changeTime,
+                        'fileId': fileId, 'removed': False, 'file': file})
+            result: Dict[str, Any] = {'kind': 'drive#changeList', 'changes': selected}
+            if seq < len(self.__changes):
+                result['nextPageToken'] = str(seq + 1)
+            else:
+                result['newStartPageToken'] = str(len(self.__changes) + 1)
+        return result
+
+    def touch(self, count: int) -> int:
+        """Modify content of random binary files and record changes.
+         :returns: # of modified files.
+        """
+        with self.__lock:
+            candidates = [i for i, (_, _, size) in self.__content.items() if size > 0]
+            selected = self.__rng.sample(candidates, min(count, len(candidates)))
+            now = _formatTime(datetime.now(timezone.utc))
+            for fileId in selected:
+                _, version, size = self.__content[fileId]
+                self.__content[fileId] = (fileId, version + 1, size)
+                file = dict(self.__files[fileId])
+                file['md5Checksum'] = self.__contentMd5(fileId, version + 1, size)
+                file['modifiedTime'] = now
+                file['version'] = str(version + 1)
+                self.__files[fileId] = file
+                self.__changes.append((fileId, now))
+            self.__queries.clear()
+        return len(selected)
+
+    def content(
+        self, fileId: str, start: int = 0, end: int = -1
+    ) -> Tuple[int, Generator[memoryview, None, None]] | None:
+        """Get size and chunks of content in byte range [start, end) of given binary file.
+         :param end: end of range, -1 for end of file.
+        """
+        with self.__lock:
+            if fileId not in self.__content:
+                return None
+            key, version, size = self.__content[fileId]
+        end = size if (end < 0) or (end > size) else end
+        return size, self.__chunks(_header(key, version), start, end)
+
+    def export(
+        self, fileId: str, exportMime: str
+    ) -> Tuple[int, Generator[memoryview, None, None]] | None:
+        """Get size and chunks of given document exported as given MIME type."""
+        with self.__lock:
+            file = self.__files.get(fileId)
+            if (file is None) or (exportMime not in file.get('exportLinks', {})):
+                return None
+            size = self.__exportSize[fileId]
+        return size, self.__chunks(_header(f'{fileId}/{exportMime}', 0), 0, size)
+
+    def __chunks(self, header: bytes, start: int, end: int) -> Generator[memoryview, None, None]:
+        """Generate content of header followed by pattern rotated by header checksum."""
+        pattern = memoryview(self.__pattern)
+        salt = zlib.crc32(header) % _PatternSize
+        pos = start
+        while pos < end:
+            if pos < _HeaderSize:
+                chunk = memoryview(header)[pos:min(end, _HeaderSize)]
+            else:
+                p = (pos - _HeaderSize + salt) % _PatternSize
+                chunk = pattern[p:p + min(end - pos, _ChunkSize, _PatternSize - p)]
+            yield chunk
+            pos += len(chunk)
+
+    def __contentMd5(self, key: str, version: int, size: int) -> str:
+        """Compute MD5 of content, cached by content key."""
+        cacheKey = (key, version, size)
+        if cacheKey not in self.__md5:
+            h = hashlib.md5()
+            for chunk in self.__chunks(_header(key, version), 0, size):
+                h.update(chunk)
+            self.__md5[cacheKey] = h.hexdigest()
+        return self.__md5[cacheKey]
+
+    def __generate(
+        self, files: int, folders: int, docRatio: float, trashedRatio: float,
+        sharedRatio: float, dupRatio: float,
+    ):
+        """Generate drive roots, folders and files."""
+        rng = self.__rng
+        folderIds: Dict[str, List[str]] = {}
+        for driveId, rootId in self.__drives:
+            folderIds[driveId] = [rootId]
+            self.__files[rootId] = self.__resource(
+                rootId, '', _FolderMime, driveId, [], self.__now - timedelta(days=1000))
+        binaries: List[str] = []
+        total = folders + files
+        for n in range(total):
+            driveId = self.__drives[n % len(self.__drives)][0]
+            isFolder = rng.random() < folders / (folders + files)
+            if isFolder:
+                folders -= 1
+            else:
+                files -= 1
+            fileId = f'f{n:08d}'
+            parent = rng.choice(folderIds[driveId])
+            mtime = self.__now - timedelta(seconds=rng.randint(0, 3 * 365 * 86400))
+            if isFolder:
+                name = f'folder{n}'
+                self.__files[fileId] = self.__resource(fileId, name, _FolderMime, driveId,
+                    [parent], mtime)
+                folderIds[driveId].append(fileId)
+            elif rng.random() < docRatio:
+                mime = rng.choice(list(_DocumentMimes.keys()))
+                file = self.__resource(fileId, f'doc{n}', mime, driveId, [parent], mtime)
+                file['exportLinks'] = {
+                    m: f'{self.__baseUrl}/drive/v3/files/{fileId}/export?mimeType={m}'
+                    for m in _DocumentMimes[mime]}
+                self.__exportSize[fileId] = self.__exportSizes.draw(rng)
+                self.__files[fileId] = file
+            else:
+                mime, ext = rng.choice(_BinaryMimes)
+                if binaries and (rng.random() < dupRatio):
+                    key, _, size = self.__content[rng.choice(binaries)]
+                else:
+                    key, size = fileId, self.__sizes.draw(rng)
+                file = self.__resource(fileId, f'file{n}{ext}', mime, driveId, [parent], mtime)
+                file['size'] = str(size)
+                file['md5Checksum'] = self.__contentMd5(key, 0, size)
+                file['version'] = '0'
+                self.__content[fileId] = (key, 0, size)
+                self.__files[fileId] = file
+                binaries.append(fileId)
+            file = self.__files[fileId]
+            if rng.random() < trashedRatio:
+                file['trashed'] = True
+            if (not driveId) and (not isFolder) and (rng.random() < sharedRatio):
+                file['ownedByMe'] = False
+            self.__children.setdefault(parent, []).append(fileId)
+            self.__order.append(fileId)
+        # Listing order is not tree order, files may be listed before their parents
+        rng.shuffle(self.__order)
+
+    def __resource(
+        self, fileId: str, name: str, mime: str, driveId: str, parents: List[str],
+        mtime: datetime,
+    ) -> Dict[str, Any]:
+        """Create file resource without content fields."""
+        file = {
+            'kind': 'drive#file', 'id': fileId, 'name': name, 'mimeType': mime,
+            'parents': parents, 'trashed': False,
+            'createdTime': _formatTime(mtime - timedelta(days=1)),
+            'modifiedTime': _formatTime(mtime),
+            'viewedByMeTime': _formatTime(mtime + timedelta(hours=1)),
+        }
+        if driveId:
+            # Shared drive files do not have `ownedByMe`
+            file['driveId'] = driveId
+        else:
+            file['ownedByMe'] = True
+        return file
+
+    def __query(self, q: str, driveId: str) -> List[str]:
+        """Get Id of files of given drive matching query in listing order."""
+        predicate = _compileQuery(q) if q else None
+        candidates = _candidates(predicate, self.__children) if predicate else None
+        if candidates is None:
+            candidates = self.__order
+        result = []
+        for fileId in candidates:
+            file = self.__files[fileId]
+            if file.get('driveId', '') != driveId:
+                continue
+            if (predicate is None) or _evaluate(predicate, file):
+                result.append(fileId)
+        return result
+
+
+def _header(key: str, version: int) -> bytes:
+    """Get content header of given content key."""
+    return f'{key}:{version}'.encode('utf-8').ljust(_HeaderSize, b'\0')[:_HeaderSize]
+
+
+def _formatTime(t: datetime) -> str:
+    """Format time as Drive API does, e.g. `2022-01-02T03:04:05.678Z`."""
+    return t.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.') + \
+        f'{t.microsecond // 1000:03d}Z'
+
+
+def _parseTime(v: str) -> datetime:
+    """Parse RFC 3339 time of query or resource, naive time is treated as UTC."""
+    t = datetime.fromisoformat(v[:-1] + '+00:00' if v.endswith('Z') else v)
+    return t.replace(tzinfo=timezone.utc) if t.tzinfo is None else t
+
+
+_Token = re.compile(
+    r"\s*(?:(?P<str>'(?:[^'\\]|\\.)*')|(?P<op><=|>=|!=|=|<|>|\(|\))|(?P<word>[\w.]+))")
+
+
+def _compileQuery(q: str) -> Tuple:
+    """Parse Drive query into nested tuples, e.g. `('and', a, b)` or `('=', field, value)`."""
+    tokens: List[Tuple[str, str]] = []
+    pos = 0
+    while pos < len(q.rstrip()):
+        m = _Token.match(q, pos)
+        if m is None:
+            raise ValueError(f'Invalid query at {pos}: {q}')
+        pos = m.end()
+        if m.group('str') is not None:
+            tokens.append(('str', re.sub(r'\\(.)', r'\1', m.group('str')[1:-1])))
+        elif m.group('op') is not None:
+            tokens.append(('op', m.group('op')))
+        else:
+            tokens.append(('word', m.group('word')))
+    tokens.append(('end', ''))
+    index = 0
+
+    def __peek(*values: str) -> bool:
+        return tokens[index][1] in values and tokens[index][0] in ('op', 'word')
+
+    def __take() -> Tuple[str, str]:
+        nonlocal index
+        index += 1
+        return tokens[index - 1]
+
+    def __expr() -> Tuple:
+        node = __term()
+        while __peek('or'):
+            __take()
+            node = ('or', node, __term())
+        return node
+
+    def __term() -> Tuple:
+        node = __factor()
+        while __peek('and'):
+            __take()
+            node = ('and', node, __factor())
+        return node
+
+    def __factor() -> Tuple:
+        if __peek('not'):
+            __take()
+            return ('not', __factor())
+        if __peek('('):
+            __take()
+            node = __expr()
+            if __take()[1] != ')':
+                raise ValueError(f'Missing ) in query: {q}')
+            return node
+        kind, left = __take()
+        op = __take()[1]
+        right = __take()
+        if op == 'in':
+            return ('in', left, right[1])
+        if op not in ('=', '!=', '<', '>', '<=', '>='):
+            raise ValueError(f'Unsupported operator {op} in query: {q}')
+        if kind == 'str':
+            # e.g. 'me' in owners is handled above, value is never on the left otherwise
+            raise ValueError(f'Unsupported comparison in query: {q}')
+        value = right[1] if right[0] == 'str' else (right[1] == 'true')
+        return (op, left, value)
+
+    node = __expr()
+    if tokens[index][0] != 'end':
+        raise ValueError(f'Unexpected {tokens[index][1]} in query: {q}')
+    return node
+
+
+_Compare: Dict[str, Callable[[Any, Any], bool]] = {
+    '=': lambda a, b: a == b, '!=': lambda a, b: a != b, '<': lambda a, b: a < b,
+    '>': lambda a, b: a > b, '<=': lambda a, b: a <= b, '>=': lambda a, b: a >= b,
+}
+
+
+def _evaluate(node: Tuple, file: Dict[str, Any]) -> bool:
+    """Evaluate compiled query on file resource."""
+    op = node[0]
+    if op == 'and':
+        return _evaluate(node[1], file) and _evaluate(node[2], file)
+    if op == 'or':
+        return _evaluate(node[1], file) or _evaluate(node[2], file)
+    if op == 'not':
+        return not _evaluate(node[1], file)
+    if op == 'in':
+        if node[2] == 'owners':
+            return (node[1] == 'me') and file.get('ownedByMe', False)
+        return node[1] in file.get(node[2], [])
+    field, value = node[1], node[2]
+    actual = file.get(field, False if field == 'trashed' else '')
+    if field.endswith('Time'):
+        actual, value = _parseTime(actual), _parseTime(value)
+    return _Compare[op](actual, value)
+
+
+def _candidates(node: Tuple, children: Dict[str, List[str]]) -> List[str] | None:
+    """Get files may match query by `in parents` conditions, None if all files may match."""
+    if node[0] == 'in' and node[2] == 'parents':
+        return children.get(node[1], [])
+    if node[0] == 'or':
+        left, right = _candidates(node[1], children), _candidates(node[2], children)
+        return None if (left is None) or (right is None) else left + right
+    if node[0] == 'and':
+        left, right = _candidates(node[1], children), _candidates(node[2], children)
+        if left is None:
+            return right
+        return left if (right is None) or (len(left) <= len(right)) else right
+    return None
+
+
+def _parseFields(fields: str) -> Dict[str, Any]:
+    """Parse partial response fields mask, e.g. `nextPageToken, files(id, name)`."""
+    mask: Dict[str, Any] = {}
+    stack = [mask]
+    name = ''
+    for ch in fields:
+        if ch == '(':
+            stack.append(stack[-1].setdefault(name.strip(), {}))
+            name = ''
+        elif ch in '),':
+            if name.strip():
+                stack[-1][name.strip()] = {}
+            if ch == ')':
+                stack.pop()
+            name = ''
+        else:
+            name += ch
+    if name.strip():
+        stack[-1][name.strip()] = {}
+    return mask
+
+
+def _project(value: Any, mask: Dict[str, Any]) -> Any:
+    """Keep only fields in mask, empty mask keeps all fields."""
+    if (not mask) or ('*' in mask):
+        return value
+    if isinstance(value, list):
+        return [_project(v, mask) for v in value]
+    if isinstance(value, dict):
+        return {k: _project(value[k], m) for k, m in mask.items() if k in value}
+    return value
+
+
+class MockDriveServer(ThreadingHTTPServer):
+    """HTTP stand-in of Google Drive API v3 serving a `MockDrive`.
+
+    Supported endpoints, relative to `url`:
+      - `GET /drive/v3/about`, `GET /drive/v3/drives`
+      - `GET /drive/v3/files`, `GET /drive/v3/files/<id>`, `GET /drive/v3/files/<id>?alt=media`
+        with `Range`, `GET /drive/v3/files/<id>/export?mimeType=<mime>` (export links)
+      - `GET /drive/v3/changes/startPageToken`, `GET /drive/v3/changes`
+      - `POST /token`: OAuth token refresh, always issues the same token.
+
+    Control endpoints for benchmarks:
+      - `GET /mock/stats`: request, byte and fault counters of each kind of requests.
+      - `POST /mock/reset`: reset counters.
+      - `POST /mock/faults`: replace faults by JSON body `{"api": {...}, "media": {...}}`.
+      - `POST /mock/touch?count=N`: modify N files and record changes.
+
+    Faults of `api` are applied to metadata requests, faults of `media` to content and export
+    requests. Connections are kept alive by HTTP/1.1.
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(
+        self, drive: MockDrive | None, host: str = '127.0.0.1', port: int = 0,
+        apiFaults: Faults | None = None, mediaFaults: Faults | None = None,
+        token: str = 'mock-token', seed: int = 0,
+    ) -> None:
+        """Create server, listening socket is bound immediately.
+         :param drive: drive to serve, can be set later by `drive` once `url` is known.
+         :param port: listening port, 0 for any free port.
+         :param token: the only valid OAuth access token.
+        """
+        super().__init__((host, port), _Handler)
+        self.drive = drive
+        self.faults = {'api': apiFaults or Faults(), 'media': mediaFaults or Faults()}
+        self.token = token
+        self.rng = random.Random(seed)
+        self.__lock = Lock()
+        self.__stats: Dict[str, Dict[str, int]] = {}
+        self.__thread: Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """Get root URL of this server."""
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'MockDriveServer':
+        """Serve in background thread."""
+        self.__thread = Thread(target=self.serve_forever, name='MockDrive', daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close socket."""
+        self.shutdown()
+        self.server_close()
+        if self.__thread:
+            self.__thread.join()
+
+    def count(self, kind: str, key: str, value: int = 1):
+        """Add value to counter of given kind of requests."""
+        with self.__lock:
+            stats = self.__stats.setdefault(kind, {})
+            stats[key] = stats.get(key, 0) + value
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Get counters of each kind of requests."""
+        with self.__lock:
+            return {kind: dict(stats) for kind, stats in self.__stats.items()}
+
+    def reset(self):
+        """Reset all counters."""
+        with self.__lock:
+            self.__stats = {}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler of `MockDriveServer`."""
+
+    protocol_version = 'HTTP/1.1'
+    server: MockDriveServer
+
+    def log_message(self, format: str, *args: Any):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Route GET requests."""
+        url = urlsplit(self.path)
+        param = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        path = url.path.rstrip('/')
+        if path == '/mock/stats':
+            self.__sendJson('mock', self.server.stats())
+            return
+        if path.startswith('/drive/v3/files/') and \
+            ((param.get('alt') == 'media') or path.endswith('/export')):
+            self.__sendContent(path, param)
+            return
+        if not self.__prepare('api'):
+            return
+        drive = self.server.drive
+        if path == '/drive/v3/about':
+            result = drive.about()
+        elif path == '/drive/v3/drives':
+            result = drive.drives(int(param.get('pageSize', 10)), param.get('pageToken', ''))
+        elif path == '/drive/v3/files':
+            try:
+                result = drive.list(
+                    param.get('q', ''), param.get('driveId', ''),
+                    min(int(param.get('pageSize', 100)), 1000), param.get('pageToken', ''))
+            except ValueError as e:
+                self.__sendError('api', 400, 'invalid', str(e))
+                return
+        elif path.startswith('/drive/v3/files/'):
+            result = drive.get(path[len('/drive/v3/files/'):])
+        elif path == '/drive/v3/changes/startPageToken':
+            result = {'kind': 'drive#startPageToken', 'startPageToken': drive.startPageToken()}
+        elif path == '/drive/v3/changes':
+            result = drive.changes(
+                param.get('driveId', ''), int(param.get('pageSize', 100)),
+                param.get('pageToken', '1'))
+        else:
+            result = None
+        if result is None:
+            self.__sendError('api', 404, 'notFound', f'Not found: {path}')
+            return
+        self.__sendJson('api', _project(result, _parseFields(param.get('fields', ''))))
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Route POST requests."""
+        url = urlsplit(self.path)
+        param = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get('content-length', 0)))
+        if url.path == '/token':
+            self.__sendJson('token', {
+                'access_token': self.server.token, 'expires_in': 3600, 'token_type': 'Bearer'})
+        elif url.path == '/mock/reset':
+            self.server.reset()
+            self.__sendJson('mock', {})
+        elif url.path == '/mock/faults':
+            spec = json.loads(body or b'{}')
+            for kind in ('api', 'media'):
+                self.server.faults[kind] = Faults.fromDict(spec.get(kind))
+            self.__sendJson('mock', {k: f.toDict() for k, f in self.server.faults.items()})
+        elif url.path == '/mock/touch':
+            changed = self.server.drive.touch(int(param.get('count', 1)))
+            self.__sendJson('mock', {'changed': changed})
+        else:
+            self.__sendError('mock', 404, 'notFound', f'Not found: {url.path}')
+
+    def __prepare(self, kind: str) -> bool:
+        """Check auth and inject latency and errors, error is responded if returns False."""
+        server = self.server
+        server.count(kind, 'requests')
+        faults = server.faults[kind]
+        delay = faults.delay(server.rng)
+        if delay > 0:
+            time.sleep(delay)
+        if self.headers.get('authorization', '') != f'Bearer {server.token}':
+            self.__sendError(kind, 401, 'authError', 'Invalid Credentials')
+            return False
+        status = faults.error(server.rng)
+        if status == 401:
+            self.__sendError(kind, 401, 'authError', 'Invalid Credentials')
+        elif status == 429:
+            self.__sendError(kind, 429, 'rateLimitExceeded', 'Rate Limit Exceeded')
+        elif status:
+            self.__sendError(kind, status, 'backendError', 'Backend Error')
+        return status == 0
+
+    def __sendContent(self, path: str, param: Dict[str, str]):
+        """Send file content or exported document."""
+        if not self.__prepare('media'):
+            return
+        drive = self.server.drive
+        if path.endswith('/export'):
+            content = drive.export(path[len('/drive/v3/files/'):-len('/export')],
+                param.get('mimeType', ''))
+            start, end = 0, -1
+        else:
+            fileId = path[len('/drive/v3/files/'):]
+            start, end = _parseRange(self.headers.get('range', ''))
+            content = drive.content(fileId, start, end)
+            if (content is not None) and (start > 0) and (start >= content[0]):
+                self.__sendError('media', 416, 'requestedRangeNotSatisfiable', 'Invalid range')
+                return
+        if content is None:
+            self.__sendError('media', 404, 'notFound', f'File not found: {path}')
+            return
+        size, chunks = content
+        partial = bool(self.headers.get('range')) and (not path.endswith('/export'))
+        last = size if (end < 0) or (end > size) else end
+        length = last - start
+        self.send_response(206 if partial else 200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(length))
+        if partial:
+            self.send_header('Content-Range', f'bytes {start}-{last - 1}/{size}')
+        self.end_headers()
+        faults = self.server.faults['media']
+        truncated = self.server.rng.random() < faults.truncate
+        limit = length // 2 if truncated else length
+        sent = 0
+        startTime = time.monotonic()
+        try:
+            for chunk in chunks:
+                if sent >= limit:
+                    break
+                chunk = chunk[:limit - sent]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if faults.bandwidth > 0:
+                    ahead = sent / faults.bandwidth - (time.monotonic() - startTime)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        self.server.count('media', 'bytes', sent)
+        if truncated:
+            self.server.count('media', 'truncate')
+            self.close_connection = True
+
+    def __sendJson(self, kind: str, result: Any, status: int = 200):
+        """Send JSON response."""
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(kind, 'bytes', len(body))
+
+    def __sendError(self, kind: str, status: int, reason: str, message: str):
+        """Send error response in format of Google APIs."""
+        self.server.count(kind, f'error{status}')
+        self.__sendJson(kind, {'error': {
+            'code': status, 'message': message,
+            'errors': [{'domain': 'global', 'reason': reason, 'message': message}],
+        }}, status)
+
+
+def _parseRange(v: str) -> Tuple[int, int]:
+    """Parse `bytes=start-end` header to [start, end), end is -1 if not given."""
+    m = re.match(r'bytes=(\d*)-(\d*)', v.strip())
+    if m is None:
+        return 0, -1
+    start = int(m.group(1)) if m.group(1) else 0
+    end = int(m.group(2)) + 1 if m.group(2) else -1
+    return start, end
+
+
+def addArguments(parser: argparse.ArgumentParser):
+    """Add arguments of drive content and faults to parser."""
+    grp = parser.add_argument_group('Mock drive options')
+    grp.add_argument('--files', type=int, default=1000, help='# of files. Default is 1000.')
+    grp.add_argument('--folders', type=int, default=100, help='# of folders. Default is 100.')
+    grp.add_argument('--sharedDrives', type=int, default=0, help='# of shared drives.')
+    grp.add_argument(
+        '--sizes', type=str, default='lognormal:256K:1.5',
+        help='File size distribution: fixed:SIZE, uniform:MIN:MAX, lognormal:MEDIAN:SIGMA or ' + \
+            'bimodal:SMALL:LARGE:RATIO. Default is lognormal:256K:1.5.')
+    grp.add_argument(
+        '--exportSizes', type=str, default='fixed:16K',
+        help='Exported document size distribution. Default is fixed:16K.')
+    grp.add_argument('--docRatio', type=float, default=0.1, help='Ratio of Google documents.')
+    grp.add_argument('--trashedRatio', type=float, default=0.0, help='Ratio of trashed files.')
+    grp.add_argument(
+        '--sharedRatio', type=float, default=0.0, help='Ratio of files shared with user.')
+    grp.add_argument(
+        '--dupRatio', type=float, default=0.0, help='Ratio of files of duplicated content.')
+    grp.add_argument('--seed', type=int, default=0, help='Random seed.')
+    for kind in ('api', 'media'):
+        grp = parser.add_argument_group(f'Faults of {kind} requests')
+        grp.add_argument(f'--{kind}Latency', type=float, default=0.0, help='Latency in seconds.')
+        grp.add_argument(f'--{kind}Jitter', type=float, default=0.0, help='Max random latency.')
+        grp.add_argument(f'--{kind}Error401', type=float, default=0.0, help='Rate of 401.')
+        grp.add_argument(f'--{kind}Error429', type=float, default=0.0, help='Rate of 429.')
+        grp.add_argument(f'--{kind}Error5xx', type=float, default=0.0, help='Rate of 503.')
+        if kind == 'media':
+            grp.add_argument(
+                '--mediaTruncate', type=float, default=0.0, help='Rate of truncated bodies.')
+            grp.add_argument(
+                '--mediaBandwidth', type=parseSize, default=0,
+                help='Max bytes per second of each download, 0 for unlimited.')
+
+
+def specFromArgs(args: argparse.Namespace) -> Dict[str, Any]:
+    """Get spec of `serve` from parsed arguments of `addArguments`."""
+    drive = {k: getattr(args, k) for k in (
+        'files', 'folders', 'sharedDrives', 'sizes', 'exportSizes', 'docRatio', 'trashedRatio',
+        'sharedRatio', 'dupRatio', 'seed')}
+    faults = {
+        kind: {
+            k: getattr(args, f'{kind}{k[0].upper()}{k[1:]}') for k in Faults.Keys
+            if hasattr(args, f'{kind}{k[0].upper()}{k[1:]}')
+        } for kind in ('api', 'media')
+    }
+    return {'drive': drive, 'faults': faults}
+
+
+def createServer(spec: Dict[str, Any], host: str = '127.0.0.1', port: int = 0) -> MockDriveServer:
+    """Create server by spec of `specFromArgs`."""
+    server = MockDriveServer(
+        None, host, port, Faults.fromDict(spec['faults'].get('api')),
+        Faults.fromDict(spec['faults'].get('media')), seed=spec['drive'].get('seed', 0))
+    # Export links point to the server, known after socket is bound
+    server.drive = MockDrive(**spec['drive'], baseUrl=server.url)
+    return server
+
+
+def serve(spec: Dict[str, Any], host: str = '127.0.0.1', port: int = 0, ready=None):
+    """Serve until terminated, e.g. as target of `multiprocessing.Process`.
+     :param ready: queue to put root URL and drive summary once server is listening.
+    """
+    server = createServer(spec, host, port)
+    if ready is not None:
+        ready.put((server.url, server.drive.user, server.drive.fileCount, server.drive.totalSize))
+    server.serve_forever()
+
+
+def main():
+    """Run mock server from command line."""
+    parser = argparse.ArgumentParser(description='Local mock Google Drive API v3 server.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Listening address.')
+    parser.add_argument('--port', type=int, default=8000, help='Listening port. Default is 8000.')
+    addArguments(parser)
+    args = parser.parse_args()
+    server = createServer(specFromArgs(args), args.host, args.port)
+    print(f'Serving {server.drive.fileCount} files ({server.drive.totalSize} bytes) of ' + \
+        f'{server.drive.user} at {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import timedelta
+from threading import Event, Thread
+from typing import Any, Dict, List, Set, Tuple
+from urllib.request import Request, urlopen
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
+from benchmark.mockdrive import addArguments, serve, specFromArgs
+from gde.asyncdownloader import AsyncDownloader
+from gde.config import Config
+from gde.downloader import Downloader, DownloadTaskResult
+from gde.file import FileInfo, FileType
+from gde.gde import exportCsv, process
+from gde.google import GoogleDriveClient
+from gde.manifest import Manifest
+from gde.pathresolver import PathResolver
+from gde.ratelimit import RateLimiter
+
+
+Phases = ['list', 'download', 'sync', 'check', 'csv', 'incremental']
+"""Supported benchmark phases, in running order."""
+
+_Higher = ['filesPerSecond', 'mbPerSecond']
+_Lower = ['seconds', 'ttfbP50', 'ttfbP95', 'peakRssMb']
+
+
+class RssSampler:
+    """Peak resident set size of current process while in context, sampled by background thread.
+    Fallback to peak RSS of process lifetime if `/proc` is not available.
+    """
+
+    def __init__(self, interval: float = 0.02) -> None:
+        self.__interval = interval
+        self.__peak = 0
+        self.__stop = Event()
+        self.__thread = Thread(target=self.__run, name='RSS', daemon=True)
+
+    @property
+    def peak(self) -> int:
+        """Get peak RSS in bytes."""
+        return self.__peak
+
+    def __enter__(self) -> 'RssSampler':
+        self.__peak = _rss()
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.__stop.set()
+        self.__thread.join()
+        self.__peak = max(self.__peak, _rss())
+
+    def __run(self):
+        while not self.__stop.wait(self.__interval):
+            self.__peak = max(self.__peak, _rss())
+
+
+def _rss() -> int:
+    """Get current RSS in bytes, or peak RSS of process lifetime if `/proc` is not available."""
+    try:
+        with open('/proc/self/statm', 'r', encoding='ascii') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return 0
+        # ru_maxrss is in bytes on macOS and KBytes on others
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def _control(url: str, path: str, body: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    """Request control endpoint of mock server, POST if body is given."""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    with urlopen(Request(url + path, data=data, method='POST' if data else 'GET')) as resp:
+        return json.loads(resp.read())
+
+
+def _statsDelta(
+    before: Dict[str, Dict[str, int]], after: Dict[str, Dict[str, int]]
+) -> Dict[str, Dict[str, int]]:
+    """Get counters of mock server increased between two snapshots."""
+    return {
+        kind: {k: v - before.get(kind, {}).get(k, 0) for k, v in stats.items()}
+        for kind, stats in after.items() if kind != 'mock'
+    }
+
+
+def _percentile(values: List[float], p: float) -> float:
+    """Get p-th percentile of values, 0 if empty."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100), len(values) - 1)]
+
+
+def _summary(
+    seconds: float, files: int, size: int, rss: int, server: Dict[str, Dict[str, int]],
+    **extra: Any,
+) -> Dict[str, Any]:
+    """Build result of a phase."""
+    return {
+        'seconds': seconds,
+        'files': files,
+        'filesPerSecond': files / seconds if seconds > 0 else 0.0,
+        'mb': size / 1024 / 1024,
+        'mbPerSecond': size / 1024 / 1024 / seconds if seconds > 0 else 0.0,
+        'peakRssMb': rss / 1024 / 1024,
+        'server': server,
+        **extra,
+    }
+
+
+class Benchmark:
+    """End-to-end throughput benchmark against local mock Google Drive server.
+
+    Phases:
+      - list: list all drives by `GoogleDriveClient`.
+      - download: download listed files by `Downloader` or `AsyncDownloader` directly, no retry.
+      - sync: export all drives by `process` into empty output, i.e. list, check and download.
+      - check: `process` with `--downloadOnly` after sync, all files are checked and not changed.
+      - csv: export manifest to CSV by `exportCsv`.
+      - incremental: modify files on server, then `process` with `--incremental`.
+
+    `check`, `csv` and `incremental` run on output of `sync`, so `sync` runs if any of them is
+    selected. Output of `process` is written to `<work dir>/process.log`.
+    """
+
+    def __init__(self, url: str, user: str, workDir: str, args: argparse.Namespace) -> None:
+        self.__url = url
+        self.__user = user
+        self.__workDir = workDir
+        self.__args = args
+        self.__cfg = Config(os.path.join(workDir, 'settings.json'))
+        self.__log = open(os.path.join(workDir, 'process.log'), 'w', encoding='utf-8')
+        # Listed files of each drive, (drive name, files)
+        self.__listed: List[Tuple[str, List[FileInfo]]] = []
+        self.__client: GoogleDriveClient | None = None
+
+    def close(self):
+        """Close log file."""
+        self.__log.close()
+
+    def run(self, phases: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Run given phases in order of `Phases`."""
+        results = {}
+        runners = {
+            'list': self.__list, 'download': self.__download, 'sync': self.__sync,
+            'check': self.__check, 'csv': self.__csv, 'incremental': self.__incremental,
+        }
+        if ('download' in phases) and ('list' not in phases):
+            phases = ['list', *phases]
+        if any(p in phases for p in ('check', 'csv', 'incremental')) and ('sync' not in phases):
+            phases = ['sync', *phases]
+        for phase in Phases:
+            if phase not in phases:
+                continue
+            print(f'Running {phase}...', flush=True)
+            before = _control(self.__url, '/mock/stats')
+            with RssSampler() as sampler:
+                startTime = time.perf_counter()
+                result = runners[phase]()
+                seconds = time.perf_counter() - startTime
+            server = _statsDelta(before, _control(self.__url, '/mock/stats'))
+            files, size, extra = result
+            results[phase] = _summary(seconds, files, size, sampler.peak, server, **extra)
+        return results
+
+    def __list(self) -> Tuple[int, int, Dict[str, Any]]:
+        """List all drives."""
+        args = self.__args
+        self.__client = GoogleDriveClient(
+            self.__user, RateLimiter.fromConfig(self.__cfg, args.job), self.__cfg.apiEndpoint)
+        self.__client.initialize()
+        drives = [('MyDrive', '')] + [(d.name, d.driveId) for d in self.__client.sharedDrives]
+        count = 0
+        for driveName, driveId in drives:
+            query = self.__client.queryFilesPartitioned if args.partitionedList else \
+                self.__client.queryFiles
+            files = [f for block in query(
+                driveId, pageSize=self.__cfg.queryFileInfoPageSize, trashed=args.includeTrashed,
+                sharedType=args.sharedType) for f in block]
+            self.__listed.append((driveName, files))
+            count += len(files)
+        return count, 0, {}
+
+    def __download(self) -> Tuple[int, int, Dict[str, Any]]:
+        """Download listed files directly by download engine."""
+        args = self.__args
+        cfg = self.__cfg
+        outputRoot = os.path.join(self.__workDir, 'download')
+        tasks: List[Tuple[FileInfo, str, str]] = []
+        for driveName, files in self.__listed:
+            resolver = PathResolver(
+                driveName, {f.id: f for f in files if f.fileType == FileType.FOLDER})
+            for file in files:
+                resolver.resolve(file)
+                if (file.fileType != FileType.FILE) or \
+                    ((args.sharedType == 'owned') and (not file.owned)) or \
+                    ((args.sharedType == 'shared') and file.owned):
+                    continue
+                if not file.exportLinks:
+                    tasks.append((file, '', ''))
+                elif exportMimes := cfg.preferExportType.get(file.mime):
+                    tasks.append((file, exportMimes[0], cfg.exportMimeTable[exportMimes[0]][1]))
+        limiter = RateLimiter.fromConfig(cfg, args.job)
+        if args.asyncio or args.http2:
+            downloader = AsyncDownloader(
+                self.__client.authId, outputRoot, args.job, cfg, limiter, http2=args.http2)
+        else:
+            downloader = Downloader(self.__client.authId, outputRoot, args.job, cfg, limiter)
+        maxInFlight = args.job * cfg.inFlightFactor
+        futures: Set[Future] = set()
+        ttfb: List[float] = []
+        okCount = 0
+        size = 0
+        pending = iter(tasks)
+        while True:
+            while len(futures) < maxInFlight:
+                task = next(pending, None)
+                if task is None:
+                    break
+                file, exportMime, ext = task
+                futures.add(downloader.download(file, exportMime, ext))
+            if not futures:
+                break
+            done, futures = wait(futures, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                result: DownloadTaskResult = future.result()
+                if not result.result:
+                    continue
+                okCount += 1
+                size += os.path.getsize(result.path)
+                if result.requestTime > timedelta():
+                    ttfb.append(result.requestTime.total_seconds())
+            if Downloader.RequireAuth:
+                self.__client.auth()
+                downloader.resetAuthKey(self.__client.authId)
+                Downloader.RequireAuth = False
+        downloader.close()
+        return okCount, size, {
+            'failed': len(tasks) - okCount,
+            'ttfbP50': _percentile(ttfb, 50) * 1000,
+            'ttfbP95': _percentile(ttfb, 95) * 1000,
+            'ttfbP99': _percentile(ttfb, 99) * 1000,
+        }
+
+    def __sync(self) -> Tuple[int, int, Dict[str, Any]]:
+        """Export all drives into empty output."""
+        before = _control(self.__url, '/mock/stats')
+        self.__process()
+        media = _statsDelta(before, _control(self.__url, '/mock/stats')).get('media', {})
+        return self.__manifestCount(), media.get('bytes', 0), {}
+
+    def __check(self) -> Tuple[int, int, Dict[str, Any]]:
+        """Check all files stored in manifest, nothing to download."""
+        self.__process(downloadOnly=True)
+        return self.__manifestCount(), 0, {}
+
+    def __csv(self) -> Tuple[int, int, Dict[str, Any]]:
+        """Export manifest to CSV."""
+        with redirect_stdout(self.__log), redirect_stderr(self.__log):
+            exportCsv(self.__user, os.path.join(self.__workDir, 'output'))
+        userRoot = os.path.join(self.__workDir, 'output', self.__user)
+        size = sum(
+            os.path.getsize(os.path.join(userRoot, name)) for name in os.listdir(userRoot)
+            if name.endswith('.csv'))
+        return self.__manifestCount(), size, {}
+
+    def __incremental(self) -> Tuple[int, int, Dict[str, Any]]:
+        """Modify files on server and export changes."""
+        changed = _control(self.__url, f'/mock/touch?count={self.__args.touch}', {})['changed']
+        before = _control(self.__url, '/mock/stats')
+        self.__process(incremental=True)
+        media = _statsDelta(before, _control(self.__url, '/mock/stats')).get('media', {})
+        return changed, media.get('bytes', 0), {}
+
+    def __process(self, downloadOnly: bool = False, incremental: bool = False):
+        """Run `process` with benchmark options, output is written to log."""
+        args = self.__args
+        Downloader.RequireAuth = False
+        with redirect_stdout(self.__log), redirect_stderr(self.__log):
+            process(
+                user=self.__user, outputRoot=os.path.join(self.__workDir, 'output'),
+                job=args.job, downloadOnly=downloadOnly, noMd5=args.noMd5, fileInfoCsv='',
+                includeTrashed=args.includeTrashed, sharedType=args.sharedType,
+                ignoredDrives=[], maxRetry=args.maxRetry, incremental=incremental,
+                partitioned=args.partitionedList, stream=args.stream, schedule=args.schedule,
+                useAsync=args.asyncio, http2=args.http2)
+        self.__log.flush()
+
+    def __manifestCount(self) -> int:
+        """Get # of files stored in manifest of all drives."""
+        manifest = Manifest(os.path.join(self.__workDir, 'output', self.__user, 'manifest.db'))
+        count = sum(manifest.countDrive(driveId) for driveId, _ in manifest.drives())
+        manifest.close()
+        return count
+
+
+def _prepareWorkDir(workDir: str, url: str, user: str, settings: str):
+    """Write settings pointing to mock server and OAuth token accepted by it."""
+    config = {}
+    if settings:
+        with open(settings, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    config['apiEndpoint'] = url
+    with open(os.path.join(workDir, 'settings.json'), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    os.makedirs(os.path.join(workDir, 'tokens'), exist_ok=True)
+    with open(os.path.join(workDir, 'tokens', f'{user}.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'token': 'mock-token', 'refresh_token': 'mock-refresh', 'client_id': 'mock',
+            'client_secret': 'mock', 'token_uri': f'{url}/token',
+            # Token without expiry is treated as expired and refreshed by Google
+            'expiry': '2999-01-01T00:00:00Z',
+        }, f)
+
+
+def _printResults(results: Dict[str, Dict[str, Any]]):
+    """Print results as table."""
+    print(f'{"phase":<12}{"seconds":>10}{"files":>9}{"files/s":>10}{"MB":>10}{"MB/s":>9}' + \
+        f'{"TTFB p50/p95 ms":>18}{"peak RSS MB":>13}{"API req":>9}{"API KB":>9}')
+    for phase, r in results.items():
+        api = r['server'].get('api', {})
+        ttfb = f'{r["ttfbP50"]:.1f}/{r["ttfbP95"]:.1f}' if 'ttfbP50' in r else '-'
+        print(
+            f'{phase:<12}{r["seconds"]:>10.2f}{r["files"]:>9}{r["filesPerSecond"]:>10.1f}' + \
+            f'{r["mb"]:>10.1f}{r["mbPerSecond"]:>9.1f}{ttfb:>18}{r["peakRssMb"]:>13.1f}' + \
+            f'{api.get("requests", 0):>9}{api.get("bytes", 0) / 1024:>9.0f}')
+        faults = {k: v for kind in r['server'].values() for k, v in kind.items()
+            if k.startswith('error') or (k == 'truncate')}
+        if faults or r.get('failed'):
+            print(f'{"":<12}failed: {r.get("failed", 0)}, injected: {faults}')
+
+
+def _compare(
+    results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float
+) -> List[str]:
+    """Get regressions of results against baseline exceeding tolerance ratio."""
+    regressions = []
+    for phase, r in results.items():
+        base = baseline.get(phase)
+        if base is None:
+            continue
+        for key in _Higher + _Lower:
+            if (key not in r) or (not base.get(key)):
+                continue
+            ratio = r[key] / base[key]
+            if ((key in _Higher) and (ratio < 1 - tolerance)) or \
+                ((key in _Lower) and (ratio > 1 + tolerance)):
+                regressions.append(
+                    f'{phase}.{key}: {r[key]:.2f} vs baseline {base[key]:.2f} ({ratio - 1:+.1%})')
+    return regressions
+
+
+def createParser() -> argparse.ArgumentParser:
+    """Create argparse instance."""
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=
+        """
+        End-to-end throughput benchmark of gdexporter against local mock Google Drive server.
+
+        Reports files/s, MB/s, time to first byte, peak RSS and mock server counters of each
+        phase. Results can be saved by --json and compared with previous results by --baseline.
+        """)
+    parser.add_argument(
+        '--phases', type=str, default='list,download,sync,check,csv',
+        help=f'Comma separated phases to run: {", ".join(Phases)}. ' + \
+            'Default is list,download,sync,check,csv.')
+    parser.add_argument(
+        '--workDir', type=str, default='',
+        help='Folder for settings, tokens and output. Default is a temporary folder removed ' + \
+            'after benchmark.')
+    parser.add_argument(
+        '--settings', type=str, default='', help='settings.json to benchmark with.')
+    parser.add_argument('--json', type=str, default='', help='Save results to JSON file.')
+    parser.add_argument(
+        '--baseline', type=str, default='',
+        help='Compare with results saved by --json, exit with 1 if regressed.')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.1,
+        help='Allowed ratio of regression against baseline. Default is 0.1.')
+    parser.add_argument(
+        '--touch', type=int, default=100,
+        help='# of files modified on server before incremental phase. Default is 100.')
+
+    grp = parser.add_argument_group('Exporter options, see gdexporter.py')
+    grp.add_argument('--job', '-j', type=int, default=8)
+    grp.add_argument('--asyncio', action='store_true', default=False)
+    grp.add_argument('--http2', action='store_true', default=False)
+    grp.add_argument('--includeTrashed', action='store_true', default=False)
+    grp.add_argument('--maxRetry', type=int, default=3)
+    grp.add_argument('--noMd5', action='store_true', default=False)
+    grp.add_argument('--partitionedList', action='store_true', default=False)
+    grp.add_argument(
+        '--schedule', choices=['fifo', 'largest', 'smallest', 'fair'], default='fifo')
+    grp.add_argument('--sharedType', choices=['both', 'shared', 'owned'], default='owned')
+    grp.add_argument('--stream', action='store_true', default=False)
+    addArguments(parser)
+    return parser
+
+
+def main() -> int:
+    """Run benchmark from command line."""
+    args = createParser().parse_args()
+    phases = [p.strip() for p in args.phases.split(',') if p.strip()]
+    unknown = [p for p in phases if p not in Phases]
+    if unknown:
+        print(f'Unknown phases: {unknown}')
+        return 2
+    # Server runs in another process, so it does not compete with exporter for GIL and memory
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Queue()
+    server = ctx.Process(target=serve, args=(specFromArgs(args),), kwargs={'ready': ready})
+    server.start()
+    workDir = os.path.abspath(args.workDir) if args.workDir else tempfile.mkdtemp(prefix='gdebench')
+    os.makedirs(workDir, exist_ok=True)
+    cwd = os.getcwd()
+    try:
+        url, user, fileCount, totalSize = ready.get(timeout=600)
+        print(f'Mock drive: {fileCount} files, {totalSize / 1024 / 1024:.1f} MB at {url}')
+        _prepareWorkDir(workDir, url, user, args.settings)
+        # Tokens and settings are loaded from working directory
+        os.chdir(workDir)
+        bench = Benchmark(url, user, workDir, args)
+        try:
+            results = bench.run(phases)
+        finally:
+            bench.close()
+    finally:
+        os.chdir(cwd)
+        server.terminate()
+        server.join()
+        if not args.workDir:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+    _printResults(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = _compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
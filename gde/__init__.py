@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
+from .asyncdownloader import AsyncDownloader
 from .downloader import Downloader, DownloadTaskResult
 from .google import GoogleDriveClient
 from .file import FileInfo, FileType
+from .ratelimit import RateLimiter
 
-__all__ = ['Downloader', 'DownloadTaskResult', 'GoogleDriveClient', 'FileInfo', 'FileType']
+__all__ = ['AsyncDownloader', 'Downloader', 'DownloadTaskResult', 'GoogleDriveClient', 'FileInfo',
+    'FileType', 'RateLimiter']
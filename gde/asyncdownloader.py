@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from threading import Thread
+from typing import Any, AsyncGenerator, Callable, Dict, List, Tuple
+import asyncio
+import hashlib
+import io
+import os
+from .config import Config
+from .downloader import (
+    Downloader, DownloadTaskResult, _PartJournal, _TaskStatus, _errorMessage, _finalize,
+    _isRateLimited, _makeDirs, _materialize, _mediaUrl, _openPartFile, _receiveFail,
+    _requestHeaders, _responseRange)
+from .file import FileInfo
+from .hashcache import HashCache
+from .localindex import LocalIndex
+from .ratelimit import RateLimiter, parseRetryAfter
+from .stall import LatencyTracker, StallMonitor
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+def _writeChunk(f: io.BufferedWriter, h: 'hashlib._Hash', data: bytes) -> int:
+    """Write downloaded chunk to file and feed it into hash object."""
+    h.update(data)
+    return f.write(data)
+
+
+class AsyncDownloader:
+    """Perform downloading on asyncio event loop, same interface as `Downloader`.
+
+    All transfers run as coroutines on one event loop thread with httpx, so hundreds of requests
+    can be in flight without one OS thread for each. Blocking file operations run on a small I/O
+    thread pool. Large files are downloaded by single request, segmented download is only
+    supported by `Downloader`.
+
+    With `http2`, requests are multiplexed over a few HTTP/2 connections, and # of concurrent
+    streams is limited by `http2MaxConnections * http2MaxStreams`. The client falls back to
+    HTTP/1.1 if `h2` is not installed or HTTP/2 connection fails by protocol error.
+
+    Stalled transfers are aborted and slow requests of small files are hedged the same as
+    `Downloader`.
+
+    Requires `httpx`, and `h2` for HTTP/2, both are listed in `requirements.txt`.
+    """
+
+    def __init__(
+        self, authKey: str, outputRootPath: str, maxTask: int = 64, cfg: Config | None = None,
+        limiter: RateLimiter | None = None, hashCache: HashCache | None = None,
+        index: LocalIndex | None = None, http2: bool = False,
+    ) -> None:
+        if httpx is None:
+            raise ImportError(
+                'asyncio download engine requires httpx, `pip install -r requirements.txt`.')
+        self.__cfg = cfg if cfg else Config()
+        self.__authKey = authKey
+        self.__outputRootPath = outputRootPath
+        self.__maxJobs = maxTask
+        self.__limiter = limiter if limiter else RateLimiter.fromConfig(self.__cfg, maxTask)
+        self.__hashCache = hashCache
+        self.__index = index
+        self.__createdDirs = set()
+        # Status of each running slot, slot id is used as key instead of thread id
+        self.__status = {slot: _TaskStatus() for slot in range(maxTask)}
+        self.__freeSlots: List[int] = list(range(maxTask))
+        self.__active = 0
+        self.__requestCount = 0
+        self.__connectionCount = 0
+        # Time to first byte of recent requests, slow requests of small files are hedged
+        self.__latency = LatencyTracker.fromConfig(self.__cfg)
+        self.__hedgeCount = 0
+        self.__http2 = http2
+        # Primitives are bound to event loop on first use, transfers wait for free slot of rate
+        # limiter by condition and for free stream of connections by semaphore
+        self.__slotCond = asyncio.Condition()
+        self.__streams = asyncio.Semaphore(maxTask)
+        # Clients replaced by HTTP/1.1 fallback, closed after in flight requests completed
+        self.__oldClients: List['httpx.AsyncClient'] = []
+        self.__io = ThreadPoolExecutor(
+            max_workers=self.__cfg.asyncIoJobs, thread_name_prefix='AIO')
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = Thread(target=self.__loop.run_forever, name='AsyncDW', daemon=True)
+        self.__thread.start()
+        self.__client: 'httpx.AsyncClient' = self.__call(self.__createClient()).result()
+
+    @property
+    def status(self) -> Dict[int, _TaskStatus]:
+        """Get all downloading status.
+        Map from slot id to status instance.
+        """
+        return self.__status
+
+    @property
+    def maxJobs(self) -> int:
+        """Get max concurrent jobs."""
+        return self.__maxJobs
+
+    @property
+    def http2(self) -> bool:
+        """Get if requests are sent by HTTP/2."""
+        return self.__http2
+
+    @property
+    def connectionStats(self) -> Tuple[int, int]:
+        """Get connection usage of the client.
+         :returns: tuple of (# of sent requests, # of opened connections).
+        """
+        return self.__requestCount, self.__connectionCount
+
+    @property
+    def hedgeCount(self) -> int:
+        """Get # of sent hedged requests."""
+        return self.__hedgeCount
+
+    def resetAuthKey(self, authKey: str):
+        """Reset OAuth key."""
+        self.__authKey = authKey
+
+    def close(self):
+        """Close connections and stop event loop."""
+        for client in [self.__client, *self.__oldClients]:
+            self.__call(client.aclose()).result()
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+        self.__loop.close()
+        self.__io.shutdown(wait=True)
+
+    def download(
+        self, file: FileInfo, useExportMime: str = '', fileExt: str = '', i: int = 0
+    ) -> Future[DownloadTaskResult]:
+        """Download file with GET request and set jwt key.
+        This method can also do MD5 check if md5 is provided.
+
+         :param file: google drive file info.
+         :param useExportMime: use this MIME type when file requres export.
+         :param fileExt: file extension to append when exporting file.
+         :param i: index of given file in all file list. This is for fast update download result
+            back to manifest.
+        """
+        return self.__call(self.__downloadImpl(file, useExportMime, fileExt, i))
+
+    def link(
+        self, file: FileInfo, source: str, verify: bool = True, i: int = 0
+    ) -> Future[DownloadTaskResult]:
+        """Create file from local file of the same content, same as `Downloader.link`.
+        Linking is done on I/O thread pool without event loop.
+        """
+        return self.__io.submit(
+            _materialize, file, i, source, verify, self.__outputRootPath, self.__createdDirs,
+            self.__cfg.dedupHardlink, self.__index, self.__hashCache)
+
+    def __call(self, coro) -> Future:
+        """Run coroutine on event loop from other threads."""
+        return asyncio.run_coroutine_threadsafe(coro, self.__loop)
+
+    async def __run(self, fn: Callable, *args) -> Any:
+        """Run blocking function on I/O thread pool."""
+        return await self.__loop.run_in_executor(self.__io, fn, *args)
+
+    async def __createClient(self) -> 'httpx.AsyncClient':
+        """Create client on event loop."""
+        if self.__http2:
+            try:
+                client = self.__newClient(True)
+                self.__streams = asyncio.Semaphore(
+                    self.__cfg.http2MaxConnections * self.__cfg.http2MaxStreams)
+                return client
+            except ImportError:
+                print('HTTP/2 requires h2 in requirements.txt, fallback to HTTP/1.1.')
+                self.__http2 = False
+        return self.__newClient(False)
+
+    def __newClient(self, http2: bool) -> 'httpx.AsyncClient':
+        """Create client with HTTP/2 or HTTP/1.1 connection pool."""
+        if http2:
+            poolSize = self.__cfg.http2MaxConnections
+        else:
+            poolSize = self.__cfg.connectionPoolSize if self.__cfg.connectionPoolSize > 0 \
+                else self.__maxJobs
+            if self.__cfg.hedgeMaxSize > 0:
+                # Hedged requests must not wait for connections held by requests they hedge
+                poolSize += self.__maxJobs
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(max_connections=poolSize, max_keepalive_connections=poolSize),
+            headers={
+                'Accept-Encoding': 'gzip, deflate',
+                'User-Agent': 'GDriveDownloader (gzip)',
+            },
+            timeout=httpx.Timeout(
+                None, connect=self.__cfg.connectTimeout or None,
+                read=self.__cfg.readTimeout or None),
+            follow_redirects=True)
+
+    def __fallbackHttp1(self, e: Exception):
+        """Replace HTTP/2 client by HTTP/1.1 one, requests in flight keep using the old client."""
+        if not self.__http2:
+            return
+        print(f'HTTP/2 connection fail, fallback to HTTP/1.1: {e}')
+        self.__http2 = False
+        self.__oldClients.append(self.__client)
+        self.__client = self.__newClient(False)
+        self.__streams = asyncio.Semaphore(self.__maxJobs)
+
+    async def __trace(self, event: str, _: Dict):
+        """Count opened connections by httpcore trace events."""
+        if event == 'connection.connect_tcp.complete':
+            self.__connectionCount += 1
+
+    async def __acquireSlot(self):
+        """Wait until active transfers are under current limit of rate limiter."""
+        async with self.__slotCond:
+            while self.__active >= min(self.__limiter.limit, self.__maxJobs):
+                try:
+                    # Limit may be raised by rate limiter without notification, check again
+                    await asyncio.wait_for(self.__slotCond.wait(), 1)
+                except asyncio.TimeoutError:
+                    pass
+            self.__active += 1
+
+    async def __releaseSlot(self):
+        """Release slot and wake up one waiting task."""
+        async with self.__slotCond:
+            self.__active -= 1
+            self.__slotCond.notify()
+
+    async def __acquireToken(self):
+        """Wait for global backoff and a token before sending a request."""
+        while (wait := self.__limiter.tryAcquire()) > 0:
+            await asyncio.sleep(wait)
+
+    async def __waitAuth(self, maxWaitTime: float = 3600):
+        """Wait for reauth."""
+        now = datetime.now()
+        while Downloader.RequireAuth:
+            await asyncio.sleep(2)
+            if (datetime.now() - now).seconds > maxWaitTime:
+                break
+
+    async def __downloadImpl(
+        self, file: FileInfo, useExportMime: str, fileExt: str, i: int
+    ) -> DownloadTaskResult:
+        """Implementation of downloading, holds a slot during the whole task."""
+        await self.__acquireSlot()
+        slot = self.__freeSlots.pop()
+        status = self.__status[slot]
+        status.setTask(file.name, 0)
+        try:
+            return await self.__downloadStream(file, useExportMime, fileExt, i, status)
+        except Exception as e:
+            return DownloadTaskResult(
+                file, False, 'Download unexpected exception', i, '', e, timedelta(), timedelta())
+        finally:
+            status.setComplete()
+            self.__freeSlots.append(slot)
+            await self.__releaseSlot()
+
+    async def __downloadStream(
+        self, file: FileInfo, useExportMime: str, fileExt: str, i: int, status: _TaskStatus,
+    ) -> DownloadTaskResult:
+        """Download file by single streaming request, resume from partial file if possible."""
+        url = _mediaUrl(self.__cfg, file, useExportMime)
+        fullPath = os.path.join(self.__outputRootPath, file.path)
+        await self.__run(_makeDirs, os.path.dirname(fullPath), self.__createdDirs)
+        # Each export type of a document has its own partial file
+        partPath = f'{fullPath}.{file.id}{fileExt}.part'
+        journal = _PartJournal(file, partPath)
+        # Only binary files can be resumed, exported files do not support range request
+        offset = await self.__run(journal.load) if not file.exportLinks else 0
+        # Request download, max retry 5 times
+        for retry in range(5):
+            # Wait if require auth
+            await self.__waitAuth()
+            await self.__acquireToken()
+            startTime = datetime.now()
+            try:
+                status.setMessage('')
+                async with self.__streams, self.__request(
+                    url, _requestHeaders(self.__authKey, offset),
+                    file.size <= self.__cfg.hedgeMaxSize
+                ) as resp:
+                    if resp.status_code == 401:
+                        # need reauth
+                        await resp.aread()
+                        status.setMessage('Wait ReAuth')
+                        Downloader.RequireAuth = True
+                        print(f'(Retry {retry}) {file.name} need reauth: {resp.text}')
+                        continue
+                    if resp.status_code in (403, 429):
+                        await resp.aread()
+                    if _isRateLimited(resp):
+                        # rate limiter: all tasks backoff together
+                        status.setMessage('Wait RateLimiter')
+                        delay = self.__limiter.onThrottle(
+                            parseRetryAfter(resp.headers.get('retry-after')))
+                        print(f'(Retry {retry}) {file.name} rate limiter, ' + \
+                            f'wait {delay:.1f}s: {resp.text}')
+                        continue
+                    elif resp.status_code == 416:
+                        # Partial file is invalid, restart from beginning
+                        await self.__run(journal.remove)
+                        offset = 0
+                        continue
+                    elif resp.status_code not in (200, 206):
+                        # unknown error
+                        await resp.aread()
+                        return DownloadTaskResult(
+                            file, False, f'Request file fail: {_errorMessage(resp)}',
+                            i, '', None, timedelta(), timedelta())
+                    requestTime = datetime.now()
+                    self.__limiter.onSuccess((requestTime - startTime).total_seconds())
+                    self.__latency.add((requestTime - startTime).total_seconds())
+                    offset, totalSize, resumable = _responseRange(file, resp, offset)
+                    status.setTask(file.name, totalSize, offset)
+                    return await self.__receive(
+                        file, useExportMime, fileExt, i, status, resp, fullPath, partPath,
+                        journal, offset, totalSize, resumable, startTime, requestTime)
+            except httpx.RemoteProtocolError as e:
+                if not self.__http2:
+                    return DownloadTaskResult(
+                        file, False, 'Request unexpected exception', i, '', e,
+                        timedelta(), timedelta())
+                self.__fallbackHttp1(e)
+            except Exception as e:
+                return DownloadTaskResult(
+                    file, False, 'Request unexpected exception', i, '', e, timedelta(), timedelta())
+        return DownloadTaskResult(
+            file, False, 'Request retry exceeded', i, '', None, timedelta(), timedelta())
+
+    @asynccontextmanager
+    async def __request(
+        self, url: str, headers: Dict[str, str], hedge: bool
+    ) -> AsyncGenerator['httpx.Response', None]:
+        """Send streaming GET request, the response is closed on exit.
+        If `hedge`, a duplicate request is sent once response is slower than most recent ones,
+        the first response is taken and the other one is cancelled or closed.
+        """
+        def __send() -> asyncio.Task:
+            self.__requestCount += 1
+            return asyncio.ensure_future(self.__client.send(
+                self.__client.build_request(
+                    'GET', url, headers=headers, extensions={'trace': self.__trace}),
+                stream=True))
+
+        delay = self.__latency.delay() if hedge else None
+        tasks = [__send()]
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            # Hedged request should not exceed rate limit, skip it if no token now
+            if (not done) and (self.__limiter.tryAcquire() <= 0):
+                self.__hedgeCount += 1
+                tasks.append(__send())
+        pending = set(tasks)
+        winner = None
+        try:
+            while pending and (winner is None):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in done if t.exception() is None), None)
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif (not task.cancelled()) and (task.exception() is None):
+                    await task.result().aclose()
+        if winner is None:
+            raise tasks[0].exception()
+        resp = winner.result()
+        try:
+            yield resp
+        finally:
+            await resp.aclose()
+
+    async def __receive(
+        self, file: FileInfo, useExportMime: str, fileExt: str, i: int, status: _TaskStatus,
+        resp: 'httpx.Response', fullPath: str, partPath: str, journal: _PartJournal,
+        offset: int, totalSize: int, resumable: bool, startTime: datetime, requestTime: datetime,
+    ) -> DownloadTaskResult:
+        """Receive response body into partial file, then verify and move it to final path."""
+        try:
+            # Download & computer MD5
+            f, h = await self.__run(_openPartFile, partPath, offset, totalSize, self.__cfg)
+            journalOffset = offset
+            try:
+                monitor = StallMonitor.fromConfig(self.__cfg)
+                # Check stall by each received chunk, but write in large chunks
+                chunk = bytearray()
+                async for data in resp.aiter_bytes():
+                    status.update(len(data))
+                    monitor.update(len(data))
+                    chunk += data
+                    if len(chunk) < self.__cfg.downloadChunkSize:
+                        continue
+                    offset += await self.__run(_writeChunk, f, h, chunk)
+                    chunk = bytearray()
+                    if resumable and (offset - journalOffset >= self.__cfg.resumeJournalInterval):
+                        await self.__run(f.flush)
+                        await self.__run(journal.save, offset)
+                        journalOffset = offset
+                if chunk:
+                    offset += await self.__run(_writeChunk, f, h, chunk)
+                # Partial file is preallocated, content length may differ from decoded size
+                await self.__run(f.truncate, offset)
+            finally:
+                await self.__run(f.close)
+            downloadTime = datetime.now()
+        except Exception as e:
+            return await self.__run(
+                _receiveFail, file, i, e, journal, offset, resumable, requestTime - startTime)
+
+        return await self.__run(
+            _finalize, file, h.hexdigest(), i, fullPath, partPath, journal, useExportMime,
+            fileExt, requestTime - startTime, downloadTime - requestTime, self.__index,
+            self.__hashCache)
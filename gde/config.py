@@ -1,87 +1,138 @@
 # -*- coding: utf-8 -*-
 import json
-from typing import Dict
+from typing import Any, Dict, List
 
 
 class Config:
     """Settings for gde implementation."""
 
     def __init__(self, filePath: str = 'settings.json') -> None:
+        self.__config = {
+            'apiEndpoint': 'https://www.googleapis.com',  # Root URL of Drive API, e.g. mock server
+            'queryFileInfoPageSize': 1000,  # Max 1000
+            'md5ChunkSize': 1024 * 1024,  # 1 MBytes
+            'downloadChunkSize': 1024 * 1024,  # 1 MBytes
+            'writeBehindBuffers': 4,  # Buffers of each download waiting for writing to disk
+            'preallocate': False,  # Allocate disk space by posix_fallocate before downloading
+            'connectionPoolSize': 0,  # 0: same as max concurrent download jobs
+            'connectionPoolBlock': True,
+            'resumeJournalInterval': 16 * 1024 * 1024,  # 16 MBytes
+            'segmentThreshold': 256 * 1024 * 1024,  # 256 MBytes, 0: disable segmented download
+            'segmentSize': 32 * 1024 * 1024,  # 32 MBytes
+            'maxSegmentJobs': 0,  # 0: same as max concurrent download jobs
+            'asyncIoJobs': 4,  # File I/O threads of asyncio download engine
+            'http2MaxConnections': 4,
+            'http2MaxStreams': 100,  # Max concurrent streams of each HTTP/2 connection
+            'inFlightFactor': 4,  # Max in flight download tasks = jobs * inFlightFactor
+            'schedulePriority': [],  # e.g. {"path": "MyDrive/Important/*", "priority": 10}
+            'listDriveJobs': 4,
+            'pipelineQueueSize': 1000,
+            'listFolderJobs': 8,
+            'listFolderBatch': 20,
+            'rateLimitPerSecond': 20.0,  # 0: disable token bucket
+            'rateLimitBurst': 20,
+            'minConcurrency': 1,
+            'backoffBase': 1.0,  # Seconds
+            'backoffMax': 120.0,  # Seconds
+            'latencyThreshold': 3.0,  # Ratio to min observed latency
+            'connectTimeout': 10.0,  # Seconds, 0: no timeout
+            'readTimeout': 60.0,  # Seconds between received bytes, 0: no timeout
+            'stallMinSpeed': 1024,  # Bytes per second, 0: disable stall detection
+            'stallWindow': 30.0,  # Seconds
+            'hedgeMaxSize': 4 * 1024 * 1024,  # 4 MBytes, 0: disable hedged requests
+            'hedgePercentile': 95,
+            'hedgeMinSamples': 20,
+            'hedgeMinDelay': 1.0,  # Seconds
+            'hashCache': True,
+            'verifyJobs': 0,  # 0: # of CPUs
+            'verifyProcessPool': False,
+            'localIndex': True,
+            'dedup': True,  # Download files of the same content once, link others to it
+            'dedupHardlink': False,  # Hardlink files of the same modified and access time
+            'fileFilter': {},  # e.g. {"mimeTypes": ["application/pdf"], "minSize": 1024}
+            'mimeMapping': {
+                # Google
+                'application/vnd.google-apps.document': ['Google Docs', ''],
+                'application/vnd.google-apps.drawing': ['Google Drawing', ''],
+                'application/vnd.google-apps.form': ['Google Forms', ''],
+                'application/vnd.google-apps.jam': ['Google Jamboard', ''],
+                'application/vnd.google-apps.presentation': ['Google Slides', ''],
+                'application/vnd.google-apps.script': ['Google Apps Scripts', ''],
+                'application/vnd.google-apps.script+json': ['Google Apps JSON (.json)', '.json'],
+                'application/vnd.google-apps.site': ['Google Sites', ''],
+                'application/vnd.google-apps.spreadsheet': ['Google Sheet', ''],
+                # MS
+                'application/rtf': ['Rich Test Format (.rtf)', '.rtf'],
+                'application/vnd.openxmlformats-officedocument.presentationml.presentation':
+                    ['Microsoft Powerpoint (.pptx)', '.pptx'],
+                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
+                    ['Microsoft Excel (.xlsx)', '.xlsx'],
+                'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
+                    ['Microsoft Word (.docx)', '.docx'],
+                # Openoffice
+                'application/vnd.oasis.opendocument.presentation':
+                    ['OpenDocument Presentation (.odp)', '.odp'],
+                'application/vnd.oasis.opendocument.spreadsheet':
+                    ['OpenDocument Spreadsheet (.ods)', '.ods'],
+                'application/vnd.oasis.opendocument.text': ['OpenDocument Text (.odt)', '.odt'],
+                'application/x-vnd.oasis.opendocument.spreadsheet':
+                    ['OpenDocument Spreadsheet (.ods)', '.ods'],
+                # Other
+                'application/epub+zip': ['EPUB (.epub)', '.epub'],
+                'application/pdf': ['PDF (.pdf)', '.pdf'],
+                'application/zip': ['Zip (.zip)', '.zip'],
+                'image/jpeg': ['Jpeg (.jpg)', '.jpg'],
+                'image/png': ['PNG (.png)', '.png'],
+                'image/svg+xml': ['SVG (.svg)', '.svg'],
+                'text/csv': ['Comma-Separated Values (.csv)', '.csv'],
+                'text/html': ['HTML (.html)', '.html'],
+                'text/plain': ['Plain Text (.txt)', '.txt'],
+                'text/tab-separated-values': ['Tab-Separated Values (.tsv)', '.tsv'],
+            },
+            'preferExportMimeType': {
+                # Docs
+                'application/vnd.google-apps.document':
+                    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+                # Sheet
+                'application/vnd.google-apps.spreadsheet':
+                    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                # Jamboard
+                'application/vnd.google-apps.jam':
+                    'application/pdf',
+                # AppScript
+                'application/vnd.google-apps.script':
+                    'application/vnd.google-apps.script+json',
+                # Slides
+                'application/vnd.google-apps.presentation':
+                    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+                # Form
+                'application/vnd.google-apps.form':
+                    'application/zip',
+                # Drawing
+                'application/vnd.google-apps.drawing':
+                    'image/svg+xml',
+                # Site
+                'application/vnd.google-apps.site':
+                    'text/plain',
+            }
+        }
         try:
             with open(filePath, 'r', encoding='utf-8') as f:
-                self.__config = json.load(f)
+                # Keys missing in user settings fallback to default value
+                self.__config.update(json.load(f))
         except IOError:
             # File does not exist?
-            self.__config = {
-                'queryFileInfoPageSize': 1000,  # Max 1000
-                'md5ChunkSize': 1024 * 1024,  # 1 MBytes
-                'downloadChunkSize': 128 * 1024, # 128 KBytes
-                'mimeMapping': {
-                    # Google
-                    'application/vnd.google-apps.document': ['Google Docs', ''],
-                    'application/vnd.google-apps.drawing': ['Google Drawing', ''],
-                    'application/vnd.google-apps.form': ['Google Forms', ''],
-                    'application/vnd.google-apps.jam': ['Google Jamboard', ''],
-                    'application/vnd.google-apps.presentation': ['Google Slides', ''],
-                    'application/vnd.google-apps.script': ['Google Apps Scripts', ''],
-                    'application/vnd.google-apps.script+json': ['Google Apps JSON (.json)', '.json'],
-                    'application/vnd.google-apps.site': ['Google Sites', ''],
-                    'application/vnd.google-apps.spreadsheet': ['Google Sheet', ''],
-                    # MS
-                    'application/rtf': ['Rich Test Format (.rtf)', '.rtf'],
-                    'application/vnd.openxmlformats-officedocument.presentationml.presentation':
-                        ['Microsoft Powerpoint (.pptx)', '.pptx'],
-                    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
-                        ['Microsoft Excel (.xlsx)', '.xlsx'],
-                    'application/vnd.openxmlformats-officedocument.wordprocessingml.document':
-                        ['Microsoft Word (.docx)', '.docx'],
-                    # Openoffice
-                    'application/vnd.oasis.opendocument.presentation':
-                        ['OpenDocument Presentation (.odp)', '.odp'],
-                    'application/vnd.oasis.opendocument.spreadsheet':
-                        ['OpenDocument Spreadsheet (.ods)', '.ods'],
-                    'application/vnd.oasis.opendocument.text': ['OpenDocument Text (.odt)', '.odt'],
-                    'application/x-vnd.oasis.opendocument.spreadsheet':
-                        ['OpenDocument Spreadsheet (.ods)', '.ods'],
-                    # Other
-                    'application/epub+zip': ['EPUB (.epub)', '.epub'],
-                    'application/pdf': ['PDF (.pdf)', '.pdf'],
-                    'application/zip': ['Zip (.zip)', '.zip'],
-                    'image/jpeg': ['Jpeg (.jpg)', '.jpg'],
-                    'image/png': ['PNG (.png)', '.png'],
-                    'image/svg+xml': ['SVG (.svg)', '.svg'],
-                    'text/csv': ['Comma-Separated Values (.csv)', '.csv'],
-                    'text/html': ['HTML (.html)', '.html'],
-                    'text/plain': ['Plain Text (.txt)', '.txt'],
-                    'text/tab-separated-values': ['Tab-Separated Values (.tsv)', '.tsv'],
-                },
-                'preferExportMimeType': {
-                    # Docs
-                    'application/vnd.google-apps.document':
-                        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                    # Sheet
-                    'application/vnd.google-apps.spreadsheet':
-                        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    # Jamboard
-                    'application/vnd.google-apps.jam':
-                        'application/pdf',
-                    # AppScript
-                    'application/vnd.google-apps.script':
-                        'application/vnd.google-apps.script+json',
-                    # Slides
-                    'application/vnd.google-apps.presentation':
-                        'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-                    # Form
-                    'application/vnd.google-apps.form':
-                        'application/zip',
-                    # Drawing
-                    'application/vnd.google-apps.drawing':
-                        'image/svg+xml',
-                    # Site
-                    'application/vnd.google-apps.site':
-                        'text/plain',
-                }
-            }
+            pass
+        # Normalized once, it is read for each exported document
+        self.__preferExportType = {
+            k: [v] if isinstance(v, str) else list(v)
+            for k, v in self.__config['preferExportMimeType'].items()
+        }
+
+    @property
+    def apiEndpoint(self) -> str:
+        """Get root URL of Google Drive API, without trailing slash."""
+        return self.__config['apiEndpoint'].rstrip('/')
 
     @property
     def queryFileInfoPageSize(self) -> int:
@@ -98,12 +149,212 @@ class Config:
         """Get download iteration chunk size."""
         return self.__config['downloadChunkSize']
 
+    @property
+    def writeBehindBuffers(self) -> int:
+        """Get # of buffers of each download can be received before written to disk."""
+        return self.__config['writeBehindBuffers']
+
+    @property
+    def preallocate(self) -> bool:
+        """Get if disk space of downloading file is allocated by `posix_fallocate`."""
+        return self.__config['preallocate']
+
+    @property
+    def connectionPoolSize(self) -> int:
+        """Get max # of kept-alive connections per host when downloading.
+         Value 0 means using the same value as max concurrent download jobs.
+        """
+        return self.__config['connectionPoolSize']
+
+    @property
+    def connectionPoolBlock(self) -> bool:
+        """Get if download tasks wait for a free pooled connection instead of opening extra ones.
+        """
+        return self.__config['connectionPoolBlock']
+
+    @property
+    def resumeJournalInterval(self) -> int:
+        """Get # of downloaded bytes between saving resume journal of partial files."""
+        return self.__config['resumeJournalInterval']
+
+    @property
+    def segmentThreshold(self) -> int:
+        """Get min file size to download by concurrent range requests. 0 means disabled."""
+        return self.__config['segmentThreshold']
+
+    @property
+    def segmentSize(self) -> int:
+        """Get size of each range request in segmented download."""
+        return self.__config['segmentSize']
+
+    @property
+    def maxSegmentJobs(self) -> int:
+        """Get max concurrent range requests of segmented download.
+         Value 0 means using the same value as max concurrent download jobs.
+        """
+        return self.__config['maxSegmentJobs']
+
+    @property
+    def asyncIoJobs(self) -> int:
+        """Get # of threads doing file I/O for asyncio download engine."""
+        return self.__config['asyncIoJobs']
+
+    @property
+    def http2MaxConnections(self) -> int:
+        """Get max # of HTTP/2 connections of asyncio download engine."""
+        return self.__config['http2MaxConnections']
+
+    @property
+    def http2MaxStreams(self) -> int:
+        """Get max # of concurrent requests multiplexed on each HTTP/2 connection."""
+        return self.__config['http2MaxStreams']
+
+    @property
+    def inFlightFactor(self) -> int:
+        """Get ratio of max submitted download tasks to max concurrent download jobs."""
+        return self.__config['inFlightFactor']
+
+    @property
+    def schedulePriority(self) -> List[Dict]:
+        """Get user priority rules of download scheduler, see `Scheduler`."""
+        return self.__config['schedulePriority']
+
+    @property
+    def listDriveJobs(self) -> int:
+        """Get max # of drives listing concurrently."""
+        return self.__config['listDriveJobs']
+
+    @property
+    def listFolderJobs(self) -> int:
+        """Get max concurrent folder queries when listing a drive by partitioned crawl."""
+        return self.__config['listFolderJobs']
+
+    @property
+    def listFolderBatch(self) -> int:
+        """Get max # of folders in single query when listing a drive by partitioned crawl."""
+        return self.__config['listFolderBatch']
+
+    @property
+    def pipelineQueueSize(self) -> int:
+        """Get max # of checked files waiting for download in streaming mode."""
+        return self.__config['pipelineQueueSize']
+
+    @property
+    def rateLimitPerSecond(self) -> float:
+        """Get max requests per second sending to Google APIs. 0 means unlimited."""
+        return self.__config['rateLimitPerSecond']
+
+    @property
+    def rateLimitBurst(self) -> int:
+        """Get max burst requests of rate limiter."""
+        return self.__config['rateLimitBurst']
+
+    @property
+    def minConcurrency(self) -> int:
+        """Get min active downloads when concurrency is reduced by rate limit errors."""
+        return self.__config['minConcurrency']
+
+    @property
+    def backoffBase(self) -> float:
+        """Get base seconds of exponential backoff when requests are rate limited."""
+        return self.__config['backoffBase']
+
+    @property
+    def backoffMax(self) -> float:
+        """Get max seconds of exponential backoff when requests are rate limited."""
+        return self.__config['backoffMax']
+
+    @property
+    def latencyThreshold(self) -> float:
+        """Get ratio of response latency to min observed latency that stops raising concurrency.
+        """
+        return self.__config['latencyThreshold']
+
+    @property
+    def connectTimeout(self) -> float:
+        """Get seconds to wait for connecting, 0 for no timeout."""
+        return self.__config['connectTimeout']
+
+    @property
+    def readTimeout(self) -> float:
+        """Get seconds to wait for next received bytes, 0 for no timeout."""
+        return self.__config['readTimeout']
+
+    @property
+    def stallMinSpeed(self) -> float:
+        """Get min bytes per second of a transfer before it is aborted as stalled."""
+        return self.__config['stallMinSpeed']
+
+    @property
+    def stallWindow(self) -> float:
+        """Get seconds of sliding window to measure transfer speed for stall detection."""
+        return self.__config['stallWindow']
+
+    @property
+    def hedgeMaxSize(self) -> int:
+        """Get max file size to send hedged request when response is slow, 0 to disable."""
+        return self.__config['hedgeMaxSize']
+
+    @property
+    def hedgePercentile(self) -> float:
+        """Get percentile of recent time to first byte, a request is hedged once exceeded."""
+        return self.__config['hedgePercentile']
+
+    @property
+    def hedgeMinSamples(self) -> int:
+        """Get min # of recent requests before hedging is enabled."""
+        return self.__config['hedgeMinSamples']
+
+    @property
+    def hedgeMinDelay(self) -> float:
+        """Get min seconds to wait before sending hedged request."""
+        return self.__config['hedgeMinDelay']
+
+    @property
+    def hashCache(self) -> bool:
+        """Get if MD5 of local files is cached by their stat identity to skip hashing again."""
+        return self.__config['hashCache']
+
+    @property
+    def verifyJobs(self) -> int:
+        """Get # of workers computing MD5 of local files, 0 for # of CPUs."""
+        return self.__config['verifyJobs']
+
+    @property
+    def verifyProcessPool(self) -> bool:
+        """Get if MD5 of local files is computed by process pool instead of thread pool."""
+        return self.__config['verifyProcessPool']
+
+    @property
+    def localIndex(self) -> bool:
+        """Get if local files are indexed in memory by one scan instead of stat each file."""
+        return self.__config['localIndex']
+
+    @property
+    def dedup(self) -> bool:
+        """Get if files of the same MD5 and size are downloaded once and linked to others."""
+        return self.__config['dedup']
+
+    @property
+    def dedupHardlink(self) -> bool:
+        """Get if duplicated files are hardlinked when their modified and access time are the same.
+        Hardlinked files share one inode, so editing one of them changes all the others.
+        """
+        return self.__config['dedupHardlink']
+
+    @property
+    def fileFilter(self) -> Dict[str, Any]:
+        """Get user filter spec of files to export, see `FileFilter`."""
+        return self.__config['fileFilter']
+
     @property
     def exportMimeTable(self) -> Dict[str, str]:
         """Get export MIME type mapping to application such as PDF, Microsoft Excel."""
         return self.__config['mimeMapping']
 
     @property
-    def preferExportType(self) -> Dict[str, str]:
-        """Get user preferred exporting MIME type."""
-        return self.__config['preferExportMimeType']
+    def preferExportType(self) -> Dict[str, List[str]]:
+        """Get user preferred exporting MIME types, a document is exported once for each type.
+        Both a single MIME type and a list of MIME types are accepted in settings.
+        """
+        return self.__preferExportType
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+import os
+from .downloader import DownloadTaskResult
+from .file import FileInfo
+from .manifest import Manifest
+
+
+class Deduplicator:
+    """Groups pending downloads by content, so each unique blob is downloaded once.
+
+    Binary files are keyed by (`md5Checksum`, size). The first pending file of a key is
+    downloaded, the others wait for it and are linked to the downloaded file once it succeeds.
+    If the same content already exists locally, i.e. a file of the key has status OK in manifest,
+    all files of the key are linked to it without downloading. If the downloading file fails
+    without further retry, the next waiting file is downloaded instead.
+
+    This class is not thread-safe, it is driven by the download loop.
+    """
+
+    def __init__(self, manifest: Manifest, outputRoot: str) -> None:
+        """Create deduplicator.
+         :param manifest: manifest to find files already exist locally.
+         :param outputRoot: output root, paths in manifest are relative to it.
+        """
+        self.__manifest = manifest
+        self.__outputRoot = outputRoot
+        # Map from key to (local path, verify before linking) of its content
+        self.__sources: Dict[Tuple[str, int], Tuple[str, bool]] = {}
+        # Map from key being downloaded to files waiting for it
+        self.__waiting: Dict[Tuple[str, int], List[Tuple[FileInfo, int]]] = {}
+        # Files ready to link, (file, i, source path, verify)
+        self.__ready: Deque[Tuple[FileInfo, int, str, bool]] = deque()
+        self.__linkCount = 0
+        self.__linkedBytes = 0
+
+    def __len__(self) -> int:
+        """Get # of files ready to link."""
+        return len(self.__ready)
+
+    @property
+    def linkCount(self) -> int:
+        """Get # of files created by linking instead of downloading."""
+        return self.__linkCount
+
+    @property
+    def linkedBytes(self) -> int:
+        """Get total size of files created by linking instead of downloading."""
+        return self.__linkedBytes
+
+    @staticmethod
+    def key(file: FileInfo, exportMime: str = '') -> Tuple[str, int] | None:
+        """Get content key of given download task, None if it can not be deduplicated."""
+        if exportMime or (not file.md5) or (file.size <= 0):
+            return None
+        return file.md5, file.size
+
+    def push(self, file: FileInfo, i: int, exportMime: str = '') -> bool:
+        """Add pending file.
+         :returns: True if the file should be downloaded. Otherwise it will be linked and taken
+            by `pop` once its content is available locally.
+        """
+        key = Deduplicator.key(file, exportMime)
+        if key is None:
+            return True
+        if key in self.__sources:
+            self.__ready.append((file, i, *self.__sources[key]))
+            return False
+        if key in self.__waiting:
+            self.__waiting[key].append((file, i))
+            return False
+        path = self.__manifest.findBlob(*key, excludeId=file.id)
+        if path:
+            # Local file may be changed after checked, verify it before linking
+            self.__sources[key] = (os.path.join(self.__outputRoot, path), True)
+            self.__ready.append((file, i, *self.__sources[key]))
+            return False
+        self.__waiting[key] = []
+        return True
+
+    def pop(self) -> Tuple[FileInfo, int, str, bool] | None:
+        """Take next file to link, None if no file is ready.
+         :returns: tuple of (file, i, source path, verify source before linking).
+        """
+        return self.__ready.popleft() if self.__ready else None
+
+    def complete(
+        self, result: DownloadTaskResult, exportMime: str, retried: bool, linked: bool
+    ) -> Tuple[FileInfo, int] | None:
+        """Report result of download or link task.
+         :param retried: failed task has been queued to retry.
+         :param linked: result is of a link task.
+         :returns: file to download instead of the failed one, None if no need.
+        """
+        key = Deduplicator.key(result.file, exportMime)
+        if key is None:
+            return None
+        if linked:
+            if result.result:
+                self.__linkCount += 1
+                self.__linkedBytes += result.file.size
+            elif self.__sources.get(key, ('', False))[1]:
+                # Local source is changed, download content again by retried task
+                del self.__sources[key]
+            return None
+        if key not in self.__waiting:
+            return None
+        if result.result:
+            self.__sources[key] = (result.path, False)
+            for f, i in self.__waiting.pop(key):
+                self.__ready.append((f, i, result.path, False))
+            return None
+        waiting = self.__waiting[key]
+        if retried or (not waiting):
+            if not retried:
+                del self.__waiting[key]
+            return None
+        return waiting.pop(0)
@@ -1,14 +1,27 @@
 # -*- coding: utf-8 -*-
-from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED, FIRST_EXCEPTION
 from datetime import datetime, timedelta
-from threading import current_thread
-from typing import Dict
+from queue import Queue
+from threading import Lock, current_thread, local
+from typing import Dict, Iterator, List, Set, Tuple
 import hashlib
+import io
+import json
 import os
 import time
 import random
 import requests
-from .file import FileInfo, setFileTime
+from requests.adapters import HTTPAdapter
+from .config import Config
+from .file import FileInfo, linkFile, md5 as fileMd5, setFileTime
+from .hashcache import HashCache
+from .localindex import LocalIndex
+from .ratelimit import RateLimiter, parseRetryAfter
+from .stall import LatencyTracker, StallError, StallMonitor
+
+
+_ReadSize = 64 * 1024
+"""Max bytes of each read from response, progress and stall are checked after each read."""
 
 
 class _TaskStatus:
@@ -50,11 +63,13 @@ class _TaskStatus:
         """Set message."""
         self.__message = msg
 
-    def setTask(self, title: str, total: int):
-        """Set new task."""
+    def setTask(self, title: str, total: int, current: int = 0):
+        """Set new task.
+         :param current: bytes have been downloaded, e.g. resumed from partial file.
+        """
         self.__title = title
         self.__total = total
-        self.__current = 0
+        self.__current = current
         self.__complete = False
         self.__message = ''
 
@@ -67,13 +82,340 @@ class _TaskStatus:
         self.__complete = True
 
 
+def _isRateLimited(resp: requests.Response) -> bool:
+    """Check if response is rejected by Google API rate limit (429 or 403 rate limit exceeded).
+    Also accepts httpx response, body of streaming response must be loaded before.
+    """
+    if resp.status_code == 429:
+        return True
+    if resp.status_code != 403:
+        return False
+    try:
+        reasons = [e.get('reason') for e in resp.json()['error']['errors']]
+    except (ValueError, KeyError, TypeError):
+        return False
+    return ('userRateLimitExceeded' in reasons) or ('rateLimitExceeded' in reasons)
+
+
+def _pwrite(fd: int, data: bytes, offset: int, lock: Lock) -> int:
+    """Write data to given position of file.
+     Fallback to seek and write with lock on platforms without `os.pwrite` (Windows).
+    """
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            size = os.pwrite(fd, view, offset)
+        else:
+            with lock:
+                os.lseek(fd, offset, os.SEEK_SET)
+                size = os.write(fd, view)
+        view = view[size:]
+        offset += size
+    return len(data)
+
+
+def _preallocate(fd: int, size: int, allocate: bool):
+    """Set size of file, allocate disk blocks by `posix_fallocate` if `allocate` and supported."""
+    if allocate and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            # File system does not support it
+            pass
+    os.ftruncate(fd, size)
+
+
+class _WriteBehind:
+    """Write-behind stage of a streaming download.
+
+    Receiving thread fills buffers borrowed from this stage and puts them back, a writer on
+    writer pool hashes and writes them to file in order. Buffers are returned after written, so
+    receiving blocks when all buffers are waiting for slow disk. Data not in buffers can also be
+    written by `write`, it blocks when as many writes as buffers are pending.
+    """
+
+    def __init__(
+        self, f: io.BufferedWriter, h: 'hashlib._Hash', buffers: List[bytearray],
+        pool: ThreadPoolExecutor,
+    ) -> None:
+        """Start writer.
+         :param f: file opened at position to write.
+         :param h: hash object fed with written data.
+         :param buffers: reusable buffers, owned by this stage until `close`.
+        """
+        self.__f = f
+        self.__h = h
+        self.__free: Queue = Queue()
+        for buf in buffers:
+            self.__free.put(buf)
+        self.__queue: Queue = Queue(maxsize=len(buffers))
+        self.__written = 0
+        self.__error: Exception | None = None
+        self.__future = pool.submit(self.__run)
+
+    @property
+    def written(self) -> int:
+        """Get # of bytes have been written."""
+        return self.__written
+
+    def getBuffer(self) -> bytearray:
+        """Borrow a free buffer, wait if all buffers are in use. Raise if writer failed."""
+        buf = self.__free.get()
+        if self.__error:
+            self.__free.put(buf)
+            raise self.__error
+        return buf
+
+    def put(self, buf: bytearray, size: int):
+        """Put filled buffer to write, `size` is # of bytes filled. Empty buffer is returned."""
+        if size:
+            self.__queue.put((buf, size, True))
+        else:
+            self.__free.put(buf)
+
+    def write(self, data: bytes):
+        """Put data not in borrowed buffer to write. Raise if writer failed."""
+        if self.__error:
+            raise self.__error
+        if data:
+            self.__queue.put((data, len(data), False))
+
+    def flush(self):
+        """Wait for all buffers written, then flush file."""
+        self.__queue.join()
+        if self.__error:
+            raise self.__error
+        self.__f.flush()
+
+    def close(self) -> Exception | None:
+        """Wait for all buffers written and stop writer.
+         :returns: exception raised by writer, None if success.
+        """
+        self.__queue.put(None)
+        self.__future.result()
+        return self.__error
+
+    def __run(self):
+        """Writer loop."""
+        while (item := self.__queue.get()) is not None:
+            buf, size, pooled = item
+            try:
+                if self.__error is None:
+                    view = memoryview(buf)[:size]
+                    self.__h.update(view)
+                    self.__f.write(view)
+                    self.__written += size
+            except Exception as e:
+                self.__error = e
+            finally:
+                if pooled:
+                    self.__free.put(buf)
+                self.__queue.task_done()
+        self.__queue.task_done()
+
+
+def _receive(raw, writer: _WriteBehind, encoded: bool) -> Iterator[int]:
+    """Read body of urllib3 response into write-behind stage, yield size of each read.
+     :param encoded: body has content encoding, decoded data is written without buffers since
+        urllib3 1.x may return more than requested.
+    """
+    while True:
+        if encoded:
+            data = raw.read(_ReadSize, decode_content=True)
+            if data:
+                writer.write(data)
+                yield len(data)
+            elif raw.closed:
+                return
+            # Otherwise decoder returns nothing before end of stream, read again
+            continue
+        buf = writer.getBuffer()
+        view = memoryview(buf)
+        filled = 0
+        size = 0
+        try:
+            while filled < len(buf):
+                size = raw.readinto(view[filled:filled + _ReadSize])
+                if not size:
+                    break
+                filled += size
+                yield size
+        finally:
+            view.release()
+            writer.put(buf, filled)
+        if not size:
+            return
+
+
+def _closeResponse(future: Future):
+    """Close response of a request lost in hedging."""
+    if (not future.cancelled()) and (future.exception() is None):
+        future.result().close()
+
+
+class _PartJournal:
+    """Sidecar of partial downloaded file for resuming download.
+
+    The journal is saved as `<part file>.json` and records # of bytes have been flushed to the
+    partial file. Journal is ignored if file on Google Drive has been changed.
+    """
+
+    def __init__(self, file: FileInfo, partPath: str) -> None:
+        self.__partPath = partPath
+        self.__path = partPath + '.json'
+        self.__key = {
+            'id': file.id,
+            'md5Checksum': file.md5,
+            'size': file.size,
+            'modifiedTime': file.mtime.isoformat(),
+        }
+        self.__segments = []
+
+    @property
+    def segments(self) -> List[int]:
+        """Get start offsets of completed segments. Only used by segmented download."""
+        return self.__segments
+
+    def load(self) -> int:
+        """Load journal and get # of bytes can be resumed. Return 0 if journal is not usable."""
+        try:
+            with open(self.__path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            offset = int(data['offset'])
+            if any(data.get(k) != v for k, v in self.__key.items()) or \
+                (os.path.getsize(self.__partPath) < offset):
+                return 0
+            self.__segments = list(data.get('segments', []))
+            return offset
+        except (IOError, ValueError, KeyError, TypeError):
+            return 0
+
+    def save(self, offset: int, segments: List[int] | None = None):
+        """Save # of bytes have been flushed to partial file.
+         :param offset: # of continuous bytes from beginning have been flushed.
+         :param segments: start offsets of completed segments for segmented download.
+        """
+        data = dict(self.__key)
+        data['offset'] = offset
+        if segments is not None:
+            data['segments'] = segments
+        tmpPath = self.__path + '.tmp'
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmpPath, self.__path)
+
+    def remove(self):
+        """Remove journal file."""
+        try:
+            os.unlink(self.__path)
+        except FileNotFoundError:
+            pass
+
+
+def _hashPartFile(h: 'hashlib._Hash', partPath: str, size: int, chunkSize: int):
+    """Feed first `size` bytes of downloaded partial file into hash object.
+     Python does not support serializing hash state, so data in partial file is read back.
+    """
+    with open(partPath, 'rb') as f:
+        while size > 0:
+            data = f.read(min(chunkSize, size))
+            if not data:
+                break
+            h.update(data)
+            size -= len(data)
+
+
+def _makeDirs(path: str, createdDirs: Set[str]):
+    """Create folder and its parents, skip folders in `createdDirs` which have been created."""
+    if path in createdDirs:
+        return
+    os.makedirs(path, exist_ok=True)
+    createdDirs.add(path)
+
+
+def _mediaUrl(cfg: Config, file: FileInfo, useExportMime: str) -> str:
+    """Get URL to download binary file, or export Google document as `useExportMime`."""
+    if file.exportLinks:
+        return file.exportLinks[useExportMime]
+    return f'{cfg.apiEndpoint}/drive/v3/files/{file.id}?alt=media'
+
+
+def _requestHeaders(authKey: str, offset: int) -> Dict[str, str]:
+    """Get headers of download request, request bytes from `offset` if it is not 0."""
+    headers = {'Authorization': 'Bearer ' + authKey}
+    if offset:
+        # Range is applied on encoded content, so resuming requires identity encoding
+        headers['Range'] = f'bytes={offset}-'
+        headers['Accept-Encoding'] = 'identity'
+    return headers
+
+
+def _errorMessage(resp: requests.Response) -> str:
+    """Get error message of loaded response of Google API, also accepts httpx response."""
+    try:
+        return resp.json()['error']['message']
+    except (ValueError, KeyError, TypeError):
+        return resp.text
+
+
+def _responseRange(
+    file: FileInfo, resp: requests.Response, offset: int
+) -> Tuple[int, int, bool]:
+    """Get range of successful download response, also accepts httpx response.
+     :param offset: offset requested by `Range` header.
+     :returns: tuple of (offset, total size, resumable). Offset is reset to 0 if server ignores
+        range and sends whole file.
+    """
+    if resp.status_code == 200:
+        offset = 0
+    totalSize = offset + int(resp.headers.get('content-length', file.size - offset))
+    resumable = (not file.exportLinks) and \
+        (resp.headers.get('content-encoding', 'identity') == 'identity')
+    return offset, totalSize, resumable
+
+
+def _openPartFile(
+    partPath: str, offset: int, totalSize: int, cfg: Config
+) -> Tuple[io.BufferedRandom, 'hashlib._Hash']:
+    """Open partial file to write from `offset`.
+    New partial file is preallocated to `totalSize`, so caller must truncate it to written size.
+     :returns: tuple of (file, MD5 hash object fed with bytes before `offset`).
+    """
+    h = hashlib.md5()
+    if offset:
+        _hashPartFile(h, partPath, offset, cfg.md5ChunkSize)
+    f = open(partPath, 'r+b' if offset else 'wb')
+    try:
+        if offset:
+            f.seek(offset)
+        else:
+            _preallocate(f.fileno(), totalSize, cfg.preallocate)
+    except Exception:
+        f.close()
+        raise
+    return f, h
+
+
+def _getSafeFileName(path: str) -> str:
+    """Get safe file name that does not duplicate with exist files."""
+    if not os.path.exists(path):
+        return path
+    name, ext = os.path.splitext(path)
+    for i in range(10):
+        path = f'{name}-{i}{ext}'
+        if not os.path.exists(path):
+            return path
+    return f'{name}-{random.randint(10, 100000)}{ext}'
+
+
 class DownloadTaskResult:
     """Defines result of a download task."""
 
     def __init__(
         self, fileInfo: FileInfo, result: bool, msg: str, i: int, md5: str,
         e: Exception,
-        requestTime: timedelta, downloadTime: timedelta,
+        requestTime: timedelta, downloadTime: timedelta, path: str = '', exportMime: str = '',
     ) -> None:
         self.__file = fileInfo
         self.__result = result
@@ -83,6 +425,8 @@ class DownloadTaskResult:
         self.__e = e
         self.__requestTime = requestTime
         self.__downloadTime = downloadTime
+        self.__path = path
+        self.__exportMime = exportMime
 
     @property
     def file(self) -> FileInfo:
@@ -124,6 +468,107 @@ class DownloadTaskResult:
         """Get total download time. """
         return self.__downloadTime
 
+    @property
+    def path(self) -> str:
+        """Get full path of downloaded file, empty if download failed."""
+        return self.__path
+
+    @property
+    def exportMime(self) -> str:
+        """Get MIME type the file is exported as, empty if file is not exported."""
+        return self.__exportMime
+
+
+def _receiveFail(
+    file: FileInfo, i: int, e: Exception, journal: _PartJournal, offset: int, resumable: bool,
+    requestTime: timedelta,
+) -> DownloadTaskResult:
+    """Save offset of interrupted download to journal, so it can be resumed, and make result."""
+    if resumable and (offset > 0):
+        # Written data has been flushed when file closed
+        journal.save(offset)
+    message = 'Download stalled' if isinstance(e, StallError) else 'Download unexpected exception'
+    return DownloadTaskResult(file, False, message, i, '', e, requestTime, timedelta())
+
+
+def _finalize(
+    file: FileInfo, md5Hash: str, i: int, fullPath: str, partPath: str,
+    journal: _PartJournal, useExportMime: str, fileExt: str,
+    requestTime: timedelta, downloadTime: timedelta,
+    index: LocalIndex | None, hashCache: HashCache | None,
+) -> DownloadTaskResult:
+    """Check MD5 of downloaded partial file and move it to final path."""
+    journal.remove()
+    if file.md5 and (md5Hash != file.md5):
+        os.unlink(partPath)
+        return DownloadTaskResult(
+            file, False, 'MD5 not match', i, md5Hash, None, requestTime, downloadTime)
+    if index:
+        path = index.reserve(fullPath, fileExt if useExportMime else '')
+    else:
+        path = _getSafeFileName(fullPath)
+        if useExportMime and (not path.endswith(fileExt)):
+            path += fileExt
+    os.replace(partPath, path)
+    setFileTime(path, file.mtime, file.atime)
+    stat = os.stat(path)
+    if index:
+        index.add(path, stat)
+    if hashCache:
+        # Verified hash of downloaded file, next check will not read it again
+        hashCache.put(path, md5Hash, stat)
+    return DownloadTaskResult(
+        file, True, '', i, md5Hash, None, requestTime, downloadTime, path, useExportMime)
+
+
+def _materialize(
+    file: FileInfo, i: int, source: str, verify: bool, outputRootPath: str, createdDirs: Set[str],
+    hardlink: bool, index: LocalIndex | None, hashCache: HashCache | None,
+) -> DownloadTaskResult:
+    """Create file by linking or copying local file of the same content instead of downloading.
+     :param source: path of local file has the same MD5 and size as `file`.
+     :param verify: check MD5 of source before linking.
+     :param createdDirs: folders have been created, see `_makeDirs`.
+     :param hardlink: allow hardlink, only used when source has the same modified and access
+        time.
+    """
+    startTime = datetime.now()
+    fullPath = os.path.join(outputRootPath, file.path)
+    partPath = f'{fullPath}.{file.id}.part'
+    journal = _PartJournal(file, partPath)
+    try:
+        _makeDirs(os.path.dirname(fullPath), createdDirs)
+        stat = os.stat(source)
+        if stat.st_size != file.size:
+            return DownloadTaskResult(
+                file, False, 'Dedup source changed', i, '', None, timedelta(), timedelta())
+        if verify:
+            m = hashCache.get(source, stat) if hashCache else ''
+            if not m:
+                m = fileMd5(source)
+                if hashCache:
+                    hashCache.put(source, m, stat)
+            if m != file.md5:
+                return DownloadTaskResult(
+                    file, False, 'Dedup source changed', i, m, None, timedelta(), timedelta())
+        if os.path.exists(partPath):
+            os.unlink(partPath)
+        # Hardlinked files share file time, so setting time of one must not change the other
+        method = linkFile(
+            source, partPath,
+            hardlink and (stat.st_mtime == file.mtime.timestamp()) and \
+            (stat.st_atime == file.atime.timestamp()))
+        if method != 'hardlink':
+            # Reading source updates its access time, restore it so source still matches its stat
+            os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    except Exception as e:
+        return DownloadTaskResult(
+            file, False, 'Link unexpected exception', i, '', e, timedelta(),
+            datetime.now() - startTime)
+    return _finalize(
+        file, file.md5, i, fullPath, partPath, journal, '', '', timedelta(),
+        datetime.now() - startTime, index, hashCache)
+
 
 class Downloader:
     """Perform downloading by given google OAuth key and url."""
@@ -131,12 +576,49 @@ class Downloader:
     RequireAuth = False
     """Require to re-auth."""
 
-    def __init__(self, authKey: str, outputRootPath: str, maxTask: int = 8) -> None:
+    def __init__(
+        self, authKey: str, outputRootPath: str, maxTask: int = 8, cfg: Config | None = None,
+        limiter: RateLimiter | None = None, hashCache: HashCache | None = None,
+        index: LocalIndex | None = None,
+    ) -> None:
         self.__authKey = authKey
         self.__status = {}
         self.__outputRootPath = outputRootPath
         self.__maxJobs = maxTask
+        self.__cfg = cfg if cfg else Config()
+        self.__limiter = limiter if limiter else RateLimiter.fromConfig(self.__cfg, maxTask)
+        self.__hashCache = hashCache
+        self.__index = index
+        # Folders have been created, skip `makedirs` on them
+        self.__createdDirs: Set[str] = set()
+        # Write-behind buffers of each worker, reused by all downloads on the worker
+        self.__buffers = local()
+        self.__writerPool = ThreadPoolExecutor(max_workers=maxTask, thread_name_prefix='WB')
+        self.__timeout = (self.__cfg.connectTimeout or None, self.__cfg.readTimeout or None)
+        # Time to first byte of recent requests, slow requests of small files are hedged
+        self.__latency = LatencyTracker.fromConfig(self.__cfg)
+        self.__hedgeCount = 0
+        self.__hedgeLock = Lock()
+        self.__hedgePool = ThreadPoolExecutor(max_workers=maxTask * 2, thread_name_prefix='HG')
         self.__pool = ThreadPoolExecutor(max_workers=maxTask, thread_name_prefix='DW')
+        # Segments run on separated pool, workers waiting for their segments will not deadlock
+        self.__segmentPool = ThreadPoolExecutor(
+            max_workers=self.__cfg.maxSegmentJobs if self.__cfg.maxSegmentJobs > 0 else maxTask,
+            thread_name_prefix='DS')
+        # Shared keep-alive session: all workers borrow connections from the same pool
+        poolSize = self.__cfg.connectionPoolSize if self.__cfg.connectionPoolSize > 0 else maxTask
+        if self.__cfg.hedgeMaxSize > 0:
+            # Hedged requests must not wait for connections held by requests they hedge
+            poolSize += maxTask
+        self.__adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=poolSize, pool_block=self.__cfg.connectionPoolBlock)
+        self.__session = requests.Session()
+        self.__session.mount('https://', self.__adapter)
+        self.__session.mount('http://', self.__adapter)
+        self.__session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'User-Agent': 'GDriveDownloader (gzip)',
+        })
 
     @property
     def status(self) -> Dict[int, _TaskStatus]:
@@ -150,10 +632,40 @@ class Downloader:
         """Get max concurrent jobs."""
         return self.__maxJobs
 
+    @property
+    def connectionStats(self) -> Tuple[int, int]:
+        """Get connection usage of the pooled session.
+         :returns: tuple of (# of sent requests, # of opened connections). Reused connections count
+            is their difference.
+        """
+        requestCount = 0
+        connectionCount = 0
+        pools = self.__adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requestCount += pool.num_requests
+            connectionCount += pool.num_connections
+        return requestCount, connectionCount
+
+    @property
+    def hedgeCount(self) -> int:
+        """Get # of sent hedged requests."""
+        return self.__hedgeCount
+
     def resetAuthKey(self, authKey: str):
         """Reset OAuth key."""
         self.__authKey = authKey
 
+    def close(self):
+        """Wait for all tasks and release workers and connections."""
+        self.__pool.shutdown(wait=True)
+        self.__segmentPool.shutdown(wait=True)
+        self.__writerPool.shutdown(wait=True)
+        self.__hedgePool.shutdown(wait=True)
+        self.__session.close()
+
     def download(
         self, file: FileInfo, useExportMime: str = '', fileExt: str = '', i: int = 0
     ) -> Future[DownloadTaskResult]:
@@ -166,10 +678,21 @@ class Downloader:
          :param i: index of given file in all file list. This is for fast update download result
             back to csv.
         """
-        fullPath = os.path.join(self.__outputRootPath, file.path)
-        os.makedirs(os.path.dirname(fullPath), exist_ok=True)
         return self.__pool.submit(self.__downloadImpl, file, useExportMime, fileExt, i)
 
+    def link(
+        self, file: FileInfo, source: str, verify: bool = True, i: int = 0
+    ) -> Future[DownloadTaskResult]:
+        """Create file from local file of the same content instead of downloading it.
+         :param file: google drive file info.
+         :param source: path of local file has the same MD5 and size.
+         :param verify: check MD5 of source before linking.
+         :param i: index of given file in all file list, same as `download`.
+        """
+        return self.__pool.submit(
+            _materialize, file, i, source, verify, self.__outputRootPath, self.__createdDirs,
+            self.__cfg.dedupHardlink, self.__index, self.__hashCache)
+
     def __downloadImpl(
         self, file: FileInfo, useExportMime: str, fileExt: str, i: int
     ) -> DownloadTaskResult:
@@ -182,86 +705,246 @@ class Downloader:
         status = self.status[thread.ident]
         status.setTask(file.name, 0)
 
-        url = f'https://www.googleapis.com/drive/v3/files/{file.id}?alt=media' \
-            if not file.exportLinks else file.exportLinks[useExportMime]
-
+        url = _mediaUrl(self.__cfg, file, useExportMime)
+        # Only binary files can be resumed, exported files do not support range request
+        fullPath = os.path.join(self.__outputRootPath, file.path)
+        _makeDirs(os.path.dirname(fullPath), self.__createdDirs)
+        # Each export type of a document has its own partial file
+        partPath = f'{fullPath}.{file.id}{fileExt}.part'
+        journal = _PartJournal(file, partPath)
+        offset = journal.load() if not file.exportLinks else 0
+        if (not file.exportLinks) and (self.__cfg.segmentThreshold > 0) and \
+            (file.size >= self.__cfg.segmentThreshold):
+            return self.__downloadSegmented(file, i, status, fullPath, partPath, journal)
+
+        with self.__limiter.slot():
+            return self.__downloadStream(
+                file, useExportMime, fileExt, i, status, url, fullPath, partPath, journal, offset)
+
+    def __downloadStream(
+        self, file: FileInfo, useExportMime: str, fileExt: str, i: int, status: _TaskStatus,
+        url: str, fullPath: str, partPath: str, journal: '_PartJournal', offset: int,
+    ) -> DownloadTaskResult:
+        """Download file by single streaming request, resume from `offset` if possible."""
         # Request download, max retry 5 times
         for retry in range(5):
-            startTime = datetime.now()
             # Wait if require auth
             self.__waitAuth()
+            self.__limiter.acquire()
+            startTime = datetime.now()
             try:
                 status.setMessage('')
-                resp = requests.get(
-                    url=url,
-                    headers={
-                        'Authorization': 'Bearer ' + self.__authKey,
-                        'Accept-Encoding': 'gzip, deflate',
-                        'User-Agent': 'GDriveDownloader (gzip)',
-                    },
-                    stream=True)
+                resp = self.__request(
+                    url, _requestHeaders(self.__authKey, offset),
+                    file.size <= self.__cfg.hedgeMaxSize)
                 if resp.status_code == 401:
                     # need reauth
                     status.setMessage('Wait ReAuth')
                     Downloader.RequireAuth = True
                     print(f'(Retry {retry}) {file.name} need reauth: {resp.text}')
+                    resp.close()
                     self.__waitAuth()
                     continue
-                elif resp.status_code == 429:
-                    # rate limiter
+                elif _isRateLimited(resp):
+                    # rate limiter: all workers backoff together
                     status.setMessage('Wait RateLimiter')
-                    print(f'(Retry {retry}) {file.name} rate limiter: {resp.text}')
-                    time.sleep(120)
+                    delay = self.__limiter.onThrottle(
+                        parseRetryAfter(resp.headers.get('retry-after')))
+                    print(
+                        f'(Retry {retry}) {file.name} rate limiter, wait {delay:.1f}s: {resp.text}')
+                    resp.close()
                     continue
-                    # TODO: add status message to hint waiting rate limiter, or just exit
-                elif resp.status_code != 200:
+                elif resp.status_code == 416:
+                    # Partial file is invalid, restart from beginning
+                    resp.close()
+                    journal.remove()
+                    offset = 0
+                    continue
+                elif resp.status_code not in (200, 206):
                     # unknown error
-                    try:
-                        msg = resp.json()['error']['message']
-                    except (requests.exceptions.JSONDecodeError, KeyError):
-                        msg = resp.text
+                    msg = _errorMessage(resp)
+                    resp.close()
+                    status.setComplete()
                     return DownloadTaskResult(
                         file, False, f'Request file fail: {msg}',
                         i, '', None, timedelta(), timedelta())
-                totalSize = int(resp.headers.get('content-length', file.size))
-                status.setTask(file.name, totalSize)
+                offset, totalSize, resumable = _responseRange(file, resp, offset)
+                status.setTask(file.name, totalSize, offset)
                 requestTime = datetime.now()
+                self.__limiter.onSuccess((requestTime - startTime).total_seconds())
+                self.__latency.add((requestTime - startTime).total_seconds())
+                break
             except Exception as e:
                 status.setComplete()
                 return DownloadTaskResult(
                     file, False, 'Request unexpected exception', i, '', e, timedelta(), timedelta())
+        else:
+            status.setComplete()
+            return DownloadTaskResult(
+                file, False, 'Request retry exceeded', i, '', None, timedelta(), timedelta())
 
-        path = self.__getSafeFileName(os.path.join(self.__outputRootPath, file.path))
-        if useExportMime and (not path.endswith(fileExt)):
-            path += fileExt
         try:
             # Download & computer MD5
-            h = hashlib.md5()
-            with open(path, 'wb') as f:
-                f.truncate(totalSize)
-                for data in resp.iter_content(8192):
-                    size = f.write(data)
-                    status.update(size)
-                    h.update(data)
+            f, h = _openPartFile(partPath, offset, totalSize, self.__cfg)
+            journalOffset = offset
+            with resp, f:
+                startOffset = offset
+                monitor = StallMonitor.fromConfig(self.__cfg)
+                writer = _WriteBehind(f, h, self.__getBuffers(), self.__writerPool)
+                try:
+                    encoded = resp.headers.get('content-encoding', 'identity') != 'identity'
+                    for size in _receive(resp.raw, writer, encoded):
+                        offset += size
+                        status.update(size)
+                        monitor.update(size)
+                        if resumable and \
+                            (offset - journalOffset >= self.__cfg.resumeJournalInterval):
+                            writer.flush()
+                            # Bytes in the buffer being filled are not written yet
+                            journalOffset = startOffset + writer.written
+                            journal.save(journalOffset)
+                finally:
+                    error = writer.close()
+                    # Only written bytes can be resumed
+                    offset = startOffset + writer.written
+                if error:
+                    raise error
+                # Content length may differ from decoded size
+                f.truncate(offset)
             downloadTime = datetime.now()
         except Exception as e:
             status.setComplete()
-            return DownloadTaskResult(
-                file, False, 'Download unexpected exception', i, '', e,
-                requestTime - startTime, timedelta())
+            return _receiveFail(file, i, e, journal, offset, resumable, requestTime - startTime)
 
-        # Check MD5
-        md5 = h.hexdigest()
         status.setComplete()
-        if file.md5 and (md5 != file.md5):
-            os.unlink(path)
-            return DownloadTaskResult(
-                file, False, 'MD5 not match', i, md5, None,
-                requestTime - startTime, downloadTime - requestTime)
-        setFileTime(path, file.mtime, file.atime)
-        return DownloadTaskResult(
-            file, True, '', i, md5, None,
-            requestTime - startTime, downloadTime - requestTime)
+        return _finalize(
+            file, h.hexdigest(), i, fullPath, partPath, journal, useExportMime, fileExt,
+            requestTime - startTime, downloadTime - requestTime, self.__index, self.__hashCache)
+
+    def __downloadSegmented(
+        self, file: FileInfo, i: int, status: _TaskStatus, fullPath: str, partPath: str,
+        journal: _PartJournal,
+    ) -> DownloadTaskResult:
+        """Download large file by concurrent range requests.
+        Each segment is written into preallocated partial file by positional write, and MD5 is
+        verified once after all segments are completed.
+        """
+        url = _mediaUrl(self.__cfg, file, '')
+        segmentSize = self.__cfg.segmentSize
+        journal.load()
+        completed = set(journal.segments)
+        starts = [s for s in range(0, file.size, segmentSize) if s not in completed]
+        status.setTask(
+            file.name, file.size, sum(min(segmentSize, file.size - s) for s in completed))
+        lock = Lock()
+        startTime = datetime.now()
+
+        def __fetch(fd: int, start: int):
+            """Download single segment and write to its position."""
+            end = min(start + segmentSize, file.size) - 1
+            with self.__limiter.slot():
+                for _ in range(5):
+                    self.__waitAuth()
+                    self.__limiter.acquire()
+                    requestTime = time.monotonic()
+                    resp = self.__session.get(
+                        url=url, stream=True, timeout=self.__timeout,
+                        headers={
+                            'Authorization': 'Bearer ' + self.__authKey,
+                            'Range': f'bytes={start}-{end}',
+                            'Accept-Encoding': 'identity',
+                        })
+                    if not _isRateLimited(resp):
+                        break
+                    resp.close()
+                    self.__limiter.onThrottle(parseRetryAfter(resp.headers.get('retry-after')))
+                with resp:
+                    if resp.status_code == 401:
+                        Downloader.RequireAuth = True
+                    if resp.status_code != 206:
+                        raise requests.exceptions.HTTPError(
+                            f'Segment {start}-{end} fail with status {resp.status_code}',
+                            response=resp)
+                    self.__limiter.onSuccess(time.monotonic() - requestTime)
+                    pos = start
+                    monitor = StallMonitor.fromConfig(self.__cfg)
+                    for data in resp.iter_content(self.__cfg.downloadChunkSize):
+                        pos += _pwrite(fd, data, pos, lock)
+                        status.update(len(data))
+                        monitor.update(len(data))
+                    if pos != end + 1:
+                        raise IOError(f'Segment {start}-{end} incomplete, got {pos - start} bytes')
+            with lock:
+                completed.add(start)
+                journal.save(0, sorted(completed))
+
+        status.setMessage('Segmented')
+        with open(partPath, 'ab') as f:
+            _preallocate(f.fileno(), file.size, self.__cfg.preallocate)
+        fd = os.open(partPath, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        try:
+            futures = [self.__segmentPool.submit(__fetch, fd, start) for start in starts]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            exceptions = [f.exception() for f in done if f.exception()]
+            if exceptions:
+                # Cancel pending segments, completed ones have been recorded in journal
+                for future in futures:
+                    future.cancel()
+                wait(futures)
+                status.setComplete()
+                return DownloadTaskResult(
+                    file, False, 'Download unexpected exception', i, '', exceptions[0],
+                    timedelta(), datetime.now() - startTime)
+        finally:
+            os.close(fd)
+        downloadTime = datetime.now()
+
+        status.setMessage('Verify')
+        md5Hash = fileMd5(partPath, self.__cfg.md5ChunkSize)
+        status.setComplete()
+        return _finalize(
+            file, md5Hash, i, fullPath, partPath, journal, '', '',
+            timedelta(), downloadTime - startTime, self.__index, self.__hashCache)
+
+    def __request(self, url: str, headers: Dict[str, str], hedge: bool) -> requests.Response:
+        """Send streaming GET request.
+        If `hedge`, a duplicate request is sent once response is slower than most recent ones,
+        the first response is taken and the other one is closed.
+        """
+        delay = self.__latency.delay() if hedge else None
+        if delay is None:
+            return self.__session.get(
+                url=url, headers=headers, stream=True, timeout=self.__timeout)
+        futures = [self.__hedgePool.submit(
+            self.__session.get, url=url, headers=headers, stream=True, timeout=self.__timeout)]
+        done, _ = wait(futures, timeout=delay)
+        # Hedged request should not exceed rate limit, skip it if no token now
+        if (not done) and (self.__limiter.tryAcquire() <= 0):
+            with self.__hedgeLock:
+                self.__hedgeCount += 1
+            futures.append(self.__hedgePool.submit(
+                self.__session.get, url=url, headers=headers, stream=True, timeout=self.__timeout))
+        pending = futures
+        winner = None
+        while pending and (winner is None):
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in done if f.exception() is None), None)
+        for future in futures:
+            if future is not winner:
+                future.add_done_callback(_closeResponse)
+        if winner is None:
+            raise futures[0].exception()
+        return winner.result()
+
+    def __getBuffers(self) -> List[bytearray]:
+        """Get write-behind buffers of current worker."""
+        buffers = getattr(self.__buffers, 'buffers', None)
+        if buffers is None:
+            buffers = [
+                bytearray(self.__cfg.downloadChunkSize)
+                for _ in range(self.__cfg.writeBehindBuffers)]
+            self.__buffers.buffers = buffers
+        return buffers
 
     def __waitAuth(self, maxWaitTime: float = 3600):
         """Wait for reauth."""
@@ -270,14 +953,3 @@ class Downloader:
             time.sleep(2)
             if (datetime.now() - now).seconds > maxWaitTime:
                 break
-
-    def __getSafeFileName(self, path: str) -> str:
-        """Get safe file name that does not duplicate with exist files."""
-        if not os.path.exists(path):
-            return path
-        name, ext = os.path.splitext(path)
-        for i in range(10):
-            path = f'{name}-{i}{ext}'
-            if not os.path.exists(path):
-                return path
-        return f'{name}-{random.randint(10, 100000)}{ext}'
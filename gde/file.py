@@ -1,12 +1,53 @@
 # -*- coding: utf-8 -*-
 from cmath import isnan
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from enum import Enum
-from typing import Dict, List
+from typing import Dict, List, Sequence
 import hashlib
 import json
 import os
+import shutil
+import sys
+import time
+from threading import local
 from dateutil.parser import parse
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+_buffers = local()
+"""Reusable read buffer of each thread for computing hash."""
+
+_FICLONE = 0x40049409
+"""Linux ioctl request to clone file content by reflink."""
+
+_Epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_Microsecond = timedelta(microseconds=1)
+
+
+def parseTime(v: str) -> datetime:
+    """Parse RFC 3339 timestamp returned by Drive API (e.g. `2022-01-02T03:04:05.678Z`) or
+    written by `datetime.isoformat`. Other formats fallback to dateutil.
+    """
+    try:
+        return datetime.fromisoformat(v[:-1] + '+00:00' if v.endswith('Z') else v)
+    except ValueError:
+        return parse(v)
+
+
+def _toMicros(v: str | datetime | int) -> int:
+    """Convert timestamp string or datetime to microseconds since epoch.
+    Naive datetime is treated as UTC.
+    """
+    if isinstance(v, int):
+        return v
+    if isinstance(v, str):
+        v = parseTime(v)
+    if v.tzinfo is None:
+        v = v.replace(tzinfo=timezone.utc)
+    return (v - _Epoch) // _Microsecond
 
 
 class FileType(Enum):
@@ -28,12 +69,22 @@ class FileInfo:
 
     Note: shared drives does not return `ownedByMe` field, so set default value to True for
     supporting download.
+
+    Instances are kept for every file of all drives, so fields are stored compactly in slots:
+    timestamps are microseconds since epoch and converted to `datetime` on access, MIME type and
+    drive Id are interned.
     """
 
+    __slots__ = (
+        '__id', '__name', '__owned', '__parents', '__driveId', '__md5', '__size', '__ctime',
+        '__mtime', '__atime', '__mime', '__exportLinks', '__trashed', '__path', '__type',
+    )
+
     def __init__(self,
         # pylint: disable=redefined-builtin
         id: str, name: str, mimeType: str,
-        createdTime: str, modifiedTime: str, viewedByMeTime: str = '',
+        createdTime: str | datetime | int, modifiedTime: str | datetime | int,
+        viewedByMeTime: str | datetime | int = '',
         parents: List[str] = None, ownedByMe: bool = True,
         size: int = 0, md5Checksum: str = '', exportLinks: Dict[str, str] = None,
         trashed: bool = False, driveId: str = '', **kwargs
@@ -41,15 +92,17 @@ class FileInfo:
         self.__id = id
         self.__name = name
         self.__owned = ownedByMe
+        # JSON string read back from manifest is decoded on first access
         self.__parents = parents if parents else []
-        self.__driveId = driveId
+        self.__driveId = sys.intern(driveId) if driveId else ''
         self.__md5 = md5Checksum
-        self.__size = size
-        self.__ctime = parse(createdTime) if isinstance(createdTime, str) else createdTime
-        self.__mtime = parse(modifiedTime) if isinstance(modifiedTime, str) else modifiedTime
-        self.__atime = parse(viewedByMeTime) \
-            if isinstance(viewedByMeTime, str) and (viewedByMeTime != '') else datetime.utcnow()
-        self.__mime = mimeType
+        # Drive API returns size as string
+        self.__size = int(size) if size else 0
+        self.__ctime = _toMicros(createdTime)
+        self.__mtime = _toMicros(modifiedTime)
+        self.__atime = _toMicros(viewedByMeTime) \
+            if viewedByMeTime != '' else time.time_ns() // 1000
+        self.__mime = sys.intern(mimeType)
         self.__exportLinks = exportLinks
         self.__trashed = trashed
         self.__path = kwargs['path'] if 'path' in kwargs else ''
@@ -58,11 +111,36 @@ class FileInfo:
             self.__type = FileType.LINK
         elif mimeType == 'application/vnd.google-apps.folder':
             self.__type = FileType.FOLDER
-        # Fix type when read back from CSV
-        if isinstance(self.__exportLinks, str):
-            self.__exportLinks = json.loads(self.__exportLinks) if self.__exportLinks else None
-        if isinstance(self.__parents, str):
-            self.__parents = json.loads(self.__parents) if self.__parents else None
+
+    @staticmethod
+    def fromRecords(columns: List[str], rows: Sequence[Sequence]) -> List['FileInfo']:
+        """Build file info of rows in bulk, e.g. rows loaded from manifest.
+        Rows are transposed and converted column by column, then passed to constructor by
+        position instead of building a dict of each row.
+
+         :param columns: column names of rows, same as constructor parameters and `path`.
+        """
+        if not rows:
+            return []
+        data = dict(zip(columns, zip(*rows)))
+        n = len(rows)
+        for c in ('createdTime', 'modifiedTime', 'viewedByMeTime'):
+            if c in data:
+                data[c] = [_toMicros(v) if v else v for v in data[c]]
+        if 'size' in data:
+            data['size'] = [int(v) if v else 0 for v in data['size']]
+        defaults = {
+            'viewedByMeTime': '', 'parents': None, 'ownedByMe': True, 'size': 0,
+            'md5Checksum': '', 'exportLinks': None, 'trashed': False, 'driveId': '', 'path': '',
+        }
+        args = [
+            data[c] if c in data else [defaults[c]] * n
+            for c in (
+                'id', 'name', 'mimeType', 'createdTime', 'modifiedTime', 'viewedByMeTime',
+                'parents', 'ownedByMe', 'size', 'md5Checksum', 'exportLinks', 'trashed',
+                'driveId', 'path')
+        ]
+        return [FileInfo(*values[:-1], path=values[-1]) for values in zip(*args)]
 
     @property
     def id(self) -> str:
@@ -96,21 +174,23 @@ class FileInfo:
     @property
     def ctime(self) -> datetime:
         """Get create time of this file."""
-        return self.__ctime
+        return _Epoch + self.__ctime * _Microsecond
 
     @property
     def mtime(self) -> datetime:
         """Get last modify time of this file."""
-        return self.__mtime
+        return _Epoch + self.__mtime * _Microsecond
 
     @property
     def atime(self) -> datetime:
         """Get last access (by me) time of this file."""
-        return self.__atime
+        return _Epoch + self.__atime * _Microsecond
 
     @property
     def parents(self) -> List[str]:
         """Get list of parent folder (may not ordered)."""
+        if isinstance(self.__parents, str):
+            self.__parents = json.loads(self.__parents) if self.__parents else []
         return self.__parents
 
     @property
@@ -123,6 +203,8 @@ class FileInfo:
         """Get all supported export links.
          For non-exportable files, this value will be None.
         """
+        if isinstance(self.__exportLinks, str):
+            self.__exportLinks = json.loads(self.__exportLinks) if self.__exportLinks else None
         return self.__exportLinks
 
     @property
@@ -168,6 +250,7 @@ class FileInfo:
             'modifiedTime': self.mtime,
             'viewedByMeTime': self.atime,
             'md5Checksum': self.md5,
+            'size': self.size,
             'exportLinks': self.exportLinks,
             'trashed': self.trashed,
             'path': self.path,
@@ -184,19 +267,28 @@ class FileInfo:
 
 def md5(filePath: str, chunkSize: int = 1024 * 1024 * 4) -> str:
     """Compute MD5 hash on given file.
+    File is read into a reusable buffer of current thread, and kernel is hinted to read ahead
+    sequentially if supported.
 
      :param filePath: path to file to compute.
      :param chunkSize: file chunk size. Default is 4MBytes. Note that this value must be multiplier
         of **128 bytes**.
      :returns: hex formatted MD5 hash (digest).
     """
+    buf = getattr(_buffers, 'buf', None)
+    if (buf is None) or (len(buf) != chunkSize):
+        buf = bytearray(chunkSize)
+        _buffers.buf = buf
+    view = memoryview(buf)
     m = hashlib.md5()
-    with open(filePath, 'rb') as f:
+    with open(filePath, 'rb', buffering=0) as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
         while True:
-            data = f.read(chunkSize)
-            if not data:
+            n = f.readinto(buf)
+            if not n:
                 break
-            m.update(data)
+            m.update(view[:n])
     return m.hexdigest()
 
 
@@ -204,3 +296,27 @@ def setFileTime(filePath: str, mtime: datetime, atime: datetime) -> bool:
     """Set file modified time and access time."""
     # atime and mtime
     os.utime(filePath, (atime.timestamp(), mtime.timestamp()))
+
+
+def linkFile(src: str, dst: str, hardlink: bool = True) -> str:
+    """Create `dst` with the same content as `src` without copying data if possible.
+    Hardlink is tried first if allowed, then reflink (copy-on-write clone) on supported file
+    systems, and copy at last. Note that hardlinked files share modified and access time.
+
+     :returns: method used, one of `hardlink`, `reflink` and `copy`.
+    """
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    if fcntl is not None:
+        with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+            try:
+                fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+                return 'reflink'
+            except OSError:
+                pass
+    shutil.copyfile(src, dst)
+    return 'copy'
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timezone
+from fnmatch import fnmatch
+from typing import Any, Dict, List
+import json
+import os
+from .config import Config
+from .file import FileInfo, FileType, parseTime
+
+
+_FolderMime = 'application/vnd.google-apps.folder'
+_ShortcutMime = 'application/vnd.google-apps.shortcut'
+
+
+class FileFilter:
+    """User filter of files to export.
+
+    Filter spec is a dict set by `fileFilter` in `settings.json` or command line options:
+      - folders: only files under given folder paths (glob pattern), e.g. `MyDrive/Photos`.
+      - mimeTypes: only files of given MIME types.
+      - excludeMimeTypes: skip files of given MIME types.
+      - minSize, maxSize: only binary files of given size range in bytes, 0 for no limit.
+      - modifiedAfter, modifiedBefore: only files modified in given time range, e.g.
+        `2023-01-01T00:00:00Z`. Time without timezone is treated as UTC.
+
+    MIME types and modified time are compiled into `q` of `files.list`, folders are always listed
+    so paths can be resolved. Size and folder path can not be expressed in query, they are
+    filtered on client by `match` after path is resolved. `match` checks all conditions, so it is
+    also used for files not listed by query, e.g. changes and files stored in manifest.
+    """
+
+    def __init__(
+        self, folders: List[str] | None = None, mimeTypes: List[str] | None = None,
+        excludeMimeTypes: List[str] | None = None, minSize: int = 0, maxSize: int = 0,
+        modifiedAfter: str = '', modifiedBefore: str = '',
+    ) -> None:
+        """Create filter, see class document for parameters."""
+        self.__folders = [os.path.join(f.rstrip('/' + os.path.sep), '*') for f in folders or []]
+        self.__mimeTypes = set(mimeTypes or [])
+        self.__excludeMimeTypes = set(excludeMimeTypes or [])
+        self.__minSize = minSize
+        self.__maxSize = maxSize
+        self.__modifiedAfter = _toUtc(modifiedAfter) if modifiedAfter else None
+        self.__modifiedBefore = _toUtc(modifiedBefore) if modifiedBefore else None
+
+    @staticmethod
+    def fromConfig(cfg: Config, spec: Dict[str, Any] | None = None) -> 'FileFilter':
+        """Create filter by settings in config.
+         :param spec: filter spec from command line, overrides keys in config.
+        """
+        merged = dict(cfg.fileFilter)
+        merged.update({k: v for k, v in (spec or {}).items() if v})
+        return FileFilter(**merged)
+
+    def __bool__(self) -> bool:
+        """Check if any condition is set."""
+        return bool(self.__folders or self.__mimeTypes or self.__excludeMimeTypes or \
+            self.__minSize or self.__maxSize or self.__modifiedAfter or self.__modifiedBefore)
+
+    @property
+    def signature(self) -> str:
+        """Normalized conditions as string, empty if no condition is set."""
+        return json.dumps([
+            sorted(self.__folders), sorted(self.__mimeTypes), sorted(self.__excludeMimeTypes),
+            self.__minSize, self.__maxSize,
+            _toRfc3339(self.__modifiedAfter) if self.__modifiedAfter else '',
+            _toRfc3339(self.__modifiedBefore) if self.__modifiedBefore else '',
+        ]) if self else ''
+
+    @property
+    def needExportLinks(self) -> bool:
+        """Check if Google documents may pass this filter, i.e. `exportLinks` must be listed."""
+        if not self.__mimeTypes:
+            return True
+        return any(
+            m.startswith('application/vnd.google-apps.') and (m not in (_FolderMime, _ShortcutMime))
+            for m in self.__mimeTypes)
+
+    def query(self) -> str:
+        """Compile conditions can be expressed by Drive query, empty if no such condition.
+        Returned clause is parenthesized and keeps all folders.
+        """
+        clauses = []
+        if self.__mimeTypes:
+            clauses.append(
+                '(' + ' or '.join(f"mimeType = '{_escape(m)}'" for m in sorted(self.__mimeTypes)) +
+                ')')
+        clauses.extend(
+            f"mimeType != '{_escape(m)}'" for m in sorted(self.__excludeMimeTypes)
+            if m != _FolderMime)
+        if self.__modifiedAfter:
+            clauses.append(f"modifiedTime > '{_toRfc3339(self.__modifiedAfter)}'")
+        if self.__modifiedBefore:
+            clauses.append(f"modifiedTime < '{_toRfc3339(self.__modifiedBefore)}'")
+        if not clauses:
+            return ''
+        return f"(mimeType = '{_FolderMime}' or ({' and '.join(clauses)}))"
+
+    def match(self, file: FileInfo) -> bool:
+        """Check if given file passes all conditions. Folders always pass.
+        Path of file must be resolved if folders condition is set.
+        """
+        if file.fileType == FileType.FOLDER:
+            return True
+        if (self.__mimeTypes and (file.mime not in self.__mimeTypes)) or \
+            (file.mime in self.__excludeMimeTypes):
+            return False
+        if (self.__modifiedAfter and (file.mtime <= self.__modifiedAfter)) or \
+            (self.__modifiedBefore and (file.mtime >= self.__modifiedBefore)):
+            return False
+        # Google documents and links do not have size
+        if (file.fileType == FileType.FILE) and (not file.exportLinks) and \
+            ((self.__minSize and (file.size < self.__minSize)) or \
+            (self.__maxSize and (file.size > self.__maxSize))):
+            return False
+        if self.__folders and (not any(fnmatch(file.path, f) for f in self.__folders)):
+            return False
+        return True
+
+
+def _toUtc(v: str) -> datetime:
+    """Parse time of filter spec as aware datetime, naive time is treated as UTC."""
+    t = parseTime(v)
+    return t.replace(tzinfo=timezone.utc) if t.tzinfo is None else t.astimezone(timezone.utc)
+
+
+def _toRfc3339(t: datetime) -> str:
+    """Format UTC datetime as RFC 3339 accepted by Drive query."""
+    return t.strftime('%Y-%m-%dT%H:%M:%S') + (f'.{t.microsecond:06d}' if t.microsecond else '') + \
+        'Z'
+
+
+def _escape(v: str) -> str:
+    """Escape string literal in Drive query."""
+    return v.replace('\\', '\\\\').replace("'", "\\'")
@@ -1,29 +1,77 @@
 # -*- coding: utf-8 -*-
 import atexit
-from concurrent.futures import ThreadPoolExecutor, wait, ALL_COMPLETED
-from datetime import datetime
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+import functools
 import itertools
 import json
 import os
 from pprint import pprint
+from queue import Empty, Queue
+from threading import Lock
 import time
-from typing import Dict, List, Tuple
-import pandas as pd
+from typing import Any, Deque, Dict, Generator, Iterable, List, Set, Tuple
 from tqdm.auto import tqdm
 import colorama as color
+from .asyncdownloader import AsyncDownloader
 from .config import Config
+from .dedup import Deduplicator
 from .downloader import Downloader, DownloadTaskResult, _TaskStatus
 from .file import FileInfo, FileType, md5
+from .filter import FileFilter
 from .google import GoogleDriveClient
+from .hashcache import HashCache
+from .localindex import LocalIndex
+from .manifest import Manifest
+from .pathresolver import PathResolver
+from .ratelimit import RateLimiter
+from .scheduler import Scheduler, fitDuration
+from .verifier import Verifier
 
 
 atexit.register(lambda: print(color.Style.RESET_ALL))
 color.init()
 
 
+def __queryFiles(
+    client: GoogleDriveClient, driveId: str, includeTrashed: bool, sharedType: str,
+    partitioned: bool, cfg: Config, fileFilter: FileFilter | None = None,
+) -> Generator[List[FileInfo], None, None]:
+    """Query blocks of file info by serial paging or partitioned crawl.
+    Partitioned crawl is ignored when fetching *My Drive* with shared files, since shared files may
+    not be reachable from root folder. Files are filtered by conditions of `fileFilter` which can
+    be expressed in query only.
+    """
+    fields = __listFields(fileFilter, includeTrashed, sharedType)
+    if partitioned and (driveId or (sharedType == 'owned')):
+        return client.queryFilesPartitioned(
+            driveId, trashed=includeTrashed, pageSize=cfg.queryFileInfoPageSize,
+            sharedType=sharedType, maxWorkers=cfg.listFolderJobs, batchSize=cfg.listFolderBatch,
+            fileFilter=fileFilter, fields=fields)
+    return client.queryFiles(
+        driveId, trashed=includeTrashed, pageSize=cfg.queryFileInfoPageSize,
+        sharedType=sharedType, fileFilter=fileFilter, fields=fields)
+
+
+def __listFields(
+    fileFilter: FileFilter | None, includeTrashed: bool, sharedType: str, changes: bool = False,
+) -> str:
+    """Get fields mask of listed files required by current mode.
+    Trashed and owner flags are known when they are filtered by query, but changes are not
+    filtered by query so both flags are always listed for changes. MD5 is always listed even with
+    `--noMd5`, since file info is saved to manifest and used by later runs.
+    """
+    return GoogleDriveClient.fileFields(
+        exportLinks=(not fileFilter) or fileFilter.needExportLinks,
+        trashed=changes or includeTrashed,
+        ownedByMe=changes or (sharedType != 'owned'))
+
+
 def __fetchFileInfo(
     client: GoogleDriveClient, driveId: str, driveName: str, includeTrashed: bool,
-    sharedType: str, cfg: Config
+    sharedType: str, cfg: Config, partitioned: bool = False,
+    fileFilter: FileFilter | None = None,
 ) -> Tuple[List[FileInfo], Dict[str, FileInfo]]:
     """Fetch file info from google drive.
     All file info will write to *fileInfo.csv* under given `outputRoot`.
@@ -33,6 +81,9 @@ def __fetchFileInfo(
      :param driveId: drive Id. Use emtpy string to fetch *My Drive*.
      :param includeTrashed: also fetch trashed files.
      :param cfg: config of this flow.
+     :param partitioned: crawl folders concurrently. This is ignored when fetching *My Drive*
+        with shared files, since shared files may not be reachable from root folder.
+     :param fileFilter: user filter, only conditions expressed in query are applied.
      :returns: Tuple of:
           - All fetched file info list.
           - All folder id to name mapping table.
@@ -41,9 +92,8 @@ def __fetchFileInfo(
     folderTable: Dict[str, FileInfo] = {}
     fileList: List[FileInfo] = []
     startTime = datetime.now()
-    for files in client.queryFiles(
-        driveId, trashed=includeTrashed, pageSize=cfg.queryFileInfoPageSize,
-        sharedType=sharedType,
+    for files in __queryFiles(
+        client, driveId, includeTrashed, sharedType, partitioned, cfg, fileFilter
     ):
         for file in files:
             fileList.append(file)
@@ -55,35 +105,140 @@ def __fetchFileInfo(
     return fileList, folderTable
 
 
+def __toRow(file: FileInfo, action: str, status: str, message: str) -> Tuple:
+    """Convert file info and action to manifest row, in order of `Manifest.Columns`.
+    Rows are generated while saving to manifest, so all rows are not kept in memory.
+    """
+    return (
+        file.id, file.name, file.mime, json.dumps(file.parents) if file.parents else '',
+        file.driveId, file.ctime.isoformat(), file.mtime.isoformat(), file.atime.isoformat(),
+        file.md5, file.size, json.dumps(file.exportLinks) if file.exportLinks else '',
+        file.trashed, file.path, file.fileType.value, file.owned, action, status, message, '')
+
+
+def __fetchFileInfoIncremental(
+    client: GoogleDriveClient, driveId: str, driveName: str, pageToken: str,
+    includeTrashed: bool, sharedType: str, cfg: Config, fileFilter: FileFilter | None = None,
+) -> Tuple[Dict[str, FileInfo | None], str]:
+    """Fetch changes since previous run.
+
+     :param client: initialized GoogleDriveClient instance.
+     :param driveId: drive Id. Use emtpy string to fetch *My Drive*.
+     :param driveName: drive name.
+     :param pageToken: page token saved in previous run.
+     :param includeTrashed: also fetch trashed files.
+     :param sharedType: fetch files with owner filter.
+     :param cfg: config of this flow.
+     :param fileFilter: user filter, only decides listed fields. Changes are filtered after path
+        is resolved.
+     :returns: Tuple of:
+          - Map from changed file id to its file info, None if the file is removed or not in list
+            scope any more. Path of each file is not resolved.
+          - Page token for next run.
+    """
+    startTime = datetime.now()
+    changes, newPageToken = client.queryChanges(
+        pageToken, driveId, cfg.queryFileInfoPageSize,
+        __listFields(fileFilter, includeTrashed, sharedType, changes=True))
+    changeTable: Dict[str, FileInfo | None] = {}
+    for fileId, file in changes:
+        # Keep the same filter as listing files
+        if (file is None) or (file.trashed and (not includeTrashed)) or \
+            ((not driveId) and (sharedType == 'owned') and (not file.owned)) or \
+            ((not driveId) and (sharedType == 'shared') and file.owned):
+            changeTable[fileId] = None
+        else:
+            changeTable[fileId] = file
+    print(f'Fetch {driveName} {len(changes)} changes time: {datetime.now() - startTime}')
+    return changeTable, newPageToken
+
+
+def __fetchDrive(
+    client: GoogleDriveClient, driveId: str, driveName: str, outputRoot: str, manifest: Manifest,
+    includeTrashed: bool, sharedType: str, incremental: bool, partitioned: bool, cfg: Config,
+    fileFilter: FileFilter | None = None,
+) -> Tuple[List[FileInfo], Dict[str, FileInfo], Dict[str, FileInfo | None] | None, str]:
+    """Fetch file info of given drive, by changes since previous run if `incremental` is set.
+     :returns: Tuple of:
+          - All file info list. Empty if changes are fetched.
+          - All folder id to name mapping table. Empty if changes are fetched.
+          - Changes since previous run, see `__fetchFileInfoIncremental`. None if all files are
+            fetched.
+          - Page token for next run.
+    """
+    tokenPath = os.path.join(outputRoot, driveName) + '.token'
+    scope = __listScope(fileFilter, includeTrashed, sharedType, cfg.preferExportType)
+    pageToken = __loadPageToken(tokenPath, driveId, scope) \
+        if incremental and manifest.hasDrive(driveId) else ''
+    if pageToken:
+        changes, pageToken = __fetchFileInfoIncremental(
+            client, driveId, driveName, pageToken, includeTrashed, sharedType, cfg, fileFilter)
+        return [], {}, changes, pageToken
+    # Get token before listing, so changes during listing are not missed
+    pageToken = client.queryStartPageToken(driveId)
+    fileList, folderTable = __fetchFileInfo(
+        client, driveId, driveName, includeTrashed, sharedType, cfg, partitioned, fileFilter)
+    return fileList, folderTable, None, pageToken
+
+
+def __listScope(
+    fileFilter: FileFilter | None, includeTrashed: bool, sharedType: str,
+    exportTypes: Dict[str, List[str]],
+) -> str:
+    """Options deciding which files and actions are saved to manifest. Changes since previous run
+    are only valid if files were listed and checked by the same scope.
+    """
+    return json.dumps(
+        [fileFilter.signature if fileFilter else '', includeTrashed, sharedType, exportTypes],
+        sort_keys=True)
+
+
+def __loadPageToken(tokenPath: str, driveId: str, scope: str) -> str:
+    """Load changes page token of given drive saved in previous run. Return empty if not exist or
+    saved by different list scope.
+    """
+    try:
+        with open(tokenPath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data['startPageToken'] \
+            if (data['driveId'] == driveId) and (data.get('scope') == scope) else ''
+    except (IOError, ValueError, KeyError):
+        return ''
+
+
+def __savePageToken(tokenPath: str, driveId: str, pageToken: str, scope: str):
+    """Save changes page token of given drive and its list scope for incremental sync in next
+    run.
+    """
+    with open(tokenPath, 'w', encoding='utf-8') as f:
+        json.dump({'driveId': driveId, 'startPageToken': pageToken, 'scope': scope}, f)
+
+
 def __checkFile(
     file: FileInfo, outputRoot: str, noMd5: bool, sharedType: str,
-) -> Tuple[bool, Dict[str, str], FileInfo, int, int, int, int, int]:
+    hashCache: HashCache | None = None, verifier: Verifier | None = None,
+    index: LocalIndex | None = None,
+    exports: Dict[Tuple[str, str], Tuple[str, str, str, int, int]] | None = None,
+    exportTypes: Dict[str, List[str]] | None = None,
+) -> Tuple[List[str], Tuple[str, str, str], FileInfo, int, int, int, int, int]:
     """Check if given file requires to download.
      :param sharedType: fetch files with owner filter.
         - both: include both shared with me and owned by me.
         - owned: only owned by me.
         - shared: only shared with me.
+     :param hashCache: cache of local file MD5, files not changed since last check are not read.
+     :param verifier: engine to compute MD5 of local file.
+     :param index: index of local files, stat files from memory instead of file system.
+     :param exports: exported files recorded in manifest, see `Manifest.loadExports`.
+     :param exportTypes: preferred export MIME types of each Google document type.
      :returns: tuple of:
-        - Need download or not.
-        - File as Dict.
+        - Export MIME types to download, `['']` for binary file, empty if no need to download.
+        - (action, status, message) of the file saved to manifest.
         - FileInfo instance. The same as input parameter.
         - LinkCount, FolderCount, ExportCount, FileCount, NoChangeCount
     """
 
-    def __toDict(file: FileInfo, action: str, status: str, message: str) -> Dict[str, str]:
-        """Convert file info and action to dict."""
-        d = file.asDict()
-        d['exportLinks'] = json.dumps(file.exportLinks) if file.exportLinks else ''
-        d['parents'] = json.dumps(file.parents) if file.parents else ''
-        d['createdTime'] = file.ctime.isoformat()
-        d['modifiedTime'] = file.mtime.isoformat()
-        d['viewedByMeTime'] = file.atime.isoformat()
-        d['action'] = action
-        d['status'] = status
-        d['message'] = message
-        return d
-
-    needDownload = False
+    tasks: List[str] = []
     linkCount = 0
     folderCount = 0
     exportCount = 0
@@ -92,53 +247,115 @@ def __checkFile(
     # Check file type and status
     if file.fileType == FileType.LINK:
         linkCount += 1
-        data = __toDict(file, 'Skip', 'Skip', 'File is Link')
+        state = ('Skip', 'Skip', 'File is Link')
     elif file.fileType == FileType.FOLDER:
         folderCount += 1
-        data = __toDict(file, 'Skip', 'Skip', '')
+        state = ('Skip', 'Skip', '')
     elif file.exportLinks:
-        needDownload = True
         exportCount += 1
-        data = __toDict(file, 'Export', 'Pending', 'Need export')
+        exportMimes = exportTypes.get(file.mime, []) if exportTypes else []
+        tasks = [
+            m for m in exportMimes if not __isExported(file, m, outputRoot, exports, index)]
+        if not exportMimes:
+            state = ('Skip', 'Skip', 'No preferred export type')
+        elif not tasks:
+            state = ('Skip', 'OK', 'Export not changed')
+            noChangeCount += 1
+        else:
+            state = ('Export', 'Pending', 'Need export')
     else:
         fileCount += 1
         path = os.path.join(outputRoot, file.path)
         if (sharedType == 'owned') and (not file.owned):
-            data = __toDict(file, 'Skip', 'Skip', 'File is shared but only export owned')
+            state = ('Skip', 'Skip', 'File is shared but only export owned')
         elif (sharedType == 'shared') and file.owned:
-            data = __toDict(file, 'Skip', 'Skip', 'File is owned by user but only export shared')
-        elif os.path.exists(path) and os.path.isfile(path):
+            state = ('Skip', 'Skip', 'File is owned by user but only export shared')
+        elif (stat := __statFile(path, index)) is not None:
             if noMd5:
-                stat = os.stat(path)
                 if (stat.st_mtime == file.mtime.timestamp()) and \
                     (stat.st_atime == file.atime.timestamp()) and \
                     (stat.st_size == file.size):
-                    data = __toDict(file, 'Skip', 'OK', 'File state match')
+                    state = ('Skip', 'OK', 'File state match')
                     noChangeCount += 1
                 else:
-                    data = __toDict(file, 'Download', 'Pending', 'File state not match')
-                    needDownload = True
+                    state = ('Download', 'Pending', 'File state not match')
+                    tasks = ['']
             else:
-                m = md5(path)
+                m = hashCache.get(path, stat) if hashCache else ''
+                if not m:
+                    m = verifier.md5(path) if verifier else md5(path)
+                    if hashCache:
+                        hashCache.put(path, m, stat)
                 if m != file.md5:
-                    data = __toDict(file, 'Download', 'Pending', 'MD5 not match')
-                    needDownload = True
+                    state = ('Download', 'Pending', 'MD5 not match')
+                    tasks = ['']
                 else:
-                    data = __toDict(file, 'Skip', 'OK', 'MD5 match')
+                    state = ('Skip', 'OK', 'MD5 match')
                     noChangeCount += 1
         else:
-            data = __toDict(file, 'Download', 'Pending', 'Not exist')
-            needDownload = True
-    return needDownload, data, file, linkCount, folderCount, exportCount, fileCount, noChangeCount
+            state = ('Download', 'Pending', 'Not exist')
+            tasks = ['']
+    return tasks, state, file, linkCount, folderCount, exportCount, fileCount, noChangeCount
 
 
-def __fetchFileInfoFromCsv(
-    csvPath: str, outputRoot: str, noMd5: bool, sharedType: str, includeTrashed: bool = False
-) -> Tuple[List[FileInfo], pd.DataFrame]:
-    """Fetch file info from existing CSV file.
-    If the file does not exist, empty data frame will be returned.
+def __isExported(
+    file: FileInfo, exportMime: str, outputRoot: str,
+    exports: Dict[Tuple[str, str], Tuple[str, str, str, int, int]] | None,
+    index: LocalIndex | None,
+) -> bool:
+    """Check if given document has been exported as `exportMime` and not changed since then.
+    Document must not be modified or moved in drive, and exported file must keep its stat.
+    """
+    record = exports.get((file.id, exportMime)) if exports and exportMime else None
+    if record is None:
+        return False
+    modifiedTime, path, localPath, size, mtime = record
+    if (modifiedTime != file.mtime.isoformat()) or (path != file.path):
+        return False
+    stat = __statFile(os.path.join(outputRoot, localPath), index)
+    return (stat is not None) and (stat.st_size == size) and (stat.st_mtime_ns == mtime)
+
+
+def __statFile(path: str, index: LocalIndex | None) -> os.stat_result | None:
+    """Get stat of given regular file from index or file system, None if not exists."""
+    if index:
+        return index.stat(path)
+    if os.path.exists(path) and os.path.isfile(path):
+        return os.stat(path)
+    return None
+
+
+def __prefetchHashes(
+    files: Iterable[FileInfo], outputRoot: str, noMd5: bool, sharedType: str,
+    hashCache: HashCache | None, verifier: Verifier | None, index: LocalIndex | None,
+):
+    """Hash local files which `__checkFile` will verify by MD5 in batch, in order of inode."""
+    if noMd5 or (verifier is None):
+        return
+    paths = []
+    for file in files:
+        if (file.fileType != FileType.FILE) or file.exportLinks:
+            continue
+        if ((sharedType == 'owned') and (not file.owned)) or \
+            ((sharedType == 'shared') and file.owned):
+            continue
+        paths.append(os.path.join(outputRoot, file.path))
+    verifier.prefetch(paths, hashCache, index)
+
+
+def __fetchFileInfoFromManifest(
+    manifest: Manifest, driveId: str, driveName: str, outputRoot: str, noMd5: bool,
+    sharedType: str, includeTrashed: bool = False, chunkSize: int = 10000,
+    hashCache: HashCache | None = None, verifier: Verifier | None = None,
+    index: LocalIndex | None = None, exportTypes: Dict[str, List[str]] | None = None,
+    fileFilter: FileFilter | None = None,
+) -> List[Tuple[FileInfo, int, str]]:
+    """Check files of given drive stored in manifest.
+    Files are loaded and checked chunk by chunk, so all files are not loaded into memory.
 
-     :param csvPath: path to CSV file to load.
+     :param manifest: manifest stores file info.
+     :param driveId: drive Id.
+     :param driveName: drive name.
      :param outputRoot: output root path.
      :param noMd5: skip MD5 check or not.
      :param sharedType: fetch files with owner filter.
@@ -146,50 +363,59 @@ def __fetchFileInfoFromCsv(
         - owned: only owned by me.
         - shared: only shared with me.
      :param includeTrashed: include trashed file or not.
-     :returns: Tuple of:
-          - File info list to download.
-          - DataFrame stores all files.
+     :param chunkSize: # of files to load and check at once.
+     :param hashCache: cache of local file MD5.
+     :param verifier: engine to compute MD5 of local file.
+     :param index: index of local files.
+     :param exportTypes: preferred export MIME types of each Google document type.
+     :param fileFilter: user filter, files not matched are not checked nor downloaded.
+     :returns: list of file info to download, its row id in manifest and export MIME type.
     """
-    df = pd.read_csv(csvPath, encoding='utf-8', keep_default_na=False)
     linkCount = 0
     noChangeCount = 0
     exportCount = 0
     fileCount = 0
     folderCount = 0
+    filteredCount = 0
     downloadList = []
     startTime = datetime.now()
 
-    # fileIter = map(lambda param: FileInfo(**param._asdict()), df.itertuples(index=False))
-    fileIter = map(
-        lambda v: FileInfo(**dict(zip(iter(df), iter(v)))),
-        df.itertuples(index=False, name=None))
+    exports = manifest.loadExports(driveId)
+    progress = tqdm(
+        total=manifest.countDrive(driveId), desc='Checking Files', ascii=True, dynamic_ncols=True)
     with ThreadPoolExecutor() as executor:
-        args = zip(
-            fileIter,
-            itertools.repeat(outputRoot), itertools.repeat(noMd5), itertools.repeat(sharedType))
-        results = list(tqdm(
-            executor.map(lambda param: __checkFile(*param), args),
-            total=len(df),
-            desc='Checking Files',
-            ascii=True, dynamic_ncols=True))
-    i = 0
-    for result in results:
-        needDownload, _, file, isLink, isFolder, isExport, isFile, isNoChange = result
-        if (not includeTrashed) and file.trashed:
-            noChangeCount += 1
-            continue
-        linkCount += isLink
-        exportCount += isExport
-        folderCount += isFolder
-        fileCount += isFile
-        noChangeCount += isNoChange
-        if needDownload:
-            downloadList.append((file, i))
-        i += 1
+        for rows in manifest.iterDriveRows(driveId, chunkSize=chunkSize):
+            files = FileInfo.fromRecords(Manifest.Columns, [row[1:] for row in rows])
+            if fileFilter:
+                matched = [(row, file) for row, file in zip(rows, files) if fileFilter.match(file)]
+                filteredCount += len(rows) - len(matched)
+                progress.update(len(rows) - len(matched))
+                rows = [row for row, _ in matched]
+                files = [file for _, file in matched]
+            __prefetchHashes(files, outputRoot, noMd5, sharedType, hashCache, verifier, index)
+            args = zip(
+                files,
+                itertools.repeat(outputRoot), itertools.repeat(noMd5), itertools.repeat(sharedType),
+                itertools.repeat(hashCache), itertools.repeat(verifier), itertools.repeat(index),
+                itertools.repeat(exports), itertools.repeat(exportTypes))
+            results = executor.map(lambda param: __checkFile(*param), args)
+            for (rowId, *_), result in zip(rows, results):
+                progress.update(1)
+                tasks, _, file, isLink, isFolder, isExport, isFile, isNoChange = result
+                if (not includeTrashed) and file.trashed:
+                    noChangeCount += 1
+                    continue
+                linkCount += isLink
+                exportCount += isExport
+                folderCount += isFolder
+                fileCount += isFile
+                noChangeCount += isNoChange
+                downloadList.extend((file, rowId, m) for m in tasks)
+            # Files skipped by `__checkFile` never take their prefetched hashes
+            if verifier:
+                verifier.clear()
+    progress.close()
     checkTime = datetime.now()
-    # Save info of all files
-    driveName = df['driveName'][0]
-    driveId = df['driveId'][0]
 
     # Statistics
     print(f'Drive: {driveName} ({driveId})')
@@ -199,106 +425,322 @@ def __fetchFileInfoFromCsv(
     print(f'Total no changed files: {noChangeCount}')
     print(f'Total folders: {folderCount}')
     print(f'Total links: {linkCount}')
+    print(f'Total filtered files: {filteredCount}')
     print('Time:')
     print(f'  - Check Time: {checkTime - startTime}')
     print('-' * 40)
-    return downloadList, df
+    return downloadList
 
 
-def __processFileInfo(
-    outputRoot: str, fileList: List[FileInfo], folderTable: Dict[str, FileInfo], driveName: str,
-    noMd5: bool, sharedType: str
-) -> Tuple[List[Tuple[FileInfo, int]], pd.DataFrame]:
-    """Process path of each files and dump to CSV.
-     :param outputRoot: output root for saving CSV.
-     :param fileList: fetched file info list.
-     :param folderTable: table of all folders.
-     :param driveName: drive name to be used as CSV file name.
-     :param noMd5: skip MD5 file check or not.
-     :param sharedType: fetch files with owner filter.
-        - both: include both shared with me and owned by me.
-        - owned: only owned by me.
-        - shared: only shared with me.
+def __streamFileInfo(
+    client: GoogleDriveClient, driveId: str, driveName: str, outputRoot: str,
+    manifest: Manifest, includeTrashed: bool, noMd5: bool, sharedType: str, partitioned: bool,
+    cfg: Config, events: Queue, hashCache: HashCache | None = None,
+    verifier: Verifier | None = None, index: LocalIndex | None = None,
+    fileFilter: FileFilter | None = None,
+):
+    """Fetch, resolve path and check files of given drive as a pipeline.
+    Files requiring download are put to `events` as soon as their parent folders are known, files
+    whose parent folders have not been fetched wait until parents arrive. After all files are
+    processed, file info is saved to manifest the same as `__processFileInfo`. Files not matched by
+    `fileFilter` are dropped once their paths are resolved.
+
+    Events put to `events`:
+      - `('file', driveId, FileInfo, i, exportMime)`: file to download, `i` is index in file list
+        of drive. A document exported as multiple types is put once for each type.
+      - `('done', driveId, int)`: all files of this drive have been processed and saved to
+        manifest, row id of `i`-th file is given value plus `i`.
+      - `('error', driveId, Exception)`: fetch or process fail.
     """
-    def __updatePath(f: FileInfo, folderTable: Dict[str, FileInfo]) -> str:
-        """Recursive update path by trace back parent."""
-        # BC
-        if f.path:
-            return f.path
-        if (f.name == '') or (len(f.parents) == 0):
-            return driveName
-        parent = folderTable[f.parents[0]]
-        f.path = os.path.join(__updatePath(parent, folderTable), f.name)
-        return f.path
+    try:
+        startTime = datetime.now()
+        # Get token before listing, so changes during listing are not missed
+        pageToken = client.queryStartPageToken(driveId)
+        # Folders are known once resolved, files wait until their parent folders are resolved
+        resolver = PathResolver(driveName)
+        exports = manifest.loadExports(driveId)
+        exportTypes = cfg.preferExportType
+        # Map from parent folder id to files waiting for it
+        waiting: Dict[str, List[FileInfo]] = {}
+        lock = Lock()
+        # Checked files and their (action, status, message) in order of index `i`
+        checked: List[Tuple[FileInfo, Tuple[str, str, str]]] = []
+        # Link, Folder, Export, File, NoChange, Download
+        counts = [0] * 6
+        filteredCount = 0
 
-    linkCount = 0
-    noChangeCount = 0
-    exportCount = 0
-    fileCount = 0
-    downloadList = []
-    startTime = datetime.now()
-    # Update file path
-    for file in tqdm(fileList, desc='Update path', ascii=True, dynamic_ncols=True):
-        __updatePath(file, folderTable)
-        sharedPath = f'{driveName}-Shared'
-        if not file.owned:
-            if len(file.parents) == 0:
-                # Shared in root folder
-                file.path = sharedPath
-            elif not file.path.startswith(sharedPath):
-                # Shared file in other owned folder
-                file.path = file.path.replace(driveName, sharedPath, 1)
-        trashedPath = f'{driveName}-Trash'
-        if file.trashed:
-            if len(file.parents) == 0:
-                # Deleted in root folder
-                file.path = trashedPath
-            elif not file.path.startswith(trashedPath):
-                # Deleted file in other exist folder
-                file.path = file.path.replace(driveName, trashedPath, 1)
-    # Check
+        def __onChecked(file: FileInfo, future: Future):
+            """Collect check result. Done callbacks must not raise, otherwise the exception is
+            only logged by executor and the file is lost, so failed check is recorded as failed
+            file in manifest.
+            """
+            try:
+                tasks, state, file, *fileCounts = future.result()
+            except Exception as e:
+                isExport = bool(file.exportLinks)
+                tasks = []
+                state = ('Export' if isExport else 'Download', 'Fail', f'Check fail: {e}')
+                fileCounts = [0, 0, int(isExport), int(not isExport), 0]
+            with lock:
+                i = len(checked)
+                checked.append((file, state))
+                for k, v in enumerate(fileCounts):
+                    counts[k] += v
+                counts[5] += len(tasks)
+            for exportMime in tasks:
+                # Block when download queue is full
+                events.put(('file', driveId, file, i, exportMime))
+
+        def __place(file: FileInfo):
+            """Resolve path of given file and all files waiting for it, then check them."""
+            nonlocal filteredCount
+            stack = [file]
+            while stack:
+                f = stack.pop()
+                # Files whose parents are not accessible (e.g. filtered out) are put to drive root
+                resolver.resolve(f)
+                if f.isFolder():
+                    stack.extend(waiting.pop(f.id, []))
+                elif fileFilter and (not fileFilter.match(f)):
+                    filteredCount += 1
+                    continue
+                checkExecutor.submit(
+                    __checkFile, f, outputRoot, noMd5, sharedType, hashCache, verifier, index,
+                    exports, exportTypes
+                ).add_done_callback(functools.partial(__onChecked, f))
+
+        totalCount = 0
+        with ThreadPoolExecutor(thread_name_prefix='CK') as checkExecutor:
+            for files in __queryFiles(
+                client, driveId, includeTrashed, sharedType, partitioned, cfg, fileFilter
+            ):
+                for file in files:
+                    if (not file.name) or (not file.parents) or \
+                        any(parent in resolver for parent in file.parents):
+                        __place(file)
+                    else:
+                        waiting.setdefault(file.parents[0], []).append(file)
+                totalCount += len(files)
+            # Parents of remaining files are not accessible
+            while waiting:
+                _, files = waiting.popitem()
+                for file in files:
+                    __place(file)
+        checkTime = datetime.now()
+
+        rowBase = manifest.replaceDrive(
+            driveId, driveName, (__toRow(f, *state) for f, state in checked))
+        __savePageToken(
+            os.path.join(outputRoot, driveName) + '.token', driveId, pageToken,
+            __listScope(fileFilter, includeTrashed, sharedType, cfg.preferExportType))
+        print(f'Drive: {driveName} ({driveId}) fetched {totalCount} files, ' + \
+            f'{counts[5]} to download, {counts[4]} no changed, {counts[1]} folders, ' + \
+            f'{counts[0]} links, {filteredCount} filtered, time: {checkTime - startTime}')
+        events.put(('done', driveId, rowBase))
+    except Exception as e:
+        events.put(('error', driveId, e))
+        raise
+
+
+def __checkFiles(
+    fileList: List[FileInfo], outputRoot: str, manifest: Manifest, driveId: str, noMd5: bool,
+    sharedType: str, hashCache: HashCache | None = None, verifier: Verifier | None = None,
+    index: LocalIndex | None = None, exportTypes: Dict[str, List[str]] | None = None,
+) -> Tuple[
+    List[Tuple[List[str], Tuple[str, str, str], FileInfo, int, int, int, int, int]],
+    List[Tuple[FileInfo, int, str]], List[int]
+]:
+    """Check files of given drive in parallel, paths of files must be resolved.
+     :returns: Tuple of:
+          - Result of `__checkFile` of each file, in order of `fileList`.
+          - File info to download, its index in `fileList` and export MIME type.
+          - # of links, folders, exported files, normal files and no changed files.
+    """
+    exports = manifest.loadExports(driveId)
+    __prefetchHashes(fileList, outputRoot, noMd5, sharedType, hashCache, verifier, index)
     with ThreadPoolExecutor() as executor:
         args = zip(
             iter(fileList),
-            itertools.repeat(outputRoot), itertools.repeat(noMd5), itertools.repeat(sharedType))
+            itertools.repeat(outputRoot), itertools.repeat(noMd5), itertools.repeat(sharedType),
+            itertools.repeat(hashCache), itertools.repeat(verifier), itertools.repeat(index),
+            itertools.repeat(exports), itertools.repeat(exportTypes))
         results = list(tqdm(
             executor.map(lambda param: __checkFile(*param), args),
             total=len(fileList),
             desc='Checking Files',
             ascii=True, dynamic_ncols=True))
-    i = 0
-    dictList = []
-    for result in results:
-        needDownload, data, file, isLink, _, isExport, isFile, isNoChange = result
-        linkCount += isLink
-        exportCount += isExport
-        fileCount += isFile
-        noChangeCount += isNoChange
-        if needDownload:
-            downloadList.append((file, i))
-        dictList.append(data)
-        i += 1
-    checkTime = datetime.now()
-    # Save info of all files
-    df = pd.DataFrame(dictList)
-    df['driveName'] = driveName
-    df.to_csv(os.path.join(outputRoot, f'{driveName}.csv'), encoding='utf-8', index=False)
-    pdTime = datetime.now()
+    # Files skipped by `__checkFile` never take their prefetched hashes
+    if verifier:
+        verifier.clear()
+    downloadList = []
+    counts = [0] * 5
+    for i, result in enumerate(results):
+        tasks, _, file, *fileCounts = result
+        for k, v in enumerate(fileCounts):
+            counts[k] += v
+        downloadList.extend((file, i, m) for m in tasks)
+    return results, downloadList, counts
 
-    # Statistics
-    print(f'Drive: {driveName} ({fileList[0].driveId})')
-    print(f'Total files to download: {len(downloadList)}')
+
+def __printDriveStats(
+    driveId: str, driveName: str, downloadCount: int, counts: List[int], filteredCount: int,
+    startTime: datetime, checkTime: datetime, saveTime: datetime,
+):
+    """Print statistics of processed drive, `counts` is given by `__checkFiles`."""
+    linkCount, folderCount, exportCount, fileCount, noChangeCount = counts
+    print(f'Drive: {driveName} ({driveId})')
+    print(f'Total files to download: {downloadCount}')
     print(f'Total normal files: {fileCount}')
     print(f'Total exported files: {exportCount}')
     print(f'Total no changed files: {noChangeCount}')
-    print(f'Total folders: {len(folderTable.items())}')
+    print(f'Total folders: {folderCount}')
     print(f'Total links: {linkCount}')
+    print(f'Total filtered files: {filteredCount}')
     print('Time:')
-    print(f'  - Total Time: {pdTime - startTime}')
+    print(f'  - Total Time: {saveTime - startTime}')
     print(f'  - Check Time: {checkTime - startTime}')
-    print(f'  - To CSV Time: {pdTime - checkTime}')
+    print(f'  - Save Manifest Time: {saveTime - checkTime}')
     print('-' * 40)
-    return downloadList, df
+
+
+def __processFileInfo(
+    outputRoot: str, manifest: Manifest, fileList: List[FileInfo],
+    folderTable: Dict[str, FileInfo], driveId: str, driveName: str, noMd5: bool, sharedType: str,
+    hashCache: HashCache | None = None, verifier: Verifier | None = None,
+    index: LocalIndex | None = None, exportTypes: Dict[str, List[str]] | None = None,
+    fileFilter: FileFilter | None = None,
+) -> List[Tuple[FileInfo, int, str]]:
+    """Process path of each files and save to manifest.
+     :param outputRoot: output root.
+     :param manifest: manifest to save file info.
+     :param fileList: fetched file info list.
+     :param folderTable: table of all folders.
+     :param driveId: drive Id.
+     :param driveName: drive name to be used as root folder name.
+     :param noMd5: skip MD5 file check or not.
+     :param sharedType: fetch files with owner filter.
+        - both: include both shared with me and owned by me.
+        - owned: only owned by me.
+        - shared: only shared with me.
+     :param hashCache: cache of local file MD5.
+     :param verifier: engine to compute MD5 of local file.
+     :param index: index of local files.
+     :param exportTypes: preferred export MIME types of each Google document type.
+     :param fileFilter: user filter, files not matched are dropped after path is resolved.
+     :returns: list of file info to download, its row id in manifest and export MIME type.
+    """
+    startTime = datetime.now()
+    # Update file path
+    resolver = PathResolver(driveName, folderTable)
+    for file in tqdm(fileList, desc='Update path', ascii=True, dynamic_ncols=True):
+        resolver.resolve(file)
+    # Conditions can not be expressed in query
+    filteredCount = len(fileList)
+    if fileFilter:
+        fileList = [file for file in fileList if fileFilter.match(file)]
+    filteredCount -= len(fileList)
+    # Check
+    results, downloadList, counts = __checkFiles(
+        fileList, outputRoot, manifest, driveId, noMd5, sharedType, hashCache, verifier, index,
+        exportTypes)
+    checkTime = datetime.now()
+    # Save info of all files
+    rowBase = manifest.replaceDrive(
+        driveId, driveName, (__toRow(r[2], *r[1]) for r in results))
+    downloadList = [(file, rowBase + i, m) for file, i, m in downloadList]
+    saveTime = datetime.now()
+
+    __printDriveStats(
+        driveId, driveName, len(downloadList), counts, filteredCount, startTime, checkTime,
+        saveTime)
+    return downloadList
+
+
+def __processChanges(
+    outputRoot: str, manifest: Manifest, changes: Dict[str, FileInfo | None], driveId: str,
+    driveName: str, noMd5: bool, sharedType: str, hashCache: HashCache | None = None,
+    verifier: Verifier | None = None, index: LocalIndex | None = None,
+    exportTypes: Dict[str, List[str]] | None = None, fileFilter: FileFilter | None = None,
+) -> List[Tuple[FileInfo, int, str]]:
+    """Apply changes since previous run to file info stored in manifest.
+    Only changed files, files under moved folders and files not done in previous run are checked
+    and written again, other files of the drive are kept as stored. Paths are resolved again only
+    for changed files and files under moved folders, by stored paths of their parent folders.
+    Parameters are the same as `__processFileInfo` except:
+
+     :param changes: changes since previous run, see `__fetchFileInfoIncremental`.
+     :returns: list of file info to download, its row id in manifest and export MIME type.
+    """
+    def __load(rows: List[Tuple]) -> Dict[str, FileInfo]:
+        """Build file info of raw rows loaded from manifest."""
+        return {
+            file.id: file
+            for file in FileInfo.fromRecords(Manifest.Columns, [row[1:] for row in rows])}
+
+    startTime = datetime.now()
+    stored = __load(manifest.loadRows(driveId, changes))
+    # Drive root is stored without name
+    changes = {
+        fileId: file for fileId, file in changes.items()
+        if (fileId not in stored) or stored[fileId].name}
+    # Folders to resolve are added to `folders` once files under moved folders are known
+    folders: Dict[str, FileInfo] = {}
+    resolver = PathResolver(driveName, folders)
+    # Files to resolve path again, folders moved or removed take files under them
+    moved: Dict[str, FileInfo] = {}
+    for fileId, file in changes.items():
+        prev = stored.get(fileId)
+        if (prev is not None) and prev.isFolder() and ((file is None) or \
+            (file.name != prev.name) or (file.parents != prev.parents) or \
+            (file.trashed != prev.trashed) or (file.owned != prev.owned)):
+            for path in resolver.folderPaths(prev):
+                moved.update(__load(manifest.loadRowsUnder(driveId, path)))
+    moved.update((fileId, file) for fileId, file in changes.items() if file is not None)
+    removedIds = {fileId for fileId, file in changes.items() if file is None}
+    for fileId in removedIds:
+        moved.pop(fileId, None)
+    for file in moved.values():
+        file.path = ''
+    folders.update((fileId, file) for fileId, file in moved.items() if file.isFolder())
+    # Parent folders not moved keep stored paths
+    parentIds = {
+        parent for file in moved.values() for parent in file.parents
+        if (parent not in moved) and (parent not in removedIds)}
+    for folder in __load(manifest.loadRows(driveId, parentIds)).values():
+        if folder.isFolder():
+            resolver.addResolved(folder)
+    for file in moved.values():
+        resolver.resolve(file)
+    filteredCount = 0
+    if fileFilter:
+        for fileId in [fileId for fileId, file in moved.items() if not fileFilter.match(file)]:
+            del moved[fileId]
+            removedIds.add(fileId)
+            filteredCount += 1
+    # Files not done in previous run are checked again
+    for status in ('Pending', 'Fail'):
+        for rows in manifest.iterDriveRows(driveId, status):
+            for fileId, file in __load(rows).items():
+                if fileId not in removedIds:
+                    moved.setdefault(fileId, file)
+    fileList = list(moved.values())
+    # Check
+    results, downloadList, counts = __checkFiles(
+        fileList, outputRoot, manifest, driveId, noMd5, sharedType, hashCache, verifier, index,
+        exportTypes)
+    checkTime = datetime.now()
+    # Save info of checked files only
+    rowBase = manifest.updateDrive(
+        driveId, driveName, removedIds, [__toRow(r[2], *r[1]) for r in results])
+    downloadList = [(file, rowBase + i, m) for file, i, m in downloadList]
+    saveTime = datetime.now()
+
+    __printDriveStats(
+        driveId, driveName, len(downloadList), counts, filteredCount, startTime, checkTime,
+        saveTime)
+    print(f'Total changes: {len(changes)}, files checked: {len(fileList)}, ' + \
+        f'removed: {len(removedIds)}')
+    return downloadList
 
 
 def __formatDesc(msg: str, status: _TaskStatus) -> str:
@@ -320,10 +762,46 @@ def __formatDesc(msg: str, status: _TaskStatus) -> str:
             return f'[Request] {msg}'
 
 
-def __updateResultMessage(
-    result: DownloadTaskResult, dfTable: Dict[str, pd.DataFrame], canRetry: bool
-) -> str:
-    """Updatedownload result and generate message for printing."""
+def __updateResultStatus(
+    result: DownloadTaskResult, exportMime: str, manifest: Manifest, rowBase: int,
+    failedExports: Dict[Tuple[str, int], Set[str]],
+):
+    """Update download result to manifest.
+     :param exportMime: MIME type of the download task, empty for binary file.
+     :param rowBase: row id offset of `result.i`.
+     :param failedExports: map from (drive Id, `i`) to export MIME types failed last time. A
+        document exported as multiple types is OK only if none of them failed.
+    """
+    rowId = rowBase + result.i
+    key = (result.file.driveId, result.i)
+    failed = failedExports.setdefault(key, set()) if exportMime else set()
+    if result.result:
+        failed.discard(exportMime)
+        if not failed:
+            failedExports.pop(key, None)
+            manifest.updateStatus(rowId, 'OK', '')
+        return
+    failed.add(exportMime)
+    message = 'Unexpected exception' if result.exception else result.message
+    if exportMime:
+        message += f' ({exportMime})'
+    manifest.updateStatus(rowId, 'Fail', message)
+
+
+def __recordExport(result: DownloadTaskResult, manifest: Manifest, outputRoot: str):
+    """Record successfully exported document to manifest, so it is not exported again until
+    it is changed.
+    """
+    if (not result.result) or (not result.exportMime):
+        return
+    file = result.file
+    manifest.putExport(
+        file.id, result.exportMime, file.driveId, file.mtime.isoformat(), file.path,
+        os.path.relpath(result.path, outputRoot), os.stat(result.path))
+
+
+def __updateResultMessage(result: DownloadTaskResult, canRetry: bool) -> str:
+    """Generate download result message for printing."""
     timeLength = 8
     msgLength = 12
     path = os.path.join(result.file.path, result.file.name)
@@ -333,16 +811,12 @@ def __updateResultMessage(
     fileId = result.file.id
     if result.result:
         # Success
-        dfTable[result.file.driveId].loc[result.i, 'status'] = 'OK'
-        dfTable[result.file.driveId].loc[result.i, 'message'] = ''
         return '🎉  ' + color.Fore.GREEN + f'{duration} ' + color.Fore.RESET + \
             'Success'.ljust(msgLength) + \
             color.Style.BRIGHT + color.Fore.BLUE + f'({fileId}) ' + color.Style.RESET_ALL + \
             color.Style.BRIGHT + f'{path}' + color.Style.RESET_ALL
     elif result.exception:
         # Fail with exception
-        dfTable[result.file.driveId].loc[result.i, 'status'] = 'Fail'
-        dfTable[result.file.driveId].loc[result.i, 'message'] = 'Unexpected exception'
         pprint(result.exception)
         msg = 'Retry: exception' if canRetry else 'Fail: exception'
         return '❌ ' + color.Fore.MAGENTA + f'{duration} ' + color.Fore.RESET + \
@@ -351,8 +825,6 @@ def __updateResultMessage(
             color.Style.BRIGHT + color.Fore.RED + f'{path}' + color.Style.RESET_ALL
     else:
         # Fail with other reason
-        dfTable[result.file.driveId].loc[result.i, 'status'] = 'Fail'
-        dfTable[result.file.driveId].loc[result.i, 'message'] = result.message
         msg = f'Retry: {result.message}' if canRetry else f'Fail: {result.message}'
         return '⛈ ' + color.Style.BRIGHT + color.Fore.WHITE + f'{duration} ' + color.Style.RESET_ALL + \
             msg.ljust(msgLength)[:msgLength] + \
@@ -360,54 +832,126 @@ def __updateResultMessage(
             color.Style.BRIGHT + color.Fore.YELLOW + f'{path}' + color.Style.RESET_ALL
 
 
+def exportCsv(user: str, outputRoot: str):
+    """Export file info of all drives in manifest to `<drive name>.csv`.
+    Output folder of given user is named by account of Drive, the same as `process`.
+    """
+    cfg = Config()
+    client = GoogleDriveClient(user, apiEndpoint=cfg.apiEndpoint)
+    client.auth()
+    outputRoot = os.path.join(outputRoot, client.queryAccount().user)
+    path = os.path.join(outputRoot, 'manifest.db')
+    if not os.path.isfile(path):
+        print(f'Manifest {path} does not exist, export files of the user first.')
+        return
+    manifest = Manifest(path)
+    for driveId, driveName in manifest.drives():
+        path = os.path.join(outputRoot, f'{driveName}.csv')
+        count = manifest.exportCsv(path, driveId)
+        print(f'Export {count} files of {driveName} to {path}')
+    manifest.close()
+
+
 def process(
     user: str, outputRoot: str, job: int,
     downloadOnly: bool, noMd5: bool, fileInfoCsv: str, includeTrashed: bool,
-    sharedType: str, ignoredDrives: List[str], maxRetry: int,
+    sharedType: str, ignoredDrives: List[str], maxRetry: int, incremental: bool = False,
+    partitioned: bool = False, stream: bool = False, schedule: str = 'fifo',
+    useAsync: bool = False, http2: bool = False, filterSpec: Dict[str, Any] | None = None,
 ):
     """The implementation. """
-    client = GoogleDriveClient(user)
+    cfg = Config()
+    # Command line filter overrides `fileFilter` in settings
+    fileFilter = FileFilter.fromConfig(cfg, filterSpec)
+    # Shared by client and downloader, so both listing and downloading backoff together
+    limiter = RateLimiter.fromConfig(cfg, job)
+    client = GoogleDriveClient(user, limiter, cfg.apiEndpoint)
     print('Initializing...')
     client.initialize()
     account = client.account
     outputRoot = os.path.join(outputRoot, account.user)
     os.makedirs(outputRoot, exist_ok=True)
 
-    cfg = Config()
-    dfTable: Dict[str, pd.DataFrame] = {}
+    manifest = Manifest(os.path.join(outputRoot, 'manifest.db'))
+    hashCache = HashCache(os.path.join(outputRoot, 'hashcache.db')) if cfg.hashCache else None
+    verifier = Verifier.fromConfig(cfg)
+    index = LocalIndex(outputRoot) if cfg.localIndex else None
+    # Map from drive id to row id offset of download task index `i`, set when file info is saved
+    rowBase: Dict[str, int] = {}
+    downloadList: List[Tuple[FileInfo, int, str]] = []
+    # Streaming pipeline events, see `__streamFileInfo`
+    events: Queue = Queue(maxsize=cfg.pipelineQueueSize)
+    # Map from id to name of drives being listed by streaming pipeline
+    streamingDrives: Dict[str, str] = {}
+    listExecutor = ThreadPoolExecutor(max_workers=cfg.listDriveJobs, thread_name_prefix='LD')
     if fileInfoCsv:
         # User use fixed file info csv path
-        fileList, df = __fetchFileInfoFromCsv(
-            fileInfoCsv, outputRoot, noMd5, sharedType, includeTrashed)
-        driveName = df['path'][0].split(os.path.sep)[0]
-        dfTable = {driveName: df}
+        driveId, driveName = manifest.importCsv(fileInfoCsv)
+        downloadList = __fetchFileInfoFromManifest(
+            manifest, driveId, driveName, outputRoot, noMd5, sharedType, includeTrashed,
+            hashCache=hashCache, verifier=verifier, index=index,
+            exportTypes=cfg.preferExportType, fileFilter=fileFilter)
+        rowBase[driveId] = 0
     else:
         driveList = [('MyDrive', '')]
         driveList.extend([
             (sharedDrive.name, sharedDrive.driveId) for sharedDrive in client.sharedDrives
         ])
-        dfTable: Dict[str, pd.DataFrame] = {}
-        downloadList: List[FileInfo] = []
+        # Handle ignored drive list
+        for driveName in ignoredDrives:
+            print(f'Drive {driveName} is marked ignored by user.')
+        driveList = [drive for drive in driveList if drive[0] not in ignoredDrives]
+        if stream and (not downloadOnly):
+            # Download while listing, drives are reported by events. Drives synced by changes are
+            # fetched before download as below, since only changed files are listed.
+            scope = __listScope(fileFilter, includeTrashed, sharedType, cfg.preferExportType)
+            for driveName, driveId in driveList:
+                if incremental and manifest.hasDrive(driveId) and __loadPageToken(
+                    os.path.join(outputRoot, driveName) + '.token', driveId, scope
+                ):
+                    continue
+                streamingDrives[driveId] = driveName
+                listExecutor.submit(
+                    __streamFileInfo, client, driveId, driveName, outputRoot, manifest,
+                    includeTrashed, noMd5, sharedType, partitioned, cfg, events, hashCache,
+                    verifier, index, fileFilter)
+            driveList = [drive for drive in driveList if drive[1] not in streamingDrives]
+        # Listing is latency bound, fetch drives concurrently and process them in order
+        listFutures = {} if downloadOnly else {
+            driveId: listExecutor.submit(
+                __fetchDrive, client, driveId, driveName, outputRoot, manifest, includeTrashed,
+                sharedType, incremental, partitioned, cfg, fileFilter)
+            for driveName, driveId in driveList
+        }
         for driveName, driveId in driveList:
-            # Handle ignored drive list
-            if driveName in ignoredDrives:
-                print(f'Drive {driveName} is marked ignored by user.')
-                continue
-
             if downloadOnly:
                 path = os.path.join(outputRoot, driveName) + '.csv'
-                if (not os.path.exists(path)) or (not os.path.isfile(path)):
-                    print(f'Drive {driveName} ignored, since file info CSV does not exist.')
+                if (not manifest.hasDrive(driveId)) and os.path.isfile(path):
+                    # File info CSV of previous version
+                    manifest.importCsv(path)
+                if not manifest.hasDrive(driveId):
+                    print(f'Drive {driveName} ignored, since file info does not exist.')
                     continue
-                fileList, df = __fetchFileInfoFromCsv(
-                    path, outputRoot, noMd5, sharedType, includeTrashed)
+                fileList = __fetchFileInfoFromManifest(
+                    manifest, driveId, driveName, outputRoot, noMd5, sharedType, includeTrashed,
+                    hashCache=hashCache, verifier=verifier, index=index,
+                    exportTypes=cfg.preferExportType, fileFilter=fileFilter)
             else:
-                fileList, folderTable = __fetchFileInfo(
-                    client, driveId, driveName, includeTrashed, sharedType, cfg)
-                fileList, df = __processFileInfo(
-                    outputRoot, fileList, folderTable, driveName, noMd5, sharedType)
+                fileList, folderTable, changes, pageToken = listFutures[driveId].result()
+                if changes is None:
+                    fileList = __processFileInfo(
+                        outputRoot, manifest, fileList, folderTable, driveId, driveName, noMd5,
+                        sharedType, hashCache, verifier, index, cfg.preferExportType, fileFilter)
+                else:
+                    fileList = __processChanges(
+                        outputRoot, manifest, changes, driveId, driveName, noMd5, sharedType,
+                        hashCache, verifier, index, cfg.preferExportType, fileFilter)
+                __savePageToken(
+                    os.path.join(outputRoot, driveName) + '.token', driveId, pageToken,
+                    __listScope(fileFilter, includeTrashed, sharedType, cfg.preferExportType))
             downloadList.extend(fileList)
-            dfTable[driveId] = df
+            rowBase[driveId] = 0
+    listExecutor.shutdown(wait=False)
     print(f'Total file to download: {len(downloadList)}')
 
     # Downloading
@@ -416,99 +960,200 @@ def process(
         '|{bar}{r_bar}'
     progress = tqdm(
         desc='Total', total=len(downloadList), ascii=True, dynamic_ncols=True, bar_format=fmt)
-    downloader = Downloader(client.authId, outputRoot, job)
+    if http2 and (not useAsync):
+        print('HTTP/2 is supported by asyncio engine, --asyncio is enabled.')
+        useAsync = True
+    if useAsync:
+        downloader = AsyncDownloader(
+            client.authId, outputRoot, job, cfg, limiter, hashCache, index, http2)
+    else:
+        downloader = Downloader(client.authId, outputRoot, job, cfg, limiter, hashCache, index)
     completedCount = 0
-    # Retry table, map from file id to retry remain count
-    retryTable: Dict[str, int] = {}
-    # Submit all taskes
-    futures = [
-        downloader.download(
-            f,
-            cfg.preferExportType[f.mime] if f.exportLinks else '',
-            cfg.exportMimeTable[cfg.preferExportType[f.mime]][1] if f.exportLinks else '',
-            i
-        ) for f, i in downloadList]
-    while True:
-        done, notdone = wait(futures, timeout=1, return_when=ALL_COMPLETED)
-        retryList = []
-        for future in done:
-            result: DownloadTaskResult = future.result()
-            canRetry = True
-            # Retry failed
-            if not result.result:
-                # Download fail
-                file = result.file
-                if file.id in retryTable:
-                    retryTable[file.id] -= 1
-                    if retryTable[file.id] <= 0:
-                        del retryTable[file.id]
-                        canRetry = False
-                else:
-                    # Possible to retry
-                    retryList.append((file, result.i))
-                    retryTable[file.id] = maxRetry
-            msg = __updateResultMessage(result, dfTable, canRetry)
-            progress.write(msg)
-        completedCount += len(done)
-        # Append retry
-        retryFutures = [
-            downloader.download(
-                f,
-                cfg.preferExportType[f.mime] if f.exportLinks else '',
-                cfg.exportMimeTable[cfg.preferExportType[f.mime]][1] if f.exportLinks else '',
-                i
-            ) for f, i in retryList]
-        progress.total += len(retryList)
-        futures = retryFutures
-        futures.extend(notdone)
-
-        # Dump df every 1000 files
-        if completedCount % 1000 == 0:
-            # My Drive
-            if '' in dfTable:
-                dfTable[''].to_csv(
-                    os.path.join(outputRoot, 'MyDrive.csv'), encoding='utf-8', index=False)
-            # Shared drives
-            for sharedDrive in client.sharedDrives:
-                if sharedDrive.driveId not in dfTable:
+    flushedCount = 0
+    # Retry table, map from (file id, export MIME) to retry remain count
+    retryTable: Dict[Tuple[str, str], int] = {}
+    # Download results and export MIME of streaming drives whose file info is not saved yet
+    pendingResults: Dict[str, List[Tuple[DownloadTaskResult, str]]] = {}
+    # Export MIME types failed of each document, see `__updateResultStatus`
+    failedExports: Dict[Tuple[str, int], Set[str]] = {}
+    # Only keep limited tasks in flight, files are pulled lazily for backpressure
+    maxInFlight = job * cfg.inFlightFactor
+    scheduler = Scheduler.fromConfig(cfg, schedule)
+    # Files of the same content are downloaded once, others are linked to it
+    dedup = Deduplicator(manifest, outputRoot) if cfg.dedup else None
+
+    def __schedule(f: FileInfo, i: int, exportMime: str):
+        """Schedule download task of given file unless it can be linked to a duplicate."""
+        if (dedup is None) or dedup.push(f, i, exportMime):
+            scheduler.push(f, i, exportMime)
+
+    for f, i, m in downloadList:
+        __schedule(f, i, m)
+    # Files and (size, seconds) of successful downloads for makespan report
+    scheduledFiles: List[FileInfo] = []
+    durations: List[Tuple[int, float]] = []
+    downloadStartTime = datetime.now()
+    retryQueue: Deque[Tuple[FileInfo, int, str]] = deque()
+    futures: Set[Future] = set()
+    # Map from running future to export MIME type of its task
+    taskMimes: Dict[Future, str] = {}
+    linkTasks: Set[Future] = set()
+    # Drives whose streaming pipeline fail
+    failedDrives: Set[str] = set()
+    statusTurn = 0
+    statusTime = 0.0
+
+    def __submit(f: FileInfo, i: int, exportMime: str):
+        """Submit download task of given file, exported as `exportMime` if not empty."""
+        scheduledFiles.append(f)
+        future = downloader.download(
+            f, exportMime, cfg.exportMimeTable[exportMime][1] if exportMime else '', i)
+        futures.add(future)
+        taskMimes[future] = exportMime
+
+    def __link(f: FileInfo, i: int, source: str, verify: bool):
+        """Submit task creating given file from local file of the same content."""
+        future = downloader.link(f, source, verify, i)
+        futures.add(future)
+        taskMimes[future] = ''
+        linkTasks.add(future)
+
+    try:
+        while True:
+            # Retry first, then scheduled files, streamed files are scheduled once they arrive
+            while len(futures) < maxInFlight:
+                if retryQueue:
+                    __submit(*retryQueue.popleft())
                     continue
-                dfTable[sharedDrive.driveId].to_csv(
-                    os.path.join(outputRoot, f'{sharedDrive.name}.csv'),
-                    encoding='utf-8', index=False)
-
-        progress.update(len(done))
-        if len(notdone) == 0:
-            progress.desc = __formatDesc('Complete', None)
-            progress.refresh()
-            break
-
-        # Need reauth?
-        if Downloader.RequireAuth:
-            client.auth()
-            downloader.resetAuthKey(client.authId)
-            Downloader.RequireAuth = False
-
-        # Show downloader worker's status
-        i = 0
-        for status in downloader.status.values():
-            if status.complete:
-                continue
-            progress.desc = __formatDesc(status.title, status)
-            progress.refresh()
-            i += 1
-            if i < downloader.maxJobs:
-                time.sleep(1)
-    progress.close()
+                if (dedup is not None) and (item := dedup.pop()) is not None:
+                    __link(*item)
+                    continue
+                if len(scheduler) > 0:
+                    __submit(*scheduler.pop())
+                    continue
+                if not streamingDrives:
+                    break
+                try:
+                    event = events.get(timeout=0 if futures else 1)
+                except Empty:
+                    break
+                if event[0] == 'file':
+                    _, _, f, i, m = event
+                    __schedule(f, i, m)
+                    progress.total += 1
+                elif event[0] == 'done':
+                    _, driveId, base = event
+                    rowBase[driveId] = base
+                    streamingDrives.pop(driveId, None)
+                    for result, m in pendingResults.pop(driveId, []):
+                        __updateResultStatus(result, m, manifest, base, failedExports)
+                else:
+                    # File info of the drive is not saved, downloaded files are checked in next run
+                    _, driveId, e = event
+                    progress.write(f'Drive {streamingDrives.pop(driveId, driveId)} fetch fail: {e}')
+                    failedDrives.add(driveId)
+                    pendingResults.pop(driveId, None)
+            done, futures = wait(futures, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                result: DownloadTaskResult = future.result()
+                exportMime = taskMimes.pop(future)
+                linked = future in linkTasks
+                linkTasks.discard(future)
+                canRetry = True
+                retried = False
+                if result.result and (not linked):
+                    durations.append((
+                        result.file.size,
+                        (result.requestTime + result.downloadTime).total_seconds()))
+                # Retry failed
+                if not result.result:
+                    # Download fail
+                    file = result.file
+                    key = (file.id, exportMime)
+                    if key in retryTable:
+                        retryTable[key] -= 1
+                        if retryTable[key] <= 0:
+                            del retryTable[key]
+                            canRetry = False
+                    else:
+                        # Possible to retry
+                        retryQueue.append((file, result.i, exportMime))
+                        retryTable[key] = maxRetry
+                        retried = True
+                        progress.total += 1
+                if (dedup is not None) and \
+                    (promoted := dedup.complete(result, exportMime, retried, linked)) is not None:
+                    # Download a waiting duplicate instead of the failed one
+                    scheduler.push(*promoted, exportMime)
+                __recordExport(result, manifest, outputRoot)
+                if result.file.driveId in rowBase:
+                    __updateResultStatus(
+                        result, exportMime, manifest, rowBase[result.file.driveId], failedExports)
+                elif result.file.driveId not in failedDrives:
+                    pendingResults.setdefault(result.file.driveId, []).append((result, exportMime))
+                msg = __updateResultMessage(result, canRetry)
+                progress.write(msg)
+            completedCount += len(done)
+
+            # Save status every 1000 files
+            if completedCount - flushedCount >= 1000:
+                manifest.flush()
+                flushedCount = completedCount
+
+            progress.update(len(done))
+            if (len(futures) == 0) and (len(retryQueue) == 0) and (len(scheduler) == 0) and \
+                ((dedup is None) or (len(dedup) == 0)) and \
+                (len(streamingDrives) == 0) and events.empty():
+                progress.desc = __formatDesc('Complete', None)
+                progress.refresh()
+                break
+
+            # Need reauth?
+            if Downloader.RequireAuth:
+                client.auth()
+                downloader.resetAuthKey(client.authId)
+                Downloader.RequireAuth = False
 
-    if '' in dfTable:
-        dfTable[''].to_csv(os.path.join(outputRoot, 'MyDrive.csv'), encoding='utf-8', index=False)
-    for sharedDrive in client.sharedDrives:
-        dfTable[sharedDrive.driveId].to_csv(
-            os.path.join(outputRoot, f'{sharedDrive.name}.csv'), encoding='utf-8', index=False)
-    failDf = pd.concat([df.loc[df['status'] == 'Fail'] for df in dfTable.values()])
-    failDf.to_csv(os.path.join(outputRoot, 'fail.csv'), index=None)
+            # Show downloader worker's status in turn, one per second
+            if time.monotonic() - statusTime >= 1:
+                statusTime = time.monotonic()
+                running = [status for status in downloader.status.values() if not status.complete]
+                if running:
+                    statusTurn = (statusTurn + 1) % len(running)
+                    progress.desc = __formatDesc(running[statusTurn].title, running[statusTurn])
+                    progress.refresh()
+        progress.close()
+        downloadEndTime = datetime.now()
+        # Connection pool is cleared once closed
+        requestCount, connectionCount = downloader.connectionStats
+    finally:
+        # Save status and release connections even if interrupted
+        downloader.close()
+        manifest.flush()
+        failCount = manifest.exportCsv(os.path.join(outputRoot, 'fail.csv'), status='Fail')
+        manifest.close()
+        verifier.close()
+        if hashCache:
+            hashCache.close()
 
     print('Complete')
-    print(f'Failed files: {len(failDf)}')
-    if len(failDf) > 0:
+    print(f'Failed files: {failCount}')
+    print(f'Download requests: {requestCount}, connections opened: {connectionCount}, ' + \
+        f'reused: {max(requestCount - connectionCount, 0)}')
+    if http2:
+        print(f'HTTP/2 used: {downloader.http2}')
+    print(f'Rate limited responses: {limiter.throttleCount}, final concurrency: {limiter.limit}')
+    if dedup is not None:
+        print(f'Deduplicated files: {dedup.linkCount}, bytes not downloaded: {dedup.linkedBytes}')
+    print(f'Hedged requests: {downloader.hedgeCount}')
+    if durations:
+        overhead, secondsPerByte = fitDuration(durations)
+        print(f'Makespan: {downloadEndTime - downloadStartTime} by {schedule}, estimated:')
+        for policy in Scheduler.Policies:
+            estimated = Scheduler(policy, cfg.schedulePriority).estimateMakespan(
+                scheduledFiles, job, overhead, secondsPerByte)
+            print(f'  - {policy}: {timedelta(seconds=estimated)}')
+    if failedDrives:
+        print(f'Fetch of {len(failedDrives)} drives fail, run again to export them.')
+    if failCount > 0:
         print(f'Record of all failed files are saved to {os.path.join(outputRoot, "fail.csv")}')
@@ -1,12 +1,19 @@
 # -*- coding: utf-8 -*-
-from typing import Dict, Generator, List
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Dict, Generator, List, Tuple
 from datetime import datetime
+import json
 import os
+import threading
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 from .file import FileInfo
+from .filter import FileFilter
+from .ratelimit import RateLimiter, parseRetryAfter
 
 
 class GoogleDriveClient:
@@ -33,6 +40,16 @@ class GoogleDriveClient:
     ]
     """API scope definitions."""
 
+    __MaxRetry = 5
+    """Max retry when request is rate limited."""
+
+    __FileFields = 'id, name, parents, mimeType, exportLinks, ' + \
+        'modifiedTime, createdTime, viewedByMeTime, size, md5Checksum, trashed, ownedByMe'
+    """Fields of file resource to query."""
+
+    __OptionalFields = ['exportLinks', 'trashed', 'ownedByMe']
+    """Fields of file resource can be omitted by `fileFields`."""
+
     class AccountInfo:
         """Defines drive account information."""
         def __init__(
@@ -98,12 +115,25 @@ class GoogleDriveClient:
             return self.__id
 
 
-    def __init__(self, userAccount: str):
+    def __init__(
+        self, userAccount: str, limiter: RateLimiter | None = None, apiEndpoint: str = '',
+    ):
+        """Create client.
+         :param userAccount: user email address.
+         :param limiter: rate limiter shared with downloader. Requests are not throttled locally
+            but still backoff on rate limit errors if not given.
+         :param apiEndpoint: root URL of Drive API, e.g. local mock server. Empty for Google.
+        """
         self.__authId = ''
         self.__targetUserAccount = userAccount.lower()
-        self.__service = None
+        self.__credential = None
+        self.__local = threading.local()
+        self.__generation = 0
         self.__account = None
         self.__sharedDrives = []
+        self.__limiter = limiter if limiter else RateLimiter(rate=0)
+        self.__clientOptions = \
+            {'api_endpoint': f'{apiEndpoint.rstrip("/")}/drive/v3/'} if apiEndpoint else None
 
     @property
     def authId(self) -> str:
@@ -157,23 +187,56 @@ class GoogleDriveClient:
             with open(tokenFilePath, 'w', encoding='utf-8') as file:
                 file.write(credential.to_json())
         self.__authId = credential.token
-        self.__service = build('drive', 'v3', credentials=credential)
+        self.__credential = credential
+        self.__generation += 1
+
+    @property
+    def __service(self) -> Any:
+        """Get drive service of current thread.
+         Service object is not thread-safe, so each thread builds its own service.
+        """
+        local = self.__local
+        if getattr(local, 'generation', -1) != self.__generation:
+            local.service = build(
+                'drive', 'v3', credentials=self.__credential, cache_discovery=False,
+                client_options=self.__clientOptions)
+            local.generation = self.__generation
+        return local.service
 
     def queryAccount(self) -> AccountInfo:
         """Request `About` API and get account info. """
         # pylint: disable=no-member
-        result = self.__service.about().get(
+        result = self.__execute(self.__service.about().get(
             fields='user(emailAddress), storageQuota, exportFormats'
-        ).execute()
+        ))
         return GoogleDriveClient.AccountInfo(**result)
 
+    @staticmethod
+    def fileFields(
+        exportLinks: bool = True, trashed: bool = True, ownedByMe: bool = True,
+    ) -> str:
+        """Get fields mask of file resource, omit fields not required by current mode.
+        Omitted fields are set to default value of `FileInfo`, so only omit a field if its value is
+        known, e.g. `trashed` is always false if trashed files are not listed.
+         :param exportLinks: list export links, required for exporting Google documents.
+         :param trashed: list trashed flag.
+         :param ownedByMe: list owner flag.
+        """
+        omitted = {
+            name for name, need in zip(
+                GoogleDriveClient.__OptionalFields, (exportLinks, trashed, ownedByMe))
+            if not need
+        }
+        return ', '.join(
+            f for f in GoogleDriveClient.__FileFields.split(', ') if f not in omitted)
+
     def querySharedDrives(self) -> List[SharedDriveInfo]:
         """Query all shared drives."""
         param = {'pageSize': 20, 'fields': 'nextPageToken, drives(id, name)'}
         driveList = []
         while True:
             # pylint: disable=no-member
-            result = self.__service.drives().list(**param).execute()
+            result = self.__execute(self.__service.drives().list(**param))
             driveList.extend(GoogleDriveClient.SharedDriveInfo(**info) for info in result['drives'])
             if 'nextPageToken' in result:
                 param['pageToken'] = result['nextPageToken']
@@ -183,6 +246,7 @@ class GoogleDriveClient:
 
     def queryFiles(
         self, driveId = '', pageSize=100, trashed=False, sharedType='owned',
+        fileFilter: FileFilter | None = None, fields: str = '',
     ) -> Generator[List[FileInfo], None, None]:
         """Query block of files info.
         This is a generator function, a small set of files info will be returned in every call.
@@ -204,6 +268,9 @@ class GoogleDriveClient:
             - both: include both shared with me and owned by me.
             - owned: only owned by me.
             - shared: only shared with me.
+         :param fileFilter: user filter compiled into query. Conditions can not be expressed in
+            query are not applied, check them by `FileFilter.match`.
+         :param fields: fields mask of file resource from `fileFields`, empty for all fields.
          :returns: list of FileInfo and a token for querying in next iteration.
         """
         # Query root folder id
@@ -213,43 +280,198 @@ class GoogleDriveClient:
                 datetime.utcnow(), datetime.utcnow(), datetime.utcnow(), driveId=driveId)]
         else:
             # pylint: disable=no-member
-            result = self.__service.files().get(
+            result = self.__execute(self.__service.files().get(
                 fileId='root', fields='id, mimeType, modifiedTime, createdTime, viewedByMeTime'
-            ).execute()
+            ))
             yield [FileInfo(result['id'], '', result['mimeType'],
                 result['createdTime'], result['modifiedTime'], driveId=driveId)]
 
+        param = self.__listParam(driveId, pageSize, trashed, sharedType, fileFilter, fields)
+        while True:
+            # pylint: disable=no-member
+            result = self.__execute(self.__service.files().list(**param))
+            yield [FileInfo(**info, driveId=driveId) for info in result['files']]
+            if 'nextPageToken' in result:
+                param['pageToken'] = result['nextPageToken']
+            else:
+                break
+
+    def queryFilesPartitioned(
+        self, driveId = '', pageSize=100, trashed=False, sharedType='owned', maxWorkers=8,
+        batchSize=20, fileFilter: FileFilter | None = None, fields: str = '',
+    ) -> Generator[List[FileInfo], None, None]:
+        """Query block of files info by crawling folders concurrently.
+        Folders are crawled in breadth-first order by `'<id>' in parents` queries, and each query
+        includes at most `batchSize` folders. Blocks are yielded in the same form as `queryFiles`
+        but not in listing order.
+
+        Note that only files reachable from drive root are returned, files in *Shared with me*
+        without accessible parent folder are not included. Folders of other owners are crawled
+        for owned files in them, but not returned the same as `queryFiles`.
+
+         :param driveId: shared drive Id. Set to empty string to query **My Drive**.
+         :param pageSize: max # of file to query.
+         :param trashed: include trashed file or not.
+         :param sharedType: fetch files with owner filter, see `queryFiles`.
+         :param maxWorkers: max concurrent queries.
+         :param batchSize: max # of folders in single query.
+         :param fileFilter: user filter compiled into query, see `queryFiles`.
+         :param fields: fields mask of file resource, see `queryFiles`.
+        """
+        def __listChildren(folderIds: List[str]) -> List[FileInfo]:
+            """List all children of given folders."""
+            param = self.__listParam(
+                driveId, pageSize, trashed, sharedType, fileFilter, fields, keepFolders=True)
+            parentQuery = ' or '.join(f"'{folderId}' in parents" for folderId in folderIds)
+            param['q'] = f'({parentQuery}) and {param["q"]}' if 'q' in param else parentQuery
+            files = []
+            while True:
+                # pylint: disable=no-member
+                result = self.__execute(self.__service.files().list(**param))
+                files.extend(FileInfo(**info, driveId=driveId) for info in result['files'])
+                if 'nextPageToken' in result:
+                    param['pageToken'] = result['nextPageToken']
+                else:
+                    return files
+
+        ownedOnly = (not driveId) and (sharedType == 'owned')
+        if ownedOnly and fields and ('ownedByMe' not in fields):
+            fields += ', ownedByMe'
+        rootIter = self.queryFiles(driveId, pageSize, trashed, sharedType, fileFilter, fields)
+        root = next(rootIter)
+        rootIter.close()
+        yield root
+        pendingFolders = [root[0].id]
+        visited = set(pendingFolders)
+        with ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix='LS') as executor:
+            futures = set()
+            while pendingFolders or futures:
+                while pendingFolders:
+                    futures.add(executor.submit(__listChildren, pendingFolders[:batchSize]))
+                    pendingFolders = pendingFolders[batchSize:]
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files = future.result()
+                    for file in files:
+                        if file.isFolder() and (file.id not in visited):
+                            visited.add(file.id)
+                            pendingFolders.append(file.id)
+                    yield [file for file in files if file.owned] if ownedOnly else files
+
+    def queryStartPageToken(self, driveId: str = '') -> str:
+        """Get page token for listing future changes by `queryChanges`.
+         :param driveId: shared drive Id. Set to empty string to query **My Drive**.
+        """
+        param = {}
+        if driveId:
+            param['driveId'] = driveId
+            param['supportsAllDrives'] = True
+        # pylint: disable=no-member
+        result = self.__execute(self.__service.changes().getStartPageToken(**param))
+        return result['startPageToken']
+
+    def queryChanges(
+        self, pageToken: str, driveId: str = '', pageSize: int = 100, fields: str = '',
+    ) -> Tuple[List[Tuple[str, FileInfo | None]], str]:
+        """Query all file changes since given page token.
+
+         :param pageToken: page token from `queryStartPageToken` or previous `queryChanges`.
+         :param driveId: shared drive Id. Set to empty string to query **My Drive**.
+         :param pageSize: max # of changes per request.
+         :param fields: fields mask of file resource from `fileFields`, empty for all fields.
+            Changes are not filtered by query, so `trashed` and `ownedByMe` should be listed.
+         :returns: Tuple of:
+            - List of changed file Id and its latest file info. File info is None if file has
+              been removed or access is lost.
+            - Page token for querying next changes.
+        """
+        param = {
+            'pageToken': pageToken,
+            'pageSize': pageSize,
+            'includeRemoved': True,
+            'fields': 'nextPageToken, newStartPageToken, ' + \
+                'changes(changeType, fileId, removed, ' + \
+                f'file({fields or GoogleDriveClient.__FileFields}))',
+        }
+        if driveId:
+            param['driveId'] = driveId
+            param['includeItemsFromAllDrives'] = True
+            param['supportsAllDrives'] = True
+        changes = []
+        while True:
+            # pylint: disable=no-member
+            result = self.__execute(self.__service.changes().list(**param))
+            for change in result['changes']:
+                if change.get('changeType', 'file') != 'file':
+                    continue
+                file = None if change.get('removed') or ('file' not in change) else \
+                    FileInfo(**change['file'], driveId=driveId)
+                changes.append((change['fileId'], file))
+            if 'nextPageToken' in result:
+                param['pageToken'] = result['nextPageToken']
+            else:
+                return changes, result['newStartPageToken']
+
+    def __listParam(
+        self, driveId: str, pageSize: int, trashed: bool, sharedType: str,
+        fileFilter: FileFilter | None = None, fields: str = '', keepFolders: bool = False,
+    ) -> Dict[str, Any]:
+        """Build parameters of `files.list`.
+         :param keepFolders: owned filter keeps folders of other owners, for crawling owned files
+            in them.
+        """
         param = {
             'pageSize': pageSize,
-            'fields' : 'nextPageToken, ' + \
-                'files(id, name, parents, mimeType, exportLinks, ' + \
-                    'modifiedTime, createdTime, viewedByMeTime, size, md5Checksum, trashed, ' + \
-                    'ownedByMe)'
+            'fields' : f'nextPageToken, files({fields or GoogleDriveClient.__FileFields})'
         }
         if not trashed:
             param['q'] = 'trashed = false'
         if not driveId:
             # My Drive only, shared drives use 'me' in owners will return nothing but just root
             if sharedType == 'owned':
+                owned = '\'me\' in owners'
+                if keepFolders:
+                    owned = f'(mimeType = \'application/vnd.google-apps.folder\' or {owned})'
                 if 'q' in param:
-                    param['q'] += ' and \'me\' in owners'
+                    param['q'] += f' and {owned}'
                 else:
-                    param['q'] = '\'me\' in owners'
+                    param['q'] = owned
             elif sharedType == 'shared':
                 if 'q' in param:
-                    param['q'] += ' and (not \'me\' not in owners)'
+                    param['q'] += ' and (not \'me\' in owners)'
                 else:
                     param['q'] = 'not \'me\' in owners'
+        if fileFilter and (query := fileFilter.query()):
+            param['q'] = f'{param["q"]} and {query}' if 'q' in param else query
         if driveId:
             param['driveId'] = driveId
             param['includeItemsFromAllDrives'] = True
             param['supportsAllDrives'] = True
             param['corpora'] = 'drive'
-        while True:
-            # pylint: disable=no-member
-            result = self.__service.files().list(**param).execute()
-            yield [FileInfo(**info, driveId=driveId) for info in result['files']]
-            if 'nextPageToken' in result:
-                param['pageToken'] = result['nextPageToken']
-            else:
-                break
+        return param
+
+    def __execute(self, request: HttpRequest) -> Dict[str, Any]:
+        """Execute API request under shared rate limiter, retry if request is rate limited."""
+        for retry in range(GoogleDriveClient.__MaxRetry):
+            self.__limiter.acquire()
+            try:
+                return request.execute()
+            except HttpError as e:
+                if (retry + 1 >= GoogleDriveClient.__MaxRetry) or (not _isRateLimitError(e)):
+                    raise
+                self.__limiter.onThrottle(parseRetryAfter(e.resp.get('retry-after')))
+        return {}
+
+
+def _isRateLimitError(e: HttpError) -> bool:
+    """Check if API error is caused by rate limit (429 or 403 rate limit exceeded)."""
+    if e.resp.status == 429:
+        return True
+    if e.resp.status != 403:
+        return False
+    try:
+        content = e.content.decode('utf-8') if isinstance(e.content, bytes) else e.content
+        reasons = [err.get('reason') for err in json.loads(content)['error']['errors']]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return False
+    return ('userRateLimitExceeded' in reasons) or ('rateLimitExceeded' in reasons)
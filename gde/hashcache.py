@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from threading import Lock
+from typing import List, Tuple
+import os
+import sqlite3
+
+
+class HashCache:
+    """Persistent MD5 cache of local files, backed by SQLite in WAL mode.
+
+    Each entry maps stat identity of a file, (device, inode, size, mtime), to its MD5 verified
+    last time. An entry is dropped once stat identity of its file changed, so unchanged files are
+    never read again and modified files are always hashed again. Files without inode are not
+    cached.
+
+    This class is thread-safe, all operations share one connection guarded by a lock. New
+    entries are buffered and written in a single transaction when `flush` is called or buffer is
+    full.
+    """
+
+    def __init__(self, path: str, batchSize: int = 1000) -> None:
+        """Open or create cache.
+         :param path: path to SQLite database file.
+         :param batchSize: max # of buffered entries before writing to database.
+        """
+        self.__lock = Lock()
+        self.__batchSize = batchSize
+        self.__pending: List[Tuple[int, int, int, int, str]] = []
+        self.__conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.__conn.execute('PRAGMA journal_mode=WAL')
+        self.__conn.execute('PRAGMA synchronous=NORMAL')
+        self.__conn.execute(
+            'CREATE TABLE IF NOT EXISTS hashes ('
+            'dev INTEGER, ino INTEGER, size INTEGER, mtime INTEGER, md5 TEXT, '
+            'PRIMARY KEY (dev, ino))')
+
+    def close(self):
+        """Flush buffered entries and close database."""
+        self.flush()
+        with self.__lock:
+            self.__conn.close()
+
+    def get(self, path: str, stat: os.stat_result | None = None) -> str:
+        """Get cached MD5 of given file.
+         :param stat: stat result of the file, stat again if not given.
+         :returns: hex formatted MD5 hash, empty string if not cached or file has been changed.
+        """
+        stat = self.__identity(path, stat)
+        if stat is None:
+            return ''
+        with self.__lock:
+            row = self.__conn.execute(
+                'SELECT size, mtime, md5 FROM hashes WHERE dev = ? AND ino = ?',
+                (stat.st_dev, stat.st_ino)).fetchone()
+            if row is None:
+                return ''
+            if (row[0] == stat.st_size) and (row[1] == stat.st_mtime_ns):
+                return row[2]
+            # Stat identity changed, drop stale entry
+            self.__conn.execute(
+                'DELETE FROM hashes WHERE dev = ? AND ino = ?', (stat.st_dev, stat.st_ino))
+            return ''
+
+    def put(self, path: str, md5Hash: str, stat: os.stat_result | None = None):
+        """Buffer MD5 of given file.
+         :param stat: stat result of the file when hash is computed, stat again if not given.
+        """
+        stat = self.__identity(path, stat)
+        if stat is None:
+            return
+        with self.__lock:
+            self.__pending.append(
+                (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, md5Hash))
+            needFlush = len(self.__pending) >= self.__batchSize
+        if needFlush:
+            self.flush()
+
+    @staticmethod
+    def __identity(path: str, stat: os.stat_result | None) -> os.stat_result | None:
+        """Get stat result carrying device and inode of given file, None if file system does not
+        provide inode, in which case the file is not cached.
+        On Windows, stat of `os.DirEntry` always has zero inode, so stat again by path.
+        """
+        if (stat is not None) and stat.st_ino:
+            return stat
+        stat = os.stat(path)
+        return stat if stat.st_ino else None
+
+    def flush(self):
+        """Write all buffered entries in a single transaction."""
+        with self.__lock:
+            if not self.__pending:
+                return
+            self.__conn.execute('BEGIN')
+            self.__conn.executemany(
+                'INSERT OR REPLACE INTO hashes (dev, ino, size, mtime, md5) VALUES (?, ?, ?, ?, ?)',
+                self.__pending)
+            self.__conn.execute('COMMIT')
+            self.__pending = []
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from threading import Lock
+from typing import Dict, Set
+import itertools
+import os
+import random
+
+
+class LocalIndex:
+    """In-memory index of local files under output root.
+
+    Each drive root folder (first level folder under output root, e.g. `MyDrive`,
+    `MyDrive-Trash`) is walked once by `os.scandir` when it is first looked up, then existence,
+    stat and collision-free naming of files under it are answered from memory. Downloaded files
+    are added back by `add`, so the index is kept updated during the whole run.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, outputRoot: str) -> None:
+        """Create index.
+         :param outputRoot: output root path, paths given to this index must be under it.
+        """
+        self.__outputRoot = outputRoot
+        self.__prefix = os.path.join(outputRoot, '')
+        self.__lock = Lock()
+        # Map from full path to stat of regular files, None if name is reserved by `reserve`
+        self.__files: Dict[str, os.stat_result | None] = {}
+        self.__scanned: Set[str] = set()
+        self.__scanLocks: Dict[str, Lock] = {}
+
+    @property
+    def count(self) -> int:
+        """Get # of indexed files."""
+        return len(self.__files)
+
+    def stat(self, path: str) -> os.stat_result | None:
+        """Get stat of given regular file, None if not exists."""
+        self.__ensureScanned(path)
+        return self.__files.get(path)
+
+    def isfile(self, path: str) -> bool:
+        """Check if given path is an exist regular file."""
+        return self.stat(path) is not None
+
+    def add(self, path: str, stat: os.stat_result | None = None):
+        """Add or update given file after it is written.
+         :param stat: stat of the file, stat again if not given.
+        """
+        self.__ensureScanned(path)
+        stat = stat if stat else os.stat(path)
+        with self.__lock:
+            self.__files[path] = stat
+
+    def reserve(self, path: str, suffix: str = '') -> str:
+        """Get file name that does not duplicate with exist or reserved files, and reserve it.
+        Name is suffixed by `-0` to `-9`, or a random number if all are used.
+
+         :param suffix: appended to chosen name if it does not end with it, e.g. export extension.
+        """
+        self.__ensureScanned(path)
+        name, ext = os.path.splitext(path)
+        candidates = itertools.chain(
+            [path], (f'{name}-{i}{ext}' for i in range(10)),
+            (f'{name}-{random.randint(10, 100000)}{ext}' for _ in itertools.count()))
+        with self.__lock:
+            for candidate in candidates:
+                if candidate in self.__files:
+                    continue
+                if suffix and (not candidate.endswith(suffix)):
+                    candidate += suffix
+                self.__files[candidate] = None
+                return candidate
+
+    def __ensureScanned(self, path: str):
+        """Scan drive root folder which contains given path if it has not been scanned."""
+        rel = path[len(self.__prefix):] if path.startswith(self.__prefix) else \
+            os.path.relpath(path, self.__outputRoot)
+        root = self.__prefix + rel.split(os.path.sep, 1)[0]
+        if root in self.__scanned:
+            return
+        with self.__lock:
+            scanLock = self.__scanLocks.setdefault(root, Lock())
+        with scanLock:
+            if root in self.__scanned:
+                return
+            files = self.__scan(root)
+            with self.__lock:
+                for k, v in files.items():
+                    # Files added during scanning are newer
+                    self.__files.setdefault(k, v)
+                self.__scanned.add(root)
+
+    @staticmethod
+    def __scan(root: str) -> Dict[str, os.stat_result]:
+        """Walk given folder and stat all regular files."""
+        files = {}
+        stack = [root]
+        while stack:
+            folder = stack.pop()
+            try:
+                it = os.scandir(folder)
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            files[entry.path] = entry.stat()
+                    except OSError:
+                        continue
+        return files
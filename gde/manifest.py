@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+from threading import Lock
+from typing import Any, Dict, Generator, Iterable, List, Sequence, Tuple
+import csv
+import itertools
+import os
+import sqlite3
+import pandas as pd
+
+
+class Manifest:
+    """File info and download status store of all drives, backed by SQLite in WAL mode.
+
+    Each row is a file info dict generated in check phase with its action, status and message.
+    Row id is used as index `i` of download tasks for fast updating status. Status updates are
+    buffered and written in a single transaction when `flush` is called or buffer is full.
+
+    Exported Google documents are also tracked by (file Id, export MIME) with source
+    `modifiedTime` and local stat, so unchanged documents are not exported again.
+
+    This class is thread-safe, all operations share one connection guarded by a lock.
+    """
+
+    Columns = [
+        'id', 'name', 'mimeType', 'parents', 'driveId', 'createdTime', 'modifiedTime',
+        'viewedByMeTime', 'md5Checksum', 'size', 'exportLinks', 'trashed', 'path', 'type',
+        'ownedByMe', 'action', 'status', 'message', 'driveName',
+    ]
+    """Columns of file table, same order as exported CSV."""
+
+    def __init__(self, path: str, batchSize: int = 1000) -> None:
+        """Open or create manifest.
+         :param path: path to SQLite database file.
+         :param batchSize: max # of buffered status updates before writing to database.
+        """
+        self.__lock = Lock()
+        self.__batchSize = batchSize
+        self.__updates: List[Tuple[str, str, int]] = []
+        self.__exports: List[Tuple[str, str, str, str, str, str, int, int]] = []
+        self.__conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.__conn.execute('PRAGMA journal_mode=WAL')
+        self.__conn.execute('PRAGMA synchronous=NORMAL')
+        columns = ', '.join(
+            f'{c} INTEGER' if c in ('size', 'trashed', 'ownedByMe') else f'{c} TEXT'
+            for c in Manifest.Columns)
+        self.__conn.execute(f'CREATE TABLE IF NOT EXISTS files ({columns})')
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_files_id ON files(driveId, id)')
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_files_status ON files(driveId, status)')
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_files_path ON files(driveId, path)')
+        self.__conn.execute(
+            'CREATE INDEX IF NOT EXISTS idx_files_md5 ON files(md5Checksum, size)')
+        self.__conn.execute(
+            'CREATE TABLE IF NOT EXISTS exports ('
+            'id TEXT, exportMime TEXT, driveId TEXT, modifiedTime TEXT, path TEXT, '
+            'localPath TEXT, size INTEGER, mtime INTEGER, PRIMARY KEY (id, exportMime))')
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_exports_drive ON exports(driveId)')
+
+    def close(self):
+        """Flush buffered updates and close database."""
+        self.flush()
+        with self.__lock:
+            self.__conn.close()
+
+    def hasDrive(self, driveId: str) -> bool:
+        """Check if any file of given drive is stored."""
+        with self.__lock:
+            return self.__conn.execute(
+                'SELECT 1 FROM files WHERE driveId = ? LIMIT 1', (driveId,)).fetchone() is not None
+
+    def drives(self) -> List[Tuple[str, str]]:
+        """Get (drive Id, drive name) of all stored drives."""
+        with self.__lock:
+            return self.__conn.execute(
+                'SELECT driveId, MAX(driveName) FROM files GROUP BY driveId').fetchall()
+
+    def countDrive(self, driveId: str) -> int:
+        """Get # of stored files of given drive."""
+        with self.__lock:
+            return self.__conn.execute(
+                'SELECT COUNT(*) FROM files WHERE driveId = ?', (driveId,)).fetchone()[0]
+
+    def replaceDrive(self, driveId: str, driveName: str, rows: Iterable[Sequence[Any]]) -> int:
+        """Replace all files of given drive.
+         :param rows: values of `Columns` of each file, `driveName` column is filled by given
+            name. Row id is assigned continuously in given order.
+         :returns: row id of the first row. Row id of `k`-th row is returned value plus `k`.
+        """
+        with self.__lock:
+            self.__conn.execute('BEGIN')
+            try:
+                self.__conn.execute('DELETE FROM files WHERE driveId = ?', (driveId,))
+                base = self.__insert(driveName, rows)
+                self.__conn.execute('COMMIT')
+            except Exception:
+                self.__conn.execute('ROLLBACK')
+                raise
+        return base
+
+    def updateDrive(
+        self, driveId: str, driveName: str, removedIds: Iterable[str], rows: Sequence[Sequence[Any]]
+    ) -> int:
+        """Remove and rewrite given files of given drive, other files are kept.
+         :param removedIds: Id of files to be removed.
+         :param rows: values of `Columns` of files to be written, stored rows of the same Id are
+            replaced. Row id is assigned the same as `replaceDrive`.
+         :returns: row id of the first row, see `replaceDrive`.
+        """
+        idIndex = Manifest.Columns.index('id')
+        with self.__lock:
+            self.__conn.execute('BEGIN')
+            try:
+                self.__conn.executemany(
+                    'DELETE FROM files WHERE driveId = ? AND id = ?',
+                    ((driveId, fileId) for fileId in itertools.chain(
+                        removedIds, (row[idIndex] for row in rows))))
+                base = self.__insert(driveName, rows)
+                self.__conn.execute('COMMIT')
+            except Exception:
+                self.__conn.execute('ROLLBACK')
+                raise
+        return base
+
+    def __insert(self, driveName: str, rows: Iterable[Sequence[Any]]) -> int:
+        """Insert rows after all stored rows in current transaction, see `replaceDrive`."""
+        nameIndex = Manifest.Columns.index('driveName')
+        placeholder = ', '.join('?' * (len(Manifest.Columns) + 1))
+        sql = f'INSERT INTO files (rowid, {", ".join(Manifest.Columns)}) VALUES ({placeholder})'
+        base = self.__conn.execute('SELECT COALESCE(MAX(rowid), 0) + 1 FROM files').fetchone()[0]
+        self.__conn.executemany(sql, (
+            (base + k, *(driveName if n == nameIndex else _toSql(v) for n, v in enumerate(row)))
+            for k, row in enumerate(rows)))
+        return base
+
+    def loadRows(self, driveId: str, ids: Iterable[str], chunkSize: int = 500) -> List[Tuple]:
+        """Get raw rows of given files of given drive, files not stored are ignored.
+         :returns: list of rows, each row is (row id, *`Columns`).
+        """
+        sql = f'SELECT rowid, {", ".join(Manifest.Columns)} FROM files WHERE driveId = ? AND id IN'
+        ids = list(ids)
+        rows = []
+        for k in range(0, len(ids), chunkSize):
+            chunk = ids[k:k + chunkSize]
+            with self.__lock:
+                rows.extend(self.__conn.execute(
+                    f'{sql} ({", ".join("?" * len(chunk))})', (driveId, *chunk)).fetchall())
+        return rows
+
+    def loadRowsUnder(self, driveId: str, path: str) -> List[Tuple]:
+        """Get raw rows of files of given drive under given folder path, by index of path.
+         :returns: list of rows, each row is (row id, *`Columns`).
+        """
+        # Paths starting with `<path>/` are between it and `<path>` followed by next character
+        prefix = path + os.path.sep
+        with self.__lock:
+            return self.__conn.execute(
+                f'SELECT rowid, {", ".join(Manifest.Columns)} FROM files '
+                'WHERE driveId = ? AND path > ? AND path < ?',
+                (driveId, prefix, path + chr(ord(os.path.sep) + 1))).fetchall()
+
+    def iterDrive(
+        self, driveId: str, status: str = '', chunkSize: int = 10000
+    ) -> Generator[Tuple[int, Dict[str, Any]], None, None]:
+        """Iterate files of given drive without loading all rows into memory.
+         :param status: only iterate files with given status, empty for all files.
+         :returns: generator of (row id, file info dict).
+        """
+        for rows in self.iterDriveRows(driveId, status, chunkSize):
+            for row in rows:
+                yield row[0], dict(zip(Manifest.Columns, row[1:]))
+
+    def iterDriveRows(
+        self, driveId: str, status: str = '', chunkSize: int = 10000
+    ) -> Generator[List[Tuple], None, None]:
+        """Iterate chunks of raw rows of given drive, for building file info in bulk.
+         :param status: only iterate files with given status, empty for all files.
+         :returns: generator of row lists, each row is (row id, *`Columns`).
+        """
+        sql = f'SELECT rowid, {", ".join(Manifest.Columns)} FROM files WHERE driveId = ?'
+        param = [driveId]
+        if status:
+            sql += ' AND status = ?'
+            param.append(status)
+        lastRowId = 0
+        while True:
+            with self.__lock:
+                rows = self.__conn.execute(
+                    sql + ' AND rowid > ? ORDER BY rowid LIMIT ?',
+                    (*param, lastRowId, chunkSize)).fetchall()
+            if not rows:
+                break
+            yield rows
+            lastRowId = rows[-1][0]
+
+    def findBlob(self, md5Checksum: str, size: int, excludeId: str = '') -> str:
+        """Find a file of given content which has been downloaded or verified.
+         :param excludeId: file Id to be ignored, e.g. the file looking for its content.
+         :returns: path of found file, empty if not found.
+        """
+        with self.__lock:
+            row = self.__conn.execute(
+                'SELECT path FROM files WHERE md5Checksum = ? AND size = ? AND status = ? '
+                'AND id != ? LIMIT 1', (md5Checksum, size, 'OK', excludeId)).fetchone()
+        return row[0] if row else ''
+
+    def updateStatus(self, rowId: int, status: str, message: str):
+        """Buffer status update of given row."""
+        with self.__lock:
+            self.__updates.append((status, message, rowId))
+            needFlush = len(self.__updates) >= self.__batchSize
+        if needFlush:
+            self.flush()
+
+    def putExport(
+        self, fileId: str, exportMime: str, driveId: str, modifiedTime: str, path: str,
+        localPath: str, stat: os.stat_result,
+    ):
+        """Buffer record of exported file.
+         :param modifiedTime: modified time of exported document, in ISO format.
+         :param path: path of document in drive when exported.
+         :param localPath: path of exported file relative to output root.
+         :param stat: stat of exported file.
+        """
+        with self.__lock:
+            self.__exports.append((
+                fileId, exportMime, driveId, modifiedTime, path, localPath, stat.st_size,
+                stat.st_mtime_ns))
+            needFlush = len(self.__exports) >= self.__batchSize
+        if needFlush:
+            self.flush()
+
+    def loadExports(self, driveId: str) -> Dict[Tuple[str, str], Tuple[str, str, str, int, int]]:
+        """Get exported files of given drive.
+         :returns: map from (file Id, export MIME) to
+            (modifiedTime, path, localPath, size, mtime in ns), see `putExport`.
+        """
+        with self.__lock:
+            rows = self.__conn.execute(
+                'SELECT id, exportMime, modifiedTime, path, localPath, size, mtime '
+                'FROM exports WHERE driveId = ?', (driveId,)).fetchall()
+        return {(row[0], row[1]): row[2:] for row in rows}
+
+    def flush(self):
+        """Write all buffered status updates and export records in a single transaction."""
+        with self.__lock:
+            if (not self.__updates) and (not self.__exports):
+                return
+            self.__conn.execute('BEGIN')
+            self.__conn.executemany(
+                'UPDATE files SET status = ?, message = ? WHERE rowid = ?', self.__updates)
+            self.__conn.executemany(
+                'INSERT OR REPLACE INTO exports (id, exportMime, driveId, modifiedTime, path, '
+                'localPath, size, mtime) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', self.__exports)
+            self.__conn.execute('COMMIT')
+            self.__updates = []
+            self.__exports = []
+
+    def importCsv(self, csvPath: str, chunkSize: int = 100000) -> Tuple[str, str]:
+        """Import file info CSV generated by previous version into manifest.
+         :returns: (drive Id, drive name) of imported drive.
+        """
+        reader = pd.read_csv(
+            csvPath, encoding='utf-8', keep_default_na=False, chunksize=chunkSize, dtype=str)
+        first = next(reader, None)
+        if (first is None) or (len(first) == 0):
+            return '', ''
+        driveId = first['driveId'].iloc[0]
+        driveName = first['driveName'].iloc[0] if 'driveName' in first else \
+            first['path'].iloc[0].split(os.path.sep)[0]
+
+        def __rows() -> Generator[Tuple, None, None]:
+            for df in itertools.chain([first], reader):
+                # Convert types by columns instead of each row
+                df['size'] = pd.to_numeric(df['size'], errors='coerce').fillna(0).astype('int64') \
+                    if 'size' in df else 0
+                df['trashed'] = (df['trashed'] == 'True') if 'trashed' in df else False
+                df['ownedByMe'] = (df['ownedByMe'] == 'True') if 'ownedByMe' in df else True
+                for row in df.to_dict('records'):
+                    yield tuple(row.get(c, '') for c in Manifest.Columns)
+
+        self.replaceDrive(driveId, driveName, __rows())
+        return driveId, driveName
+
+    def exportCsv(self, csvPath: str, driveId: str | None = None, status: str = '') -> int:
+        """Export files to CSV.
+         :param driveId: only export files of given drive, None for all drives.
+         :param status: only export files with given status, empty for all files.
+         :returns: # of exported files.
+        """
+        drives = [driveId] if driveId is not None else [d for d, _ in self.drives()]
+        count = 0
+        with open(csvPath, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(Manifest.Columns)
+            for d in drives:
+                for _, row in self.iterDrive(d, status):
+                    writer.writerow(_fromSql(c, row[c]) for c in Manifest.Columns)
+                    count += 1
+        return count
+
+
+def _toSql(v: Any) -> Any:
+    """Convert file info value to SQLite value."""
+    if isinstance(v, bool):
+        return int(v)
+    return v
+
+
+def _fromSql(column: str, v: Any) -> Any:
+    """Convert SQLite value to CSV value, keeps the same format as previous CSV."""
+    if column in ('trashed', 'ownedByMe'):
+        return bool(v)
+    return v
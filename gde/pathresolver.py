@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from typing import Dict, List
+import os
+import sys
+from .file import FileInfo
+
+
+_Trashed = 1
+_Shared = 2
+
+
+class PathResolver:
+    """Resolves path in drive of files by their parent folders.
+
+    Folders are resolved iteratively from the top, each folder is resolved once and its path is
+    interned and memoized, so deep trees do not hit recursion limit and a file takes O(1) once
+    its parent is resolved. Files whose parents are inaccessible or form a cycle are put under
+    drive root.
+
+    Shared files (not owned) are put under `<drive>-Shared`, trashed files under `<drive>-Trash`
+    and both under `<drive>-Trash-Shared`. The root is chosen by flags of the file itself, not
+    its folders, e.g. a file owned by user in a shared folder is put under `<drive>`. A file with
+    several parents is put under the first accessible one.
+    """
+
+    def __init__(self, driveName: str, folderTable: Dict[str, FileInfo] | None = None) -> None:
+        """Create resolver.
+         :param driveName: drive name used as root folder name.
+         :param folderTable: all folders of the drive. Empty for streaming, folders are known
+            once they are resolved.
+        """
+        self.__folders = folderTable if folderTable is not None else {}
+        self.__roots = [
+            driveName, f'{driveName}-Trash', f'{driveName}-Shared', f'{driveName}-Trash-Shared']
+        # Map from folder id to path relative to root
+        self.__resolved: Dict[str, str] = {}
+
+    def __contains__(self, folderId: str) -> bool:
+        """Check if given folder has been resolved."""
+        return folderId in self.__resolved
+
+    def resolve(self, file: FileInfo) -> str:
+        """Resolve path of given file and set it to `file.path`."""
+        rel = self.__locate(file)
+        root = self.__root(file)
+        file.path = os.path.join(root, rel) if rel else root
+        return file.path
+
+    def addResolved(self, folder: FileInfo):
+        """Add folder whose `path` has been resolved, e.g. loaded from manifest, so files in it
+        are resolved without its ancestors.
+        """
+        root = self.__root(folder)
+        self.__resolved[folder.id] = sys.intern(folder.path[len(root) + 1:])
+
+    def folderPaths(self, folder: FileInfo) -> List[str]:
+        """Get paths of given resolved folder under each root, files in the folder are put under
+        one of them by their own flags.
+        """
+        rel = folder.path[len(self.__root(folder)) + 1:]
+        return [os.path.join(root, rel) if rel else root for root in self.__roots]
+
+    def __root(self, file: FileInfo) -> str:
+        """Get root folder name of given file by its own flags."""
+        return self.__roots[(_Trashed if file.trashed else 0) | (0 if file.owned else _Shared)]
+
+    def __parent(self, file: FileInfo) -> str | None:
+        """Get Id of first accessible parent of given file, None if no parent is accessible."""
+        for parent in file.parents:
+            if (parent in self.__resolved) or (parent in self.__folders):
+                return parent
+        return None
+
+    def __locate(self, file: FileInfo) -> str:
+        """Get path relative to root of given file, memoize folders on the way."""
+        if file.isFolder() and (file.id in self.__resolved):
+            return self.__resolved[file.id]
+        # Walk up until a resolved folder, drive root, inaccessible parent or cycle
+        chain = [file]
+        visiting = {file.id}
+        rel = ''
+        while chain[-1].name:
+            parent = self.__parent(chain[-1])
+            if parent is None:
+                break
+            if parent in self.__resolved:
+                rel = self.__resolved[parent]
+                break
+            if parent in visiting:
+                # Cycle, the topmost folder is put under drive root
+                break
+            visiting.add(parent)
+            chain.append(self.__folders[parent])
+        for f in reversed(chain):
+            if f.name:
+                rel = os.path.join(rel, f.name) if rel else f.name
+            if f.isFolder():
+                rel = sys.intern(rel)
+                self.__resolved[f.id] = rel
+        return rel
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Condition, Lock
+from typing import Generator
+import random
+import time
+from .config import Config
+
+
+class RateLimiter:
+    """Global limiter shared by all requests sending to Google APIs.
+
+    This limiter combines:
+      - Token bucket: limits request rate to `rate` requests/second with max `burst` requests.
+      - AIMD concurrency control: max active transfers is increased by 1 after every `limit`
+        successful requests (additive increase), and halved when Google responses rate limit
+        error (multiplicative decrease). Slow responses hold the increase.
+      - Global backoff: when any request is throttled, all requests wait for exponential backoff
+        time with full jitter, or `Retry-After` if server gives a longer one.
+    """
+
+    def __init__(
+        self, rate: float = 20.0, burst: int = 20, maxConcurrency: int = 8,
+        minConcurrency: int = 1, backoffBase: float = 1.0, backoffMax: float = 120.0,
+        latencyThreshold: float = 3.0,
+    ) -> None:
+        """Create limiter.
+         :param rate: requests per second. Set to 0 to disable token bucket.
+         :param burst: max tokens can be accumulated.
+         :param maxConcurrency: upper bound of active transfers.
+         :param minConcurrency: lower bound of active transfers.
+         :param backoffBase: base seconds of exponential backoff.
+         :param backoffMax: max seconds of exponential backoff.
+         :param latencyThreshold: ratio to min observed latency that holds additive increase.
+        """
+        self.__rate = rate
+        self.__burst = max(burst, 1)
+        self.__tokens = float(self.__burst)
+        self.__lastRefill = time.monotonic()
+        self.__tokenLock = Lock()
+        self.__maxConcurrency = max(maxConcurrency, 1)
+        self.__minConcurrency = min(max(minConcurrency, 1), self.__maxConcurrency)
+        self.__limit = self.__maxConcurrency
+        self.__active = 0
+        self.__successCount = 0
+        self.__slotCond = Condition()
+        self.__backoffBase = backoffBase
+        self.__backoffMax = backoffMax
+        self.__latencyThreshold = latencyThreshold
+        self.__minLatency = float('inf')
+        self.__throttleCount = 0
+        self.__consecutiveThrottle = 0
+        self.__pauseUntil = 0.0
+
+    @staticmethod
+    def fromConfig(cfg: Config, maxConcurrency: int) -> 'RateLimiter':
+        """Create limiter by settings in config."""
+        return RateLimiter(
+            rate=cfg.rateLimitPerSecond, burst=cfg.rateLimitBurst,
+            maxConcurrency=maxConcurrency, minConcurrency=cfg.minConcurrency,
+            backoffBase=cfg.backoffBase, backoffMax=cfg.backoffMax,
+            latencyThreshold=cfg.latencyThreshold)
+
+    @property
+    def limit(self) -> int:
+        """Get current max active transfers."""
+        return self.__limit
+
+    @property
+    def throttleCount(self) -> int:
+        """Get # of throttled responses."""
+        return self.__throttleCount
+
+    @property
+    def paused(self) -> bool:
+        """Get if all requests are waiting for backoff."""
+        return time.monotonic() < self.__pauseUntil
+
+    def acquire(self):
+        """Wait for global backoff and a token before sending a request."""
+        while (wait := self.tryAcquire()) > 0:
+            time.sleep(wait)
+
+    def tryAcquire(self) -> float:
+        """Take a token without waiting, for callers can not block such as event loop.
+         :returns: 0 if token is taken, otherwise seconds to wait before trying again.
+        """
+        wait = self.__pauseUntil - time.monotonic()
+        if wait > 0:
+            return wait
+        if self.__rate <= 0:
+            return 0
+        with self.__tokenLock:
+            now = time.monotonic()
+            self.__tokens = min(
+                self.__burst, self.__tokens + (now - self.__lastRefill) * self.__rate)
+            self.__lastRefill = now
+            if self.__tokens >= 1:
+                self.__tokens -= 1
+                return 0
+            return (1 - self.__tokens) / self.__rate
+
+    @contextmanager
+    def slot(self) -> Generator[None, None, None]:
+        """Hold one of active transfer slots during the context."""
+        with self.__slotCond:
+            while self.__active >= self.__limit:
+                self.__slotCond.wait()
+            self.__active += 1
+        try:
+            yield
+        finally:
+            with self.__slotCond:
+                self.__active -= 1
+                self.__slotCond.notify()
+
+    def onSuccess(self, latency: float):
+        """Report a successful request.
+         :param latency: seconds from sending request to receiving response header.
+        """
+        with self.__slotCond:
+            self.__consecutiveThrottle = 0
+            self.__minLatency = min(self.__minLatency, latency)
+            if latency > self.__minLatency * self.__latencyThreshold:
+                # Server is slowing down, hold current limit
+                return
+            self.__successCount += 1
+            if (self.__successCount >= self.__limit) and (self.__limit < self.__maxConcurrency):
+                self.__successCount = 0
+                self.__limit += 1
+                self.__slotCond.notify()
+
+    def onThrottle(self, retryAfter: float = 0) -> float:
+        """Report a rate limited response, then all requests will backoff.
+         :param retryAfter: seconds from `Retry-After` header, 0 if not given.
+         :returns: backoff seconds.
+        """
+        with self.__slotCond:
+            self.__throttleCount += 1
+            self.__successCount = 0
+            if not self.paused:
+                # Concurrent throttled responses in the same backoff window decrease once
+                self.__limit = max(self.__minConcurrency, self.__limit // 2)
+            delay = max(retryAfter, self.backoff(self.__consecutiveThrottle))
+            self.__consecutiveThrottle += 1
+            self.__pauseUntil = max(self.__pauseUntil, time.monotonic() + delay)
+        return delay
+
+    def backoff(self, attempt: int) -> float:
+        """Get exponential backoff seconds with full jitter of given retry attempt."""
+        return random.uniform(0, min(self.__backoffMax, self.__backoffBase * (2 ** attempt)))
+
+
+def parseRetryAfter(value: str | None) -> float:
+    """Parse seconds from `Retry-After` header of delay seconds or HTTP date, 0 if invalid."""
+    if not value:
+        return 0
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0
+    if date.tzinfo is None:
+        # HTTP date is always GMT
+        date = date.replace(tzinfo=timezone.utc)
+    return max((date - datetime.now(timezone.utc)).total_seconds(), 0)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from fnmatch import fnmatch
+from typing import Dict, List, Tuple
+import heapq
+from .config import Config
+from .file import FileInfo
+
+
+class Scheduler:
+    """Priority queue decides which pending file is downloaded next.
+
+    Files are ordered by user priority first (higher first), then by policy:
+      - fifo: listing order.
+      - largest: largest file first, minimizes makespan since huge files start early.
+      - smallest: smallest file first, maximizes # of completed files in short time.
+      - fair: round robin between drives.
+
+    User priorities are rules matched by path (glob pattern) or MIME type, e.g.
+    `{"path": "MyDrive/Important/*", "priority": 10}` or `{"mime": "application/pdf",
+    "priority": 5}`. The first matched rule is applied, unmatched files have priority 0.
+    """
+
+    Policies = ['fifo', 'largest', 'smallest', 'fair']
+    """Supported scheduling policies."""
+
+    def __init__(self, policy: str = 'fifo', priorities: List[Dict] | None = None) -> None:
+        """Create scheduler.
+         :param policy: scheduling policy, one of `Scheduler.Policies`.
+         :param priorities: user priority rules.
+        """
+        if policy not in Scheduler.Policies:
+            raise ValueError(f'Unknown scheduling policy: {policy}')
+        self.__policy = policy
+        self.__priorities = priorities if priorities else []
+        self.__heap: List[Tuple] = []
+        self.__seq = 0
+        self.__driveCount: Dict[str, int] = {}
+
+    @staticmethod
+    def fromConfig(cfg: Config, policy: str) -> 'Scheduler':
+        """Create scheduler by settings in config."""
+        return Scheduler(policy, cfg.schedulePriority)
+
+    @property
+    def policy(self) -> str:
+        """Get scheduling policy."""
+        return self.__policy
+
+    def __len__(self) -> int:
+        return len(self.__heap)
+
+    def priority(self, file: FileInfo) -> int:
+        """Get user priority of given file."""
+        for rule in self.__priorities:
+            if ('path' in rule) and fnmatch(file.path, rule['path']):
+                return rule.get('priority', 0)
+            if ('mime' in rule) and (file.mime == rule['mime']):
+                return rule.get('priority', 0)
+        return 0
+
+    def push(self, file: FileInfo, i: int, exportMime: str = ''):
+        """Add file to download.
+         :param i: index of file passed to `Downloader.download`.
+         :param exportMime: MIME type to export file as, empty for binary file.
+        """
+        if self.__policy == 'largest':
+            key = -file.size
+        elif self.__policy == 'smallest':
+            key = file.size
+        elif self.__policy == 'fair':
+            key = self.__driveCount.get(file.driveId, 0)
+            self.__driveCount[file.driveId] = key + 1
+        else:
+            key = 0
+        heapq.heappush(
+            self.__heap, (-self.priority(file), key, self.__seq, file, i, exportMime))
+        self.__seq += 1
+
+    def pop(self) -> Tuple[FileInfo, int, str] | None:
+        """Take next file to download and its export MIME type, None if no file is pending."""
+        if not self.__heap:
+            return None
+        *_, file, i, exportMime = heapq.heappop(self.__heap)
+        return file, i, exportMime
+
+    def estimateMakespan(
+        self, files: List[FileInfo], jobs: int, overhead: float, secondsPerByte: float
+    ) -> float:
+        """Estimate seconds to download given files by this policy.
+        Files are assigned to the earliest idle job in scheduled order, and each file takes
+        `overhead + size * secondsPerByte` seconds.
+        """
+        scheduler = Scheduler(self.__policy, self.__priorities)
+        for i, file in enumerate(files):
+            scheduler.push(file, i)
+        idle = [0.0] * max(jobs, 1)
+        while (item := scheduler.pop()) is not None:
+            start = heapq.heappop(idle)
+            heapq.heappush(idle, start + overhead + item[0].size * secondsPerByte)
+        return max(idle)
+
+
+def fitDuration(samples: List[Tuple[int, float]]) -> Tuple[float, float]:
+    """Fit download duration by `overhead + size * secondsPerByte` with least squares.
+     :param samples: list of (file size, seconds to download).
+     :returns: tuple of (overhead seconds, seconds per byte).
+    """
+    if not samples:
+        return 0.0, 0.0
+    n = len(samples)
+    meanSize = sum(size for size, _ in samples) / n
+    meanTime = sum(t for _, t in samples) / n
+    var = sum((size - meanSize) ** 2 for size, _ in samples)
+    if var == 0:
+        return meanTime, 0.0
+    secondsPerByte = sum((size - meanSize) * (t - meanTime) for size, t in samples) / var
+    secondsPerByte = max(secondsPerByte, 0.0)
+    return max(meanTime - secondsPerByte * meanSize, 0.0), secondsPerByte
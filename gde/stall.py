@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+from threading import Lock
+from typing import Deque, Tuple
+import math
+import time
+from .config import Config
+
+
+class StallError(IOError):
+    """Transfer is aborted since its throughput is under the floor."""
+
+
+class StallMonitor:
+    """Throughput floor of a single transfer over a sliding window.
+
+    `update` is called with size of each received chunk, and raises `StallError` once average
+    speed of the last `window` seconds is lower than `minSpeed`. A transfer receiving nothing at
+    all is not detected here, it is aborted by read timeout of the request.
+    """
+
+    def __init__(self, minSpeed: float, window: float) -> None:
+        """Create monitor.
+         :param minSpeed: min bytes per second, 0 to disable.
+         :param window: seconds of sliding window.
+        """
+        self.__minSpeed = minSpeed
+        self.__window = window
+        self.__startTime = time.monotonic()
+        self.__total = 0
+        # (time, total received bytes) of recent chunks
+        self.__samples: Deque[Tuple[float, int]] = deque([(self.__startTime, 0)])
+
+    @staticmethod
+    def fromConfig(cfg: Config) -> 'StallMonitor':
+        """Create monitor by settings in config."""
+        return StallMonitor(cfg.stallMinSpeed, cfg.stallWindow)
+
+    def update(self, size: int):
+        """Add received bytes and check throughput. Raise `StallError` if stalled."""
+        if self.__minSpeed <= 0:
+            return
+        now = time.monotonic()
+        self.__total += size
+        self.__samples.append((now, self.__total))
+        # Keep one sample older than window as its start
+        while (len(self.__samples) > 2) and (now - self.__samples[1][0] >= self.__window):
+            self.__samples.popleft()
+        startTime, startTotal = self.__samples[0]
+        if now - self.__startTime < self.__window:
+            return
+        speed = (self.__total - startTotal) / max(now - startTime, 1e-6)
+        if speed < self.__minSpeed:
+            raise StallError(
+                f'Transfer stalled: {speed:.0f} B/s in last {now - startTime:.1f}s, ' + \
+                f'floor is {self.__minSpeed:.0f} B/s')
+
+
+class LatencyTracker:
+    """Recent time to first byte of requests, decides when a request should be hedged.
+
+    This class is thread-safe.
+    """
+
+    def __init__(
+        self, percentile: float = 95, minSamples: int = 20, minDelay: float = 1.0,
+        maxSamples: int = 200,
+    ) -> None:
+        """Create tracker.
+         :param percentile: percentile of recent latencies used as hedging delay.
+         :param minSamples: min # of samples before hedging is enabled.
+         :param minDelay: min seconds of hedging delay.
+         :param maxSamples: # of recent latencies kept.
+        """
+        self.__percentile = percentile
+        self.__minSamples = minSamples
+        self.__minDelay = minDelay
+        self.__lock = Lock()
+        self.__samples: Deque[float] = deque(maxlen=maxSamples)
+
+    @staticmethod
+    def fromConfig(cfg: Config) -> 'LatencyTracker':
+        """Create tracker by settings in config."""
+        return LatencyTracker(cfg.hedgePercentile, cfg.hedgeMinSamples, cfg.hedgeMinDelay)
+
+    def add(self, seconds: float):
+        """Add time to first byte of a successful request."""
+        with self.__lock:
+            self.__samples.append(seconds)
+
+    def delay(self) -> float | None:
+        """Get seconds to wait before sending hedged request, None if samples are not enough."""
+        with self.__lock:
+            if len(self.__samples) < max(self.__minSamples, 1):
+                return None
+            samples = sorted(self.__samples)
+        k = min(math.ceil(len(samples) * self.__percentile / 100) - 1, len(samples) - 1)
+        return max(samples[max(k, 0)], self.__minDelay)
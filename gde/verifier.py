@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, List
+import os
+import stat as st
+from tqdm.auto import tqdm
+from .config import Config
+from .file import md5
+from .hashcache import HashCache
+from .localindex import LocalIndex
+
+
+class Verifier:
+    """Parallel MD5 engine for verifying local files.
+
+    Hashing runs on a thread pool by default, `hashlib` releases GIL on large buffers so threads
+    scale to disk bandwidth. A process pool can be used instead when per-file overhead in Python
+    becomes the bottleneck.
+
+    Files can be hashed in batch by `prefetch`, which sorts files by device and inode so spinning
+    disks are read sequentially. Prefetched hashes are kept until taken by `md5` or dropped by
+    `clear` once the batch is checked.
+    """
+
+    def __init__(
+        self, jobs: int = 0, useProcess: bool = False, chunkSize: int = 1024 * 1024 * 4,
+    ) -> None:
+        """Create verifier.
+         :param jobs: # of hashing workers, 0 for # of CPUs.
+         :param useProcess: hash files by process pool instead of thread pool.
+         :param chunkSize: read buffer size of each worker.
+        """
+        jobs = jobs if jobs > 0 else (os.cpu_count() or 1)
+        self.__jobs = jobs
+        self.__chunkSize = chunkSize
+        self.__executor: Executor = ProcessPoolExecutor(max_workers=jobs) if useProcess else \
+            ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='VF')
+        self.__lock = Lock()
+        self.__hashes: Dict[str, str] = {}
+
+    @staticmethod
+    def fromConfig(cfg: Config) -> 'Verifier':
+        """Create verifier by settings in config."""
+        return Verifier(cfg.verifyJobs, cfg.verifyProcessPool, cfg.md5ChunkSize)
+
+    @property
+    def jobs(self) -> int:
+        """Get # of hashing workers."""
+        return self.__jobs
+
+    def close(self):
+        """Shutdown workers."""
+        self.__executor.shutdown(wait=True)
+
+    def clear(self):
+        """Drop prefetched hashes not taken by `md5`."""
+        with self.__lock:
+            self.__hashes.clear()
+
+    def md5(self, path: str) -> str:
+        """Get MD5 of given file, take prefetched one if exists."""
+        with self.__lock:
+            m = self.__hashes.pop(path, None)
+        if m is not None:
+            return m
+        return self.__executor.submit(md5, path, self.__chunkSize).result()
+
+    def prefetch(
+        self, paths: List[str], hashCache: HashCache | None = None,
+        index: LocalIndex | None = None,
+    ):
+        """Hash given files in parallel, in order of device and inode.
+        Missing files, non-regular files and files cached in `hashCache` are skipped.
+
+         :param index: get stat of files from index instead of stat again.
+        """
+        jobs = []
+        for path in paths:
+            if index:
+                stat = index.stat(path)
+                if stat is None:
+                    continue
+            else:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if not st.S_ISREG(stat.st_mode):
+                    continue
+            if hashCache and hashCache.get(path, stat):
+                continue
+            jobs.append((stat.st_dev, stat.st_ino, path))
+        if not jobs:
+            return
+        jobs.sort()
+        paths = [path for _, _, path in jobs]
+        progress = tqdm(total=len(paths), desc='Hashing', ascii=True, dynamic_ncols=True)
+        # Workers take jobs in submitted order, so reads are near sequential on disk
+        results = self.__executor.map(
+            md5, paths, [self.__chunkSize] * len(paths),
+            chunksize=1 if isinstance(self.__executor, ThreadPoolExecutor) else 16)
+        for path, m in zip(paths, results):
+            with self.__lock:
+                self.__hashes[path] = m
+            progress.update(1)
+        progress.close()
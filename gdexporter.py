@@ -1,7 +1,9 @@
 # -*- coding: utf-8 -*-
 import argparse
+import importlib.util
 import os
-from gde.gde import process
+import sys
+from gde.gde import exportCsv, process
 
 
 def createParser() -> argparse.ArgumentParser:
@@ -18,7 +20,7 @@ def createParser() -> argparse.ArgumentParser:
           - Export files in trash.
           - Check downloaded file with MD5 hash.
           - Set file modified time and access time align to files on Google Drive.
-          - Output file information summary into CSV.
+          - Store file information and download status in manifest, export to CSV on demand.
           - Concurrent download files.
 
         Requirement: user is required to create personal `client_secrets.json` on GCP to enable
@@ -32,28 +34,77 @@ def createParser() -> argparse.ArgumentParser:
         help='Google drive user account email.')
 
     grp = parser.add_argument_group('Google Drive API (gde) options')
+    grp.add_argument(
+        '--asyncio', action='store_true', required=False, default=False,
+        help='Download by asyncio engine, suits many small files with large --job. ' + \
+            'Requires httpx.')
     grp.add_argument(
         '--downloadOnly', action='store_true', required=False,
-        help='Skip fetch file list, only do download based on previous stored file list CSV.')
+        help='Skip fetch file list, only do download based on previous stored manifest.')
+    grp.add_argument(
+        '--exportCsv', action='store_true', required=False,
+        help='Export file info of all drives stored in manifest to CSV, then exit.')
+    grp.add_argument(
+        '--excludeMimeType', nargs='+', required=False, default=[],
+        help='Skip files of given MIME types.')
     grp.add_argument(
         '--fileInfoCsv', '-f', type=str, required=False,
         help='Customized file info CSV path. Define this field also enable --downloadOnly and ' + \
             'disable --includeOwned, --includeShared')
+    grp.add_argument(
+        '--folder', nargs='+', required=False, default=[],
+        help='Only export files under given folder paths, e.g. `MyDrive/Photos`. Glob pattern ' + \
+            'is supported.')
+    grp.add_argument(
+        '--http2', action='store_true', required=False, default=False,
+        help='Multiplex downloads over a few HTTP/2 connections, also enables --asyncio. ' + \
+            'Requires httpx[http2].')
     grp.add_argument(
         '--ignoreDrive', nargs='+', required=False, default=[],
         help='Drive to be ignored. Set `MyDrive` to ignore main drive.')
     grp.add_argument(
         '--includeTrashed', action='store_true', required=False, default=False,
         help='Include trashed files. Default is false.')
+    grp.add_argument(
+        '--incremental', action='store_true', required=False, default=False,
+        help='Only fetch changes since previous run by Drive Changes API. Fallback to fetch ' + \
+            'all files if previous run does not exist.')
     grp.add_argument(
         '--job', '-j', type=int, required=False, default=8,
         help='Max concurrent download job. Default is 8.')
+    grp.add_argument(
+        '--partitionedList', action='store_true', required=False, default=False,
+        help='List files by crawling folders concurrently. Useful for single huge drive.')
+    grp.add_argument(
+        '--stream', action='store_true', required=False, default=False,
+        help='Start downloading while files are still listing. Drives synced by ' + \
+            '--incremental are listed before download.')
     grp.add_argument(
         '--maxRetry', type=int, required=False, default=3,
         help='Max download retry. Default is 3.')
+    grp.add_argument(
+        '--maxSize', type=int, required=False, default=0,
+        help='Only export files not larger than given bytes.')
+    grp.add_argument(
+        '--mimeType', nargs='+', required=False, default=[],
+        help='Only export files of given MIME types.')
+    grp.add_argument(
+        '--minSize', type=int, required=False, default=0,
+        help='Only export files not smaller than given bytes.')
+    grp.add_argument(
+        '--modifiedAfter', type=str, required=False, default='',
+        help='Only export files modified after given time, e.g. `2023-01-01T00:00:00Z`.')
+    grp.add_argument(
+        '--modifiedBefore', type=str, required=False, default='',
+        help='Only export files modified before given time.')
     grp.add_argument(
         '--noMd5', action='store_true', required=False,
         help='Skip MD5 checking.')
+    grp.add_argument(
+        '--schedule', choices=['fifo', 'largest', 'smallest', 'fair'], required=False,
+        default='fifo',
+        help='Download order: listing order, largest first, smallest first, or round robin ' + \
+            'between drives. Default is fifo.')
     grp.add_argument(
         '--sharedType', choices=['both', 'shared', 'owned'], required=False, default='owned',
         help='Export include files sharing type: shared with me, owned by me, or both.')
@@ -64,6 +115,13 @@ def createParser() -> argparse.ArgumentParser:
 if __name__ == '__main__':
     parser = createParser()
     args = parser.parse_args()
+    if args.exportCsv:
+        exportCsv(args.user, args.output)
+        sys.exit(0)
+    if (args.asyncio or args.http2) and (importlib.util.find_spec('httpx') is None):
+        parser.error('--asyncio and --http2 require httpx, `pip install -r requirements.txt`.')
+    if args.http2 and (importlib.util.find_spec('h2') is None):
+        print('--http2 requires h2, `pip install -r requirements.txt`. Fallback to HTTP/1.1.')
     if args.fileInfoCsv:
         args.downloadOnly = True
         args.fileInfoCsv = os.path.join(args.output, args.user, args.fileInfoCsv)
@@ -78,4 +136,19 @@ if __name__ == '__main__':
         includeTrashed=args.includeTrashed,
         sharedType=args.sharedType,
         ignoredDrives=args.ignoreDrive,
-        maxRetry=args.maxRetry)
+        maxRetry=args.maxRetry,
+        incremental=args.incremental,
+        partitioned=args.partitionedList,
+        stream=args.stream,
+        schedule=args.schedule,
+        useAsync=args.asyncio,
+        http2=args.http2,
+        filterSpec={
+            'folders': args.folder,
+            'mimeTypes': args.mimeType,
+            'excludeMimeTypes': args.excludeMimeType,
+            'minSize': args.minSize,
+            'maxSize': args.maxSize,
+            'modifiedAfter': args.modifiedAfter,
+            'modifiedBefore': args.modifiedBefore,
+        })